@@ -1,8 +1,46 @@
+import os
+
 import streamlit as st
-import requests
 import pandas as pd
 import plotly.express as px
 
+from dpni.armazenamento import (
+    DIRETORIO_ARMAZENAMENTO,
+    assinatura_armazenamento,
+    carregar_cubo,
+    garantir_armazenamento,
+    ler_armazenamento,
+)
+from dpni.cache import CacheFiguras, CacheResultados, diretorio_cache_configurado
+from dpni.carga import ARQUIVO_ESTADOS, ARQUIVO_MUNICIPIOS, assinatura_arquivos, carregar_geografia
+from dpni.cubo import totais_por_cobertura
+from dpni.esquema import somente_leitura
+from dpni.exportacao import FORMATOS_EXPORTACAO, exportar
+from dpni.geografia import ORDEM_REGIOES, regiao_do_codigo
+from dpni.geometria import (
+    ARQUIVO_GEOMETRIA_ESTADOS,
+    CHAVE_ESTADOS,
+    CHAVE_MUNICIPIOS,
+    ORIGEM_GEOMETRIA_ESTADOS,
+    carregar_geometria,
+    geometria_municipios,
+    municipios_sem_geometria,
+    recortar,
+)
+from dpni.indice import IndiceFiltros
+from dpni.instrumentacao import Instrumentacao, instrumentacao_ligada
+from dpni.motor import cobertura_por_uf, evolucao_mensal, filtrar_dados, filtros_selecao, tabela_coberturas
+from dpni.publicacao import (
+    anexar_ano,
+    anexar_cubo,
+    assinatura_publicacao,
+    diretorio_publicacao_configurado,
+    ler_publicacao,
+)
+from dpni.resumo import linha_resumo, resumo_coberturas
+from dpni.tabela import TabelaPaginada
+from dpni.vacinas import classificar_coberturas, meta_cobertura
+
 # Função para formatar números no padrão brasileiro
 def formatar_numero_br(valor):
     """Formata número com separador de milhares no padrão brasileiro"""
@@ -15,6 +53,18 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Instrumentação das etapas (opcional: DPNI_INSTRUMENTACAO=1 ou ?debug=1 na URL).
+# Desligada, cada etapa custa só uma chamada que devolve um contexto nulo.
+instrumentacao = Instrumentacao(ativo=instrumentacao_ligada() or st.query_params.get('debug') == '1')
+
+# Instrumentação de uma execução de fragmento: dentro do rerun completo é a do rerun;
+# um fragmento rerodado sozinho (o script já terminou) mede numa instrumentação
+# própria, com outro id de execução, em vez de somar etapas ao rerun encerrado
+def instrumentacao_fragmento():
+    if not instrumentacao.encerrada:
+        return instrumentacao
+    return Instrumentacao(ativo=instrumentacao.ativo)
+
 
 st.title("Coberturas vacinais 💉")
 
@@ -29,114 +79,162 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# Carregar dados do arquivo ZIP
-data = pd.read_csv("dados/residencia.zip", sep=';', compression='zip')
+# Os dados agregados e enriquecidos ficam em um armazenamento colunar particionado
+# por NU_ANO e CO_UF. Quando o extrato de residência muda (mtime, tamanho e hash),
+# o armazenamento é reconstruído uma única vez por processo; depois disso cada
+# seleção lê apenas as partições e colunas necessárias.
+# Com DPNI_PUBLICACAO, vários processos do Dashboard anexam os arquivos Arrow
+# publicados por python -m dpni.publicacao (mapeados em memória, sem cópia nem
+# ingestão); uma nova publicação é percebida pela troca do ponteiro da versão.
+DIRETORIO_PUBLICADO = diretorio_publicacao_configurado()
 
-# Carregar tabela de estados
-estados_df = pd.read_csv("dados/estados_brasil.csv", dtype=str)
+@st.cache_resource(max_entries=1, show_spinner="Preparando armazenamento colunar...")
+def obter_manifesto(assinatura):
+    if DIRETORIO_PUBLICADO:
+        manifesto = ler_publicacao(DIRETORIO_PUBLICADO)
+        if manifesto is None:
+            raise ValueError(f"nada publicado em {DIRETORIO_PUBLICADO} (rode python -m dpni.publicacao)")
+        return manifesto
+    return garantir_armazenamento(DIRETORIO_ARMAZENAMENTO)
 
-# Carregar tabela de municípios
-municipios_df = pd.read_csv("dados/municipio.csv", sep=';', dtype=str)
+# Hierarquia região → UF → município, construída uma vez a partir dos CSVs de referência
+@st.cache_resource(max_entries=1)
+def obter_geografia(assinatura):
+    return carregar_geografia(ARQUIVO_MUNICIPIOS, ARQUIVO_ESTADOS)
 
-# Agrupar dados
-colunas_agrupamento = ['TP_COBERTURA', 'DS_COBERTURA', 'CO_IBGE', 'NU_ANO', 'NU_MES', 'NU_IDADE']
-# Verificar se todas as colunas existem
-colunas_existentes = [col for col in colunas_agrupamento if col in data.columns]
+# Dados do ano (apenas as partições do ano são lidas) e o índice de posições usado
+# para resolver os filtros de região, UF, município e cobertura. Um único objeto,
+# somente leitura, é compartilhado por todas as sessões; cada sessão guarda apenas
+# as posições da sua seleção e os resultados pequenos que exibe.
+@st.cache_resource(max_entries=8, show_spinner="Carregando dados...")
+def obter_dados_ano(versao, ano):
+    if DIRETORIO_PUBLICADO:
+        return anexar_ano(DIRETORIO_PUBLICADO, versao, ano)
+    data = somente_leitura(ler_armazenamento(DIRETORIO_ARMAZENAMENTO, anos=[ano]))
+    return data, IndiceFiltros(data)
 
-if len(colunas_existentes) == len(colunas_agrupamento):
-    # Encontrar uma coluna para contar que não esteja no agrupamento
-    coluna_contagem = [col for col in data.columns if col not in colunas_agrupamento][0]
-    
-    # Contar registros por grupo e somar colunas numéricas
-    agg_dict = {coluna_contagem: 'count'}
-    agg_dict.update({col: 'sum' for col in data.select_dtypes(include=['number']).columns if col not in colunas_agrupamento})
-    
-    data_agrupado = data.groupby(colunas_agrupamento).agg(agg_dict).reset_index()
-    data_agrupado.rename(columns={coluna_contagem: 'qt_registros'}, inplace=True)
-    
-    # Criar campos de região e UF a partir do código IBGE
-    if 'CO_IBGE' in data_agrupado.columns:
-        data_agrupado['CO_IBGE'] = data_agrupado['CO_IBGE'].astype(str)
-        data_agrupado['CO_REGIAO'] = data_agrupado['CO_IBGE'].str[0]
-        data_agrupado['CO_UF'] = data_agrupado['CO_IBGE'].str[:2].str.zfill(2)
+# Tabela paginada da seleção, com as permutações de ordenação e as buscas em cache;
+# como os dados do ano, é compartilhada entre as sessões
+@st.cache_resource(max_entries=16)
+def obter_tabela(versao, ano, regiao, uf, municipio, descricao):
+    data, indice = obter_dados_ano(versao, ano)
+    return TabelaPaginada(somente_leitura(filtrar_dados(data, indice, regiao, uf, municipio, descricao)))
 
-        # Adicionar nome do município a partir do CSV de municípios
-        if {'co_municipio_ibge', 'no_municipio'}.issubset(municipios_df.columns):
-            municipios_df['co_municipio_ibge'] = municipios_df['co_municipio_ibge'].astype(str).str.zfill(6)
-            data_agrupado['CO_IBGE'] = data_agrupado['CO_IBGE'].str.zfill(6)
-            data_agrupado = data_agrupado.merge(
-                municipios_df[['co_municipio_ibge', 'no_municipio']],
-                left_on='CO_IBGE',
-                right_on='co_municipio_ibge',
-                how='left'
-            ).drop(columns=['co_municipio_ibge'])
+# Cubo pré-agregado (geografia × ano × mês × cobertura) usado por cards, mapa e gráficos
+@st.cache_resource(max_entries=1, show_spinner="Carregando cubo de coberturas...")
+def obter_cubo(versao):
+    if DIRETORIO_PUBLICADO:
+        return anexar_cubo(DIRETORIO_PUBLICADO, versao)
+    return {nivel: somente_leitura(tabela) for nivel, tabela in carregar_cubo(DIRETORIO_ARMAZENAMENTO).items()}
 
-        # Adicionar nome e sigla da UF a partir do CSV de estados
-        if {'co_uf', 'no_uf', 'sg_uf'}.issubset(estados_df.columns):
-            estados_df['co_uf'] = estados_df['co_uf'].astype(str).str.zfill(2)
-            data_agrupado = data_agrupado.merge(
-                estados_df[['co_uf', 'no_uf', 'sg_uf']],
-                left_on='CO_UF',
-                right_on='co_uf',
-                how='left'
-            ).drop(columns=['co_uf'])
-        
-        # Mapear código de região para nome da região
-        mapa_regiao = {
-            '1': 'Norte',
-            '2': 'Nordeste',
-            '3': 'Sudeste',
-            '4': 'Sul',
-            '5': 'Centro-Oeste'
-        }
-        data_agrupado['REGIAO'] = data_agrupado['CO_REGIAO'].map(mapa_regiao)
-else:
-    data_agrupado = data
-    st.warning(f"Colunas de agrupamento não encontradas. Colunas disponíveis: {data.columns.tolist()}")
+# Publicações seguidas podem apagar a versão lida do ponteiro antes que este processo
+# a anexe: nesse caso relê _atual.json e refaz o rerun já na versão nova, para que os
+# resultados em cache nunca misturem versões
+def anexar_versao(obter, versao, *args):
+    try:
+        return obter(versao, *args)
+    except FileNotFoundError:
+        atual = ler_publicacao(DIRETORIO_PUBLICADO) if DIRETORIO_PUBLICADO else None
+        if atual is None or atual['publicacao'] == versao:
+            raise
+        obter_manifesto.clear()
+        st.rerun()
+
+# Códigos IBGE dos municípios com linhas no cubo para o ano: o filtro de município só
+# oferece estes, como o de UF só oferece as UFs com partições no ano
+@st.cache_resource(max_entries=8)
+def obter_municipios_com_dados(versao, ano):
+    municipios = obter_cubo(versao)['municipio']
+    return frozenset(municipios.loc[municipios.index.get_level_values('NU_ANO') == ano, 'CO_IBGE'].unique().tolist())
+
+# Resultados de cada seção por combinação de filtros: LRU em memória, limitado em bytes,
+# e, só com DPNI_CACHE_RESULTADOS apontando para um diretório, um nível em disco que sobrevive a reinícios
+@st.cache_resource
+def obter_cache_resultados():
+    return CacheResultados(diretorio_cache_configurado())
+
+cache_resultados = obter_cache_resultados()
+
+# JSON das figuras Plotly pelo hash das entradas, também compartilhado entre as sessões
+@st.cache_resource
+def obter_cache_figuras():
+    return CacheFiguras()
+
+cache_figuras = obter_cache_figuras()
+
+try:
+    with instrumentacao.etapa('armazenamento'):
+        manifesto = obter_manifesto(
+            assinatura_publicacao(DIRETORIO_PUBLICADO) if DIRETORIO_PUBLICADO
+            else assinatura_armazenamento(DIRETORIO_ARMAZENAMENTO)
+        )
+except (ValueError, FileNotFoundError) as erro:
+    st.error(f"Não foi possível preparar os dados: {erro}")
+    st.stop()
+versao_dados = manifesto.get('publicacao', manifesto['construido_em'])
+with instrumentacao.etapa('geografia'):
+    geografia = obter_geografia(assinatura_arquivos(ARQUIVO_MUNICIPIOS, ARQUIVO_ESTADOS))
+with instrumentacao.etapa('cubo') as etapa:
+    cubo = anexar_versao(obter_cubo, versao_dados)
+    etapa.saida(sum(len(nivel) for nivel in cubo.values()))
 
 st.sidebar.title("Filtros")
 # Filtro de ano
-if 'NU_ANO' in data_agrupado.columns:
-    anos_disponiveis = sorted(data_agrupado['NU_ANO'].unique())
-    ano_selecionado = st.sidebar.selectbox("Selecione o Ano", anos_disponiveis, index=anos_disponiveis.index(2025) if 2025 in anos_disponiveis else 0)
-    # Guardar cópia antes de filtrar por ano (para usar no gráfico de evolução mensal)
-    data_todos_anos = data_agrupado.copy()
-    data_agrupado = data_agrupado[data_agrupado['NU_ANO'] == ano_selecionado]
-    
-# Filtro de dados geográficos
+anos_disponiveis = manifesto['anos']
+ano_selecionado = st.sidebar.selectbox("Selecione o Ano", anos_disponiveis, index=anos_disponiveis.index(2025) if 2025 in anos_disponiveis else 0)
+ufs_ano = {uf for ano, uf in manifesto['particoes'] if ano == ano_selecionado}
+
+# Filtro de dados geográficos: as opções vêm da hierarquia geográfica (restrita às
+# UFs com dados no ano, segundo o manifesto, e aos municípios presentes no cubo)
+# e só as partições da seleção são lidas
 with st.sidebar.expander("Dados Geográficos", expanded=True):
     # Filtro de região
-    if 'REGIAO' in data_agrupado.columns:
-        ordem_regioes = ['Norte', 'Nordeste', 'Sudeste', 'Sul', 'Centro-Oeste']
-        regioes_validas = [r for r in data_agrupado['REGIAO'].unique() if pd.notna(r)]
-        regioes_ordenadas = [r for r in ordem_regioes if r in regioes_validas]
-        regioes_disponiveis = ['Todas'] + regioes_ordenadas
-        regiao_selecionada = st.selectbox("Região", regioes_disponiveis)
-        if regiao_selecionada != 'Todas':
-            data_agrupado = data_agrupado[data_agrupado['REGIAO'] == regiao_selecionada]
+    regioes_validas = {regiao_do_codigo(uf) for uf in ufs_ano}
+    regioes_ordenadas = [r for r in ORDEM_REGIOES if r in regioes_validas]
+    regioes_disponiveis = ['Todas'] + regioes_ordenadas
+    regiao_selecionada = st.selectbox("Região", regioes_disponiveis)
 
     # Filtro de estado (UF)
-    if 'sg_uf' in data_agrupado.columns:
-        ufs_disponiveis = ['Todos'] + sorted([uf for uf in data_agrupado['sg_uf'].unique() if pd.notna(uf)])
-        uf_selecionado = st.selectbox("Estado (UF)", ufs_disponiveis)
-        if uf_selecionado != 'Todos':
-            data_agrupado = data_agrupado[data_agrupado['sg_uf'] == uf_selecionado]
+    ufs_disponiveis = ['Todos'] + [uf for uf in geografia.ufs(regiao_selecionada) if geografia.codigo_uf[uf] in ufs_ano]
+    uf_selecionado = st.selectbox("Estado (UF)", ufs_disponiveis)
 
     # Filtro de município
-    if 'no_municipio' in data_agrupado.columns:
-        municipios_disponiveis = ['Todos'] + sorted([m for m in data_agrupado['no_municipio'].unique() if pd.notna(m)])
-        municipio_selecionado = st.selectbox("Município", municipios_disponiveis)
-        if municipio_selecionado != 'Todos':
-            data_agrupado = data_agrupado[data_agrupado['no_municipio'] == municipio_selecionado]
+    municipios_disponiveis = ['Todos'] + geografia.municipios(
+        regiao_selecionada, uf_selecionado, obter_municipios_com_dados(versao_dados, ano_selecionado)
+    )
+    municipio_selecionado = st.selectbox("Município", municipios_disponiveis)
 
 # Filtro de descrição de cobertura
-if 'DS_COBERTURA' in data_agrupado.columns:
-    descricoes_cobertura = ['Todos'] + sorted(data_agrupado['DS_COBERTURA'].unique().tolist())
-    descricao_selecionada = st.sidebar.selectbox("Descrição da Cobertura", descricoes_cobertura)
-    if descricao_selecionada != 'Todos':
-        data_agrupado = data_agrupado[data_agrupado['DS_COBERTURA'] == descricao_selecionada]
-else:
-    descricao_selecionada = 'Todos'
+descricoes_cobertura = ['Todos'] + sorted(
+    totais_por_cobertura(cubo, ano_selecionado, regiao_selecionada, uf_selecionado, municipio_selecionado).index.tolist()
+)
+descricao_selecionada = st.sidebar.selectbox("Descrição da Cobertura", descricoes_cobertura)
+
+# Resolver a combinação de filtros pelo índice: a sessão fica só com as posições
+# das linhas selecionadas (None = todas), sem copiar as linhas dos dados compartilhados
+with instrumentacao.etapa('dados_ano') as etapa:
+    data_ano, indice_ano = anexar_versao(obter_dados_ano, versao_dados, ano_selecionado)
+    etapa.saida(len(data_ano))
+with instrumentacao.etapa('filtros', len(data_ano)) as etapa:
+    posicoes_selecao = indice_ano.selecionar(
+        filtros_selecao(regiao_selecionada, uf_selecionado, municipio_selecionado, descricao_selecionada)
+    )
+    linhas_selecao = len(data_ano) if posicoes_selecao is None else len(posicoes_selecao)
+    etapa.saida(linhas_selecao)
+
+# Doses e população por cobertura da seleção atual, consultadas no cubo
+with instrumentacao.etapa('totais_coberturas') as etapa:
+    totais_coberturas = cache_resultados.obter(
+        CacheResultados.chave('totais_coberturas', versao_dados, ano_selecionado, regiao_selecionada,
+                              uf_selecionado, municipio_selecionado, descricao_selecionada),
+        lambda: totais_por_cobertura(
+            cubo, ano_selecionado, regiao_selecionada, uf_selecionado, municipio_selecionado, descricao_selecionada
+        ),
+    )
+    etapa.saida(len(totais_coberturas))
+
+# Lista de coberturas disponíveis (opções dos seletores de vacina das abas)
+coberturas_disponiveis = sorted(totais_coberturas.index.tolist())
 
 # Definir variáveis para uso no texto de filtros
 tipo_selecionado = 'Todos'
@@ -147,1013 +245,920 @@ idade_selecionada = 'Todas'
 
 # Criar texto com filtros selecionados
 filtros_texto = []
-if 'NU_ANO' in data_agrupado.columns:
+if 'NU_ANO' in data_ano.columns:
     filtros_texto.append(f"Ano: {ano_selecionado}")
-if 'REGIAO' in data_agrupado.columns and regiao_selecionada != 'Todas':
+if 'REGIAO' in data_ano.columns and regiao_selecionada != 'Todas':
     filtros_texto.append(f"Região: {regiao_selecionada}")
-if 'sg_uf' in data_agrupado.columns and uf_selecionado != 'Todos':
+if 'sg_uf' in data_ano.columns and uf_selecionado != 'Todos':
     filtros_texto.append(f"UF: {uf_selecionado}")
-if 'no_municipio' in data_agrupado.columns and municipio_selecionado != 'Todos':
+if 'no_municipio' in data_ano.columns and municipio_selecionado != 'Todos':
     filtros_texto.append(f"Município: {municipio_selecionado}")
-if 'TP_COBERTURA' in data_agrupado.columns and tipo_selecionado != 'Todos':
+if 'TP_COBERTURA' in data_ano.columns and tipo_selecionado != 'Todos':
     filtros_texto.append(f"Tipo: {tipo_selecionado}")
-if 'DS_COBERTURA' in data_agrupado.columns and descricao_selecionada != 'Todos':
+if 'DS_COBERTURA' in data_ano.columns and descricao_selecionada != 'Todos':
     filtros_texto.append(f"Cobertura: {descricao_selecionada}")
-if 'NU_IDADE' in data_agrupado.columns and idade_selecionada != 'Todas':
+if 'NU_IDADE' in data_ano.columns and idade_selecionada != 'Todas':
     filtros_texto.append(f"Idade: {idade_selecionada}")
 
 filtros_str = " | ".join(filtros_texto) if filtros_texto else "Todos os dados"
 
-aba1, aba2, aba3, aba4 = st.tabs(["Coberturas Vacinais", "Mapa", "Tabelas", "Dashboards"])
-with aba1:
-    st.header(f"Análise de Coberturas Vacinais")
-    st.subheader(f"📊 Filtros: {filtros_str}")
-    
-    # Obter lista de coberturas disponíveis
-    coberturas_disponiveis = sorted(data_agrupado['DS_COBERTURA'].unique().tolist())
-    
-    # Criar objeto de coberturas com metas
-    coberturas_com_meta = []
-    for cobertura in coberturas_disponiveis:
-        if cobertura in   ['BCG','Rotavírus']:
-            coberturas_com_meta.append({
-                'nome': cobertura,
-                'meta': 90.0,  # Meta específica para BCG e Rotavírus
-                'cor_muito_critico': '#790E18',  # Rubi: 0-20%
-                'cor_critico': '#ff4444',  # Vermelho: 21-40%
-                'cor_baixo': '#ff9900',    # Laranja: 41-60%
-                'cor_moderado': '#ffdd00', # Amarelo: 61-80%
-                'cor_excelente': '#44dd44', # Verde: >80%
-                'cor_otima': '#000099'     # Azul: Meta ótima (90%)
-            })      
-        elif cobertura in   ['Hepatite B (< 30 dias)',  'Hepatite B',   'Hepatite A Infantil',  
-                             'DTP', 'Febre Amarela', 'Polio Injetável (VIP)', 
-                             'Pneumo 10', 'Meningo C', 'Penta (DTP/HepB/Hib)', 
-                             'COVID', 'DTP (1° Reforço)', 
-                             'Tríplice Viral - 1° Dose', 'Tríplice Viral - 2° Dose', 
-                             'Pneumo 10 (1° Reforço)', 'Polio Injetável (VIP)(Reforço)', 
-                             'Varicela', 'Meningocócica Conjugada (1° Reforço)',
-                             'dTpa Adulto - Gestantes']:
-            coberturas_com_meta.append({
-                'nome': cobertura,
-                'meta': 95.0,  # Meta padrão de 95% para todas as coberturas
-                'cor_muito_critico': '#790E18',  # Rubi: 0-20%
-                'cor_critico': '#ff4444',  # Vermelho: 21-40%
-                'cor_baixo': '#ff9900',    # Laranja: 41-60%
-                'cor_moderado': '#ffdd00', # Amarelo: 61-80%
-                'cor_excelente': '#44dd44', # Verde: >80%
-                'cor_otima': '#000099'     # Azul: Meta ótima (95%)
-            })
-        
-    # Função helper para buscar cobertura exata na lista
-    def buscar_cobertura(lista_coberturas, nome_procurado):
-        return nome_procurado if nome_procurado in lista_coberturas else None
+# Abas sob demanda: só o corpo da aba visível é executado (cada troca de aba é um rerun,
+# com os filtros da barra lateral mantidos). Com DPNI_TODAS_ABAS=1 as quatro abas são
+# calculadas a cada rerun, como antes, e a troca de aba não passa pelo servidor.
+TODAS_ABAS = os.environ.get('DPNI_TODAS_ABAS', '').strip().lower() in ('1', 'true', 'sim', 'on')
+aba1, aba2, aba3, aba4 = st.tabs(
+    ["Coberturas Vacinais", "Mapa", "Tabelas", "Dashboards"],
+    key=None if TODAS_ABAS else 'aba_ativa',
+    on_change='ignore' if TODAS_ABAS else 'rerun',
+)
+
+if aba1.open is not False:
+    with aba1, instrumentacao.etapa('aba.coberturas'):
+        st.header(f"Análise de Coberturas Vacinais")
+        st.subheader(f"📊 Filtros: {filtros_str}")
     
-    # Função para buscar meta de uma cobertura
-    def get_meta_cobertura(nome_cobertura):
-        meta_info = next((item for item in coberturas_com_meta if item['nome'] == nome_cobertura), None)
-        return meta_info['meta'] if meta_info else 95.0
+        # Doses, população, cobertura, meta e cor de todas as vacinas da seleção,
+        # calculadas em uma única passada (a partir do cubo) e usadas por todos os cards
+        with instrumentacao.etapa('coberturas.resumo', len(totais_coberturas)) as etapa:
+            resumo = cache_resultados.obter(
+                CacheResultados.chave('coberturas.resumo', versao_dados, ano_selecionado, regiao_selecionada,
+                                      uf_selecionado, municipio_selecionado, descricao_selecionada),
+                lambda: resumo_coberturas(totais_coberturas),
+            )
+            etapa.saida(len(resumo))
     
-    # Função para buscar meta e determinar cor baseada na meta específica
-    def get_cor_por_meta(nome_cobertura, percentual):
-        # Buscar a meta específica da cobertura
-        meta_info = next((item for item in coberturas_com_meta if item['nome'] == nome_cobertura), None)
-        
-        if meta_info:
-            meta = meta_info['meta']
-            if percentual <= 20:
-                return meta_info['cor_muito_critico']
-            elif percentual <= 40:
-                return meta_info['cor_critico']
-            elif percentual <= 60:
-                return meta_info['cor_baixo']
-            elif percentual <= 80:
-                return meta_info['cor_moderado']
-            elif percentual >= meta:
-                return meta_info['cor_otima']  # Azul quando atinge a meta
-            else:
-                return meta_info['cor_excelente']
-        else:
-            # Cores padrão se não encontrar a meta
-            if percentual <= 20:
-                return "#790E18"
-            elif percentual <= 40:
-                return "#ff4444"
-            elif percentual <= 60:
-                return "#ff9900"
-            elif percentual <= 80:
-                return "#ffdd00"
-            elif percentual >= 95:
-                return "#000099"
-            else:
-                return "#44dd44"
+        # Função para exibir o card de uma vacina a partir do resumo
+        def card_cobertura(nome_procurado):
+            cobertura, meta, cor = linha_resumo(resumo, nome_procurado)
+            # Vacina sem linhas na seleção: o card diz que não há dados em vez de mostrar 0%
+            valor = "sem dados" if cobertura is None else f"{f'{cobertura:.2f}'.replace('.', ',')}%"
+            hint = f"A meta ótima de cobertura dessa vacina é de {f'{meta:.1f}'.replace('.', ',')}%\n{nome_procurado}: {valor}"
+            st.markdown(f"""
+            <div title="{hint}" style='background-color: {cor}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
+                <h4 style='color: white; margin: 0; font-size: 13px;'>{nome_procurado}</h4>
+                <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{valor}</p>
+            </div>
+        """, unsafe_allow_html=True)
     
-    # Função para criar gráfico de cobertura por estado
-    def criar_grafico_cobertura_estado(df, nome_cobertura, meta):
-        # Filtrar dados para a cobertura específica
-        df_cobertura = df[df['DS_COBERTURA'] == nome_cobertura]
+        # Função para criar gráfico de cobertura por estado
+        def criar_grafico_cobertura_estado(df, nome_cobertura, meta):
+            # Filtrar dados para a cobertura específica
+            df_cobertura = df[df['DS_COBERTURA'] == nome_cobertura]
         
-        if len(df_cobertura) == 0:
-            return None
+            if len(df_cobertura) == 0:
+                return None
         
-        # Agrupar por estado e calcular cobertura
-        df_por_estado = df_cobertura.groupby('sg_uf').agg({
-            'QT_DOSES': 'sum',
-            'QT_POPULACAO': 'sum'
-        }).reset_index()
+            # Agrupar por estado e calcular cobertura
+            df_por_estado = df_cobertura.groupby('sg_uf').agg({
+                'QT_DOSES': 'sum',
+                'QT_POPULACAO': 'sum'
+            }).reset_index()
         
-        # Calcular percentual de cobertura
-        df_por_estado['COBERTURA'] = (df_por_estado['QT_DOSES'] / df_por_estado['QT_POPULACAO']) * 100
+            # Calcular percentual de cobertura
+            df_por_estado['COBERTURA'] = (df_por_estado['QT_DOSES'] / df_por_estado['QT_POPULACAO']) * 100
         
-        # Ordenar por cobertura decrescente
-        df_por_estado = df_por_estado.sort_values('COBERTURA', ascending=True)
+            # Ordenar por cobertura decrescente
+            df_por_estado = df_por_estado.sort_values('COBERTURA', ascending=True)
         
-        # Criar o gráfico de barras
-        fig = px.bar(
-            df_por_estado,
-            x='COBERTURA',
-            y='sg_uf',
-            orientation='h',
-            title=f'Cobertura de {nome_cobertura} por Estado',
-            labels={'COBERTURA': 'Cobertura (%)', 'sg_uf': 'Estado'},
-            color='COBERTURA',
-            color_continuous_scale=[
-                [0, '#790E18'],    # Rubi (0%)
-                [0.2, '#ff4444'],  # Vermelho (20%)
-                [0.4, '#ff9900'],  # Laranja (40%)
-                [0.6, '#ffdd00'],  # Amarelo (60%)
-                [0.8, '#44dd44'],  # Verde (80%)
-                [1, '#000099']     # Azul (100%/meta)
-            ],
-            range_color=[0, 100]
-        )
+            # Criar o gráfico de barras
+            fig = px.bar(
+                df_por_estado,
+                x='COBERTURA',
+                y='sg_uf',
+                orientation='h',
+                title=f'Cobertura de {nome_cobertura} por Estado',
+                labels={'COBERTURA': 'Cobertura (%)', 'sg_uf': 'Estado'},
+                color='COBERTURA',
+                color_continuous_scale=[
+                    [0, '#790E18'],    # Rubi (0%)
+                    [0.2, '#ff4444'],  # Vermelho (20%)
+                    [0.4, '#ff9900'],  # Laranja (40%)
+                    [0.6, '#ffdd00'],  # Amarelo (60%)
+                    [0.8, '#44dd44'],  # Verde (80%)
+                    [1, '#000099']     # Azul (100%/meta)
+                ],
+                range_color=[0, 100]
+            )
         
-        # Adicionar linha vertical da meta
-        fig.add_vline(
-            x=meta,
-            line_dash="dash",
-            line_color="red",
-            annotation_text=f"Meta: {meta:.1f}%",
-            annotation_position="top right"
-        )
+            # Adicionar linha vertical da meta
+            fig.add_vline(
+                x=meta,
+                line_dash="dash",
+                line_color="red",
+                annotation_text=f"Meta: {meta:.1f}%",
+                annotation_position="top right"
+            )
         
-        # Ajustar layout
-        fig.update_layout(
-            height=400,
-            showlegend=False,
-            xaxis=dict(range=[0, 110]),
-            coloraxis_showscale=False
-        )
+            # Ajustar layout
+            fig.update_layout(
+                height=400,
+                showlegend=False,
+                xaxis=dict(range=[0, 110]),
+                coloraxis_showscale=False
+            )
         
-        return fig
+            return fig
     
-    # Expander 1: Ao nascer
-    with st.expander("Ao Nascer", expanded=True):
-        # Função para calcular cobertura
-        def calcular_cobertura(df, cobertura):
-            df_cobertura = df[df['DS_COBERTURA'] == cobertura]
-            if len(df_cobertura) > 0:
-                soma_doses = df_cobertura['QT_DOSES'].sum() if 'QT_DOSES' in df_cobertura.columns else 0
-                soma_populacao = df_cobertura['QT_POPULACAO'].sum() if 'QT_POPULACAO' in df_cobertura.columns else 1
-                if soma_populacao > 0:
-                    return (soma_doses / soma_populacao) * 100
-            return 0
-        
-        # Função para determinar cor baseada no percentual
-        def get_cor_card(percentual):
-            if percentual <= 20:
-                return "#790E18"  # Rubi
-            elif percentual <= 40:
-                return "#ff4444"  # Vermelho
-            elif percentual <= 60:
-                return "#ff9900"  # Laranja
-            elif percentual <= 80:
-                return "#ffdd00"  # Amarelo
-            elif percentual >= 95:
-                return "#000099"  # Azul (meta ótima)
-            else:
-                return "#44dd44"  # Verde
-        
-        # Definir as coberturas buscando da lista disponível
-        cobertura_bcg_nome = buscar_cobertura(coberturas_disponiveis, 'BCG')
-        cobertura_hb30_nome = buscar_cobertura(coberturas_disponiveis, 'Hepatite B (< 30 dias)')
-        
-        # Calcular coberturas
-        cobertura_bcg = calcular_cobertura(data_agrupado, cobertura_bcg_nome)
-        cobertura_hb30 = calcular_cobertura(data_agrupado, cobertura_hb30_nome)
-        
-        # Criar cards centralizados
-        col1, col2, col3, col4 = st.columns(4)
+        # Expander 1: Ao nascer
+        with st.expander("Ao Nascer", expanded=True):
+            # Criar cards centralizados
+            col1, col2, col3, col4 = st.columns(4)
         
-        with col2:
-            cor_bcg = get_cor_por_meta(cobertura_bcg_nome, cobertura_bcg)
-            meta_bcg = get_meta_cobertura(cobertura_bcg_nome)
-            hint_bcg = f"A meta ótima de cobertura dessa vacina é de {f'{meta_bcg:.1f}'.replace('.', ',')}%\n{cobertura_bcg_nome}: {f'{cobertura_bcg:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_bcg}" style='background-color: {cor_bcg}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_bcg_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_bcg:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col2:
+                card_cobertura('BCG')
         
-        with col3:
-            cor_hb30 = get_cor_por_meta(cobertura_hb30_nome, cobertura_hb30)
-            meta_hb30 = get_meta_cobertura(cobertura_hb30_nome)
-            hint_hb30 = f"A meta ótima de cobertura dessa vacina é de {f'{meta_hb30:.1f}'.replace('.', ',')}%\n{cobertura_hb30_nome}: {f'{cobertura_hb30:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_hb30}" style='background-color: {cor_hb30}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_hb30_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_hb30:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col3:
+                card_cobertura('Hepatite B (< 30 dias)')
     
-        st.write("")
+            st.write("")
         
-    # Expander 2: Menores de 1 ano de idade
-    with st.expander("Menores de 1 Ano de Idade", expanded=True):
-        # Função para calcular cobertura
-        def calcular_cobertura(df, cobertura):
-            df_cobertura = df[df['DS_COBERTURA'] == cobertura]
-            if len(df_cobertura) > 0:
-                soma_doses = df_cobertura['QT_DOSES'].sum() if 'QT_DOSES' in df_cobertura.columns else 0
-                soma_populacao = df_cobertura['QT_POPULACAO'].sum() if 'QT_POPULACAO' in df_cobertura.columns else 1
-                if soma_populacao > 0:
-                    return (soma_doses / soma_populacao) * 100
-            return 0
+        # Expander 2: Menores de 1 ano de idade
+        with st.expander("Menores de 1 Ano de Idade", expanded=True):
+            # Linha 1: 4 colunas
+            col1, col2, col3, col4 = st.columns(4)
         
-        # Função para determinar cor baseada no percentual
-        def get_cor_card_menor1(percentual):
-            if percentual <= 40:
-                return "#ff4444"  # Vermelho
-            elif percentual <= 70:
-                return "#ff9900"  # Laranja
-            elif percentual <= 95:
-                return "#ffdd00"  # Amarelo
-            else:
-                return "#44dd44"  # Verde
-        
-        # Definir as coberturas buscando da lista disponível
-        cobertura_fa_nome = buscar_cobertura(coberturas_disponiveis, 'Febre Amarela')
-        cobertura_vip_nome = buscar_cobertura(coberturas_disponiveis, 'Polio Injetável (VIP)')
-        cobertura_pneumo_nome = buscar_cobertura(coberturas_disponiveis, 'Pneumo 10')
-        cobertura_meningo_nome = buscar_cobertura(coberturas_disponiveis, 'Meningo C')
-        cobertura_penta_nome = buscar_cobertura(coberturas_disponiveis, 'Penta (DTP/HepB/Hib)')
-        cobertura_rota_nome = buscar_cobertura(coberturas_disponiveis, 'Rotavírus')
-
-        
-        # Calcular coberturas
-        cobertura_fa = calcular_cobertura(data_agrupado, cobertura_fa_nome)
-        cobertura_vip = calcular_cobertura(data_agrupado, cobertura_vip_nome)
-        cobertura_pneumo = calcular_cobertura(data_agrupado, cobertura_pneumo_nome)
-        cobertura_meningo = calcular_cobertura(data_agrupado, cobertura_meningo_nome)
-        cobertura_penta = calcular_cobertura(data_agrupado, cobertura_penta_nome)
-        cobertura_rota = calcular_cobertura(data_agrupado, cobertura_rota_nome)
+            with col1:
+                card_cobertura('Febre Amarela')
 
+            with col2:
+                card_cobertura('Polio Injetável (VIP)')
         
-        # Linha 1: 4 colunas
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            cor_fa = get_cor_por_meta(cobertura_fa_nome, cobertura_fa)
-            meta_fa = get_meta_cobertura(cobertura_fa_nome)
-            hint_fa = f"A meta ótima de cobertura dessa vacina é de {f'{meta_fa:.1f}'.replace('.', ',')}%\n{cobertura_fa_nome}: {f'{cobertura_fa:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_fa}" style='background-color: {cor_fa}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_fa_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_fa:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
-
-        with col2:
-            cor_vip = get_cor_por_meta(cobertura_vip_nome, cobertura_vip)
-            meta_vip = get_meta_cobertura(cobertura_vip_nome)
-            hint_vip = f"A meta ótima de cobertura dessa vacina é de {f'{meta_vip:.1f}'.replace('.', ',')}%\n{cobertura_vip_nome}: {f'{cobertura_vip:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_vip}" style='background-color: {cor_vip}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_vip_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_vip:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)        
-        with col3:
-            cor_pneumo = get_cor_por_meta(cobertura_pneumo_nome, cobertura_pneumo)
-            meta_pneumo = get_meta_cobertura(cobertura_pneumo_nome)
-            hint_pneumo = f"A meta ótima de cobertura dessa vacina é de {f'{meta_pneumo:.1f}'.replace('.', ',')}%\n{cobertura_pneumo_nome}: {f'{cobertura_pneumo:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_pneumo}" style='background-color: {cor_pneumo}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_pneumo_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_pneumo:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col3:
+                card_cobertura('Pneumo 10')
        
-        with col4:
-            cor_meningo = get_cor_por_meta(cobertura_meningo_nome, cobertura_meningo)
-            meta_meningo = get_meta_cobertura(cobertura_meningo_nome)
-            hint_meningo = f"A meta ótima de cobertura dessa vacina é de {f'{meta_meningo:.1f}'.replace('.', ',')}%\n{cobertura_meningo_nome}: {f'{cobertura_meningo:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_meningo}" style='background-color: {cor_meningo}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_meningo_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_meningo:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col4:
+                card_cobertura('Meningo C')
 
-        st.write("")
-        # Linha 2: 4 colunas
-        col5, col6, col7, col8 = st.columns(4)
+            st.write("")
+            # Linha 2: 4 colunas
+            col5, col6, col7, col8 = st.columns(4)
         
-        with col6:
-            cor_penta = get_cor_por_meta(cobertura_penta_nome, cobertura_penta)
-            meta_penta = get_meta_cobertura(cobertura_penta_nome)
-            hint_penta = f"A meta ótima de cobertura dessa vacina é de {f'{meta_penta:.1f}'.replace('.', ',')}%\n{cobertura_penta_nome}: {f'{cobertura_penta:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_penta}" style='background-color: {cor_penta}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_penta_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_penta:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col6:
+                card_cobertura('Penta (DTP/HepB/Hib)')
         
-        with col7:
-            cor_rota = get_cor_por_meta(cobertura_rota_nome, cobertura_rota)
-            meta_rota = get_meta_cobertura(cobertura_rota_nome)
-            hint_rota = f"A meta ótima de cobertura dessa vacina é de {f'{meta_rota:.1f}'.replace('.', ',')}%\n{cobertura_rota_nome}: {f'{cobertura_rota:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_rota}" style='background-color: {cor_rota}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_rota_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_rota:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col7:
+                card_cobertura('Rotavírus')
             
-        st.write("")
+            st.write("")
     
-    # Expander 3: 1 ano de idade
-    with st.expander("1 Ano de Idade", expanded=True):
-        # Função para calcular cobertura
-        def calcular_cobertura_1ano(df, cobertura):
-            df_cobertura = df[df['DS_COBERTURA'] == cobertura]
-            if len(df_cobertura) > 0:
-                soma_doses = df_cobertura['QT_DOSES'].sum() if 'QT_DOSES' in df_cobertura.columns else 0
-                soma_populacao = df_cobertura['QT_POPULACAO'].sum() if 'QT_POPULACAO' in df_cobertura.columns else 1
-                if soma_populacao > 0:
-                    return (soma_doses / soma_populacao) * 100
-            return 0
+        # Expander 3: 1 ano de idade
+        with st.expander("1 Ano de Idade", expanded=True):
+            # Linha 1: 4 colunas
+            col1, col2, col3, col4 = st.columns(4)
         
-        # Função para determinar cor baseada no percentual
-        def get_cor_card_1ano(percentual):
-            if percentual <= 40:
-                return "#ff4444"  # Vermelho
-            elif percentual <= 70:
-                return "#ff9900"  # Laranja
-            elif percentual <= 95:
-                return "#ffdd00"  # Amarelo
-            else:
-                return "#44dd44"  # Verde
-        
-        # Definir as coberturas buscando da lista disponível
-        cobertura_hepa_nome = buscar_cobertura(coberturas_disponiveis, 'Hepatite A Infantil')
-        cobertura_dtp_ref_nome = buscar_cobertura(coberturas_disponiveis, 'DTP (1° Reforço)')
-        cobertura_triplice1_nome = buscar_cobertura(coberturas_disponiveis, 'Tríplice Viral - 1° Dose')
-        cobertura_triplice2_nome = buscar_cobertura(coberturas_disponiveis, 'Tríplice Viral - 2° Dose')
-        cobertura_pneumo_ref_nome = buscar_cobertura(coberturas_disponiveis, 'Pneumo 10 (1° Reforço)')
-        cobertura_vip_ref_nome = buscar_cobertura(coberturas_disponiveis, 'Polio Injetável (VIP)(Reforço)')
-        cobertura_varicela_nome = buscar_cobertura(coberturas_disponiveis, 'Varicela')
-        cobertura_meningo_ref_nome = buscar_cobertura(coberturas_disponiveis, 'Meningocócica Conjugada (1° Reforço)')
-        
-        # Calcular coberturas
-        cobertura_hepa = calcular_cobertura_1ano(data_agrupado, cobertura_hepa_nome)
-        cobertura_dtp_ref = calcular_cobertura_1ano(data_agrupado, cobertura_dtp_ref_nome)
-        cobertura_triplice1 = calcular_cobertura_1ano(data_agrupado, cobertura_triplice1_nome)
-        cobertura_triplice2 = calcular_cobertura_1ano(data_agrupado, cobertura_triplice2_nome)
-        cobertura_pneumo_ref = calcular_cobertura_1ano(data_agrupado, cobertura_pneumo_ref_nome)
-        cobertura_vip_ref = calcular_cobertura_1ano(data_agrupado, cobertura_vip_ref_nome)
-        cobertura_varicela = calcular_cobertura_1ano(data_agrupado, cobertura_varicela_nome)
-        cobertura_meningo_ref = calcular_cobertura_1ano(data_agrupado, cobertura_meningo_ref_nome)
-        
-        # Linha 1: 4 colunas
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            cor_hepa = get_cor_por_meta(cobertura_hepa_nome, cobertura_hepa)
-            meta_hepa = get_meta_cobertura(cobertura_hepa_nome)
-            hint_hepa = f"A meta ótima de cobertura dessa vacina é de {f'{meta_hepa:.1f}'.replace('.', ',')}%\n{cobertura_hepa_nome}: {f'{cobertura_hepa:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_hepa}" style='background-color: {cor_hepa}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_hepa_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_hepa:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col1:
+                card_cobertura('Hepatite A Infantil')
         
-        with col2:
-            cor_dtp_ref = get_cor_por_meta(cobertura_dtp_ref_nome, cobertura_dtp_ref)
-            meta_dtp_ref = get_meta_cobertura(cobertura_dtp_ref_nome)
-            hint_dtp_ref = f"A meta ótima de cobertura dessa vacina é de {f'{meta_dtp_ref:.1f}'.replace('.', ',')}%\n{cobertura_dtp_ref_nome}: {f'{cobertura_dtp_ref:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_dtp_ref}" style='background-color: {cor_dtp_ref}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_dtp_ref_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_dtp_ref:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col2:
+                card_cobertura('DTP (1° Reforço)')
         
-        with col3:
-            cor_triplice1 = get_cor_por_meta(cobertura_triplice1_nome, cobertura_triplice1)
-            meta_triplice1 = get_meta_cobertura(cobertura_triplice1_nome)
-            hint_triplice1 = f"A meta ótima de cobertura dessa vacina é de {f'{meta_triplice1:.1f}'.replace('.', ',')}%\n{cobertura_triplice1_nome}: {f'{cobertura_triplice1:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_triplice1}" style='background-color: {cor_triplice1}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_triplice1_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_triplice1:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col3:
+                card_cobertura('Tríplice Viral - 1° Dose')
         
-        with col4:
-            cor_triplice2 = get_cor_por_meta(cobertura_triplice2_nome, cobertura_triplice2)
-            meta_triplice2 = get_meta_cobertura(cobertura_triplice2_nome)
-            hint_triplice2 = f"A meta ótima de cobertura dessa vacina é de {f'{meta_triplice2:.1f}'.replace('.', ',')}%\n{cobertura_triplice2_nome}: {f'{cobertura_triplice2:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_triplice2}" style='background-color: {cor_triplice2}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_triplice2_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_triplice2:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
-        st.write("")
-        # Linha 2: 4 colunas
-        col5, col6, col7, col8 = st.columns(4)
+            with col4:
+                card_cobertura('Tríplice Viral - 2° Dose')
+            st.write("")
+            # Linha 2: 4 colunas
+            col5, col6, col7, col8 = st.columns(4)
         
-        with col5:
-            cor_pneumo_ref = get_cor_por_meta(cobertura_pneumo_ref_nome, cobertura_pneumo_ref)
-            meta_pneumo_ref = get_meta_cobertura(cobertura_pneumo_ref_nome)
-            hint_pneumo_ref = f"A meta ótima de cobertura dessa vacina é de {f'{meta_pneumo_ref:.1f}'.replace('.', ',')}%\n{cobertura_pneumo_ref_nome}: {f'{cobertura_pneumo_ref:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_pneumo_ref}" style='background-color: {cor_pneumo_ref}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_pneumo_ref_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_pneumo_ref:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col5:
+                card_cobertura('Pneumo 10 (1° Reforço)')
         
-        with col6:
-            cor_vip_ref = get_cor_por_meta(cobertura_vip_ref_nome, cobertura_vip_ref)
-            meta_vip_ref = get_meta_cobertura(cobertura_vip_ref_nome)
-            hint_vip_ref = f"A meta ótima de cobertura dessa vacina é de {f'{meta_vip_ref:.1f}'.replace('.', ',')}%\n{cobertura_vip_ref_nome}: {f'{cobertura_vip_ref:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_vip_ref}" style='background-color: {cor_vip_ref}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_vip_ref_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_vip_ref:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col6:
+                card_cobertura('Polio Injetável (VIP)(Reforço)')
         
-        with col7:
-            cor_varicela = get_cor_por_meta(cobertura_varicela_nome, cobertura_varicela)
-            meta_varicela = get_meta_cobertura(cobertura_varicela_nome)
-            hint_varicela = f"A meta ótima de cobertura dessa vacina é de {f'{meta_varicela:.1f}'.replace('.', ',')}%\n{cobertura_varicela_nome}: {f'{cobertura_varicela:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_varicela}" style='background-color: {cor_varicela}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_varicela_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_varicela:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col7:
+                card_cobertura('Varicela')
         
-        with col8:
-            cor_meningo_ref = get_cor_por_meta(cobertura_meningo_ref_nome, cobertura_meningo_ref)
-            meta_meningo_ref = get_meta_cobertura(cobertura_meningo_ref_nome)
-            hint_meningo_ref = f"A meta ótima de cobertura dessa vacina é de {f'{meta_meningo_ref:.1f}'.replace('.', ',')}%\n{cobertura_meningo_ref_nome}: {f'{cobertura_meningo_ref:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_meningo_ref}" style='background-color: {cor_meningo_ref}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_meningo_ref_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_meningo_ref:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+            with col8:
+                card_cobertura('Meningocócica Conjugada (1° Reforço)')
         
-        st.write("")
+            st.write("")
 
     
-    # Expander 4: Adulto
-    with st.expander("Adulto", expanded=True):
-        # Função para calcular cobertura
-        def calcular_cobertura_adulto(df, cobertura):
-            df_cobertura = df[df['DS_COBERTURA'] == cobertura]
-            if len(df_cobertura) > 0:
-                soma_doses = df_cobertura['QT_DOSES'].sum() if 'QT_DOSES' in df_cobertura.columns else 0
-                soma_populacao = df_cobertura['QT_POPULACAO'].sum() if 'QT_POPULACAO' in df_cobertura.columns else 1
-                if soma_populacao > 0:
-                    return (soma_doses / soma_populacao) * 100
-            return 0
-        
-        # Função para determinar cor baseada no percentual
-        def get_cor_card_adulto(percentual):
-            if percentual <= 40:
-                return "#ff4444"  # Vermelho
-            elif percentual <= 70:
-                return "#ff9900"  # Laranja
-            elif percentual <= 95:
-                return "#ffdd00"  # Amarelo
-            else:
-                return "#44dd44"  # Verde
-        
-        # Definir as coberturas buscando da lista disponível
-        cobertura_dtpa_nome = buscar_cobertura(coberturas_disponiveis, 'dTpa Adulto - Gestantes')
+        # Expander 4: Adulto
+        with st.expander("Adulto", expanded=True):
+            # Criar card centralizado
+            col_esq, col_centro, col_dir = st.columns([1.5, 1, 1.5])
         
-        # Calcular coberturas
-        cobertura_dtpa = calcular_cobertura_adulto(data_agrupado, cobertura_dtpa_nome)
+            with col_centro:
+                card_cobertura('dTpa Adulto - Gestantes')
         
-        # Criar card centralizado
-        col_esq, col_centro, col_dir = st.columns([1.5, 1, 1.5])
-        
-        with col_centro:
-            cor_dtpa = get_cor_por_meta(cobertura_dtpa_nome, cobertura_dtpa)
-            meta_dtpa = get_meta_cobertura(cobertura_dtpa_nome)
-            hint_dtpa = f"A meta ótima de cobertura dessa vacina é de {f'{meta_dtpa:.1f}'.replace('.', ',')}%\n{cobertura_dtpa_nome}: {f'{cobertura_dtpa:.2f}'.replace('.', ',')}%"
-            st.markdown(f"""
-                <div title="{hint_dtpa}" style='background-color: {cor_dtpa}; padding: 12px; border-radius: 8px; text-align: center; cursor: help;'>
-                    <h4 style='color: white; margin: 0; font-size: 13px;'>{cobertura_dtpa_nome}</h4>
-                    <p style='color: white; font-size: 20px; font-weight: bold; margin: 6px 0;'>{f'{cobertura_dtpa:.2f}'.replace('.', ',')}%</p>
-                </div>
-            """, unsafe_allow_html=True)
-        
-        st.write("")
+            st.write("")
     
-    # Legenda de cores
-    st.markdown("---")
-    st.subheader("Legenda de Cobertura")
-    col_leg1, col_leg2, col_leg3, col_leg4, col_leg5, col_leg6 = st.columns(6)
+        # Legenda de cores
+        st.markdown("---")
+        st.subheader("Legenda de Cobertura")
+        col_leg1, col_leg2, col_leg3, col_leg4, col_leg5, col_leg6 = st.columns(6)
     
-    with col_leg1:
-        st.markdown("""
+        with col_leg1:
+            st.markdown("""
             <div style='background-color: #790E18; padding: 15px; border-radius: 8px; text-align: center;'>
                 <p style='color: white; font-weight: bold; margin: 0;'>0 - 20%</p>
                 <p style='color: white; font-size: 12px; margin: 5px 0;'>Muito Crítico</p>
             </div>
         """, unsafe_allow_html=True)
     
-    with col_leg2:
-        st.markdown("""
+        with col_leg2:
+            st.markdown("""
             <div style='background-color: #ff4444; padding: 15px; border-radius: 8px; text-align: center;'>
                 <p style='color: white; font-weight: bold; margin: 0;'>21 - 40%</p>
                 <p style='color: white; font-size: 12px; margin: 5px 0;'>Crítico</p>
             </div>
         """, unsafe_allow_html=True)
     
-    with col_leg3:
-        st.markdown("""
+        with col_leg3:
+            st.markdown("""
             <div style='background-color: #ff9900; padding: 15px; border-radius: 8px; text-align: center;'>
                 <p style='color: white; font-weight: bold; margin: 0;'>41 - 60%</p>
                 <p style='color: white; font-size: 12px; margin: 5px 0;'>Baixo</p>
             </div>
         """, unsafe_allow_html=True)
     
-    with col_leg4:
-        st.markdown("""
+        with col_leg4:
+            st.markdown("""
             <div style='background-color: #ffdd00; padding: 15px; border-radius: 8px; text-align: center;'>
                 <p style='color: black; font-weight: bold; margin: 0;'>61 - 80%</p>
                 <p style='color: black; font-size: 12px; margin: 5px 0;'>Moderado</p>
             </div>
         """, unsafe_allow_html=True)
     
-    with col_leg5:
-        st.markdown("""
+        with col_leg5:
+            st.markdown("""
             <div style='background-color: #44dd44; padding: 15px; border-radius: 8px; text-align: center;'>
                 <p style='color: white; font-weight: bold; margin: 0;'>> 80%</p>
                 <p style='color: white; font-size: 12px; margin: 5px 0;'>Excelente</p>
             </div>
         """, unsafe_allow_html=True)
     
-    with col_leg6:
-        st.markdown("""
+        with col_leg6:
+            st.markdown("""
             <div style='background-color: #000099; padding: 15px; border-radius: 8px; text-align: center;'>
                 <p style='color: white; font-weight: bold; margin: 0;'>Meta Ótima</p>
                 <p style='color: white; font-size: 12px; margin: 5px 0;'>≥ 90% ou 95%</p>
             </div>
         """, unsafe_allow_html=True)
 
-with aba2:
-    st.header("Mapa de Cobertura Vacinal por Estado")
-    st.subheader(f"📊 Filtros: {filtros_str}")
+if aba2.open is not False:
+    with aba2, instrumentacao.etapa('aba.mapa'):
+        st.header("Mapa de Cobertura Vacinal por Estado")
+        st.subheader(f"📊 Filtros: {filtros_str}")
     
-    # Seleção de vacina para visualizar no mapa
-    if 'DS_COBERTURA' in data_agrupado.columns:
-        coberturas_para_mapa = sorted(data_agrupado['DS_COBERTURA'].unique().tolist())
-        cobertura_selecionada_mapa = st.selectbox("Selecione a vacina para visualizar no mapa:", coberturas_para_mapa)
+        # Função para exibir o mapa por município, com a geometria no nível de detalhe da seleção
+        def exibir_mapa_municipios(nome_cobertura, instrumentacao_secao):
+            # Cobertura por município a partir das somas de doses e população do cubo
+            with instrumentacao_secao.etapa('mapa_municipios.dados') as etapa:
+                df_por_municipio = cache_resultados.obter(
+                    CacheResultados.chave('mapa_municipios.dados', versao_dados, ano_selecionado, regiao_selecionada,
+                                          uf_selecionado, municipio_selecionado, vacina=nome_cobertura),
+                    lambda: tabela_coberturas(
+                        cubo, 'municipio', ano_selecionado, regiao_selecionada,
+                        uf_selecionado, municipio_selecionado, nome_cobertura
+                    ),
+                )
+                etapa.saida(len(df_por_municipio))
         
-        # Filtrar dados para a cobertura selecionada
-        df_mapa = data_agrupado[data_agrupado['DS_COBERTURA'] == cobertura_selecionada_mapa].copy()
+            if len(df_por_municipio) == 0:
+                st.warning("Não há dados disponíveis para a cobertura selecionada com os filtros aplicados.")
+                return
         
-        if len(df_mapa) > 0 and 'sg_uf' in df_mapa.columns:
-            # Agrupar por estado
-            df_por_uf = df_mapa.groupby('sg_uf').agg({
-                'QT_DOSES': 'sum',
-                'QT_POPULACAO': 'sum'
-            }).reset_index()
+            df_por_municipio['COBERTURA'] = df_por_municipio['COBERTURA'].round(2)
+            df_por_municipio[CHAVE_MUNICIPIOS] = df_por_municipio['CO_IBGE'].astype(str).str.zfill(6)
+        
+            # Uma única UF na seleção usa as formas detalhadas só dos seus municípios;
+            # Brasil ou região usam as formas grosseiras do arquivo nacional
+            ufs_mapa = df_por_municipio['sg_uf'].dropna().unique()
+            uf_detalhe = ufs_mapa[0] if len(ufs_mapa) == 1 else None
+            geojson_municipios = geometria_municipios(df_por_municipio[CHAVE_MUNICIPIOS], uf_detalhe)
+            if geojson_municipios is None:
+                st.warning("Geometria dos municípios não encontrada em dados/geometria. "
+                           "Gere os arquivos com: python -m dpni.geometria municipios")
+                return
+        
+            meta_municipios = meta_cobertura(nome_cobertura)
+        
+            def construir_fig_municipios():
+                fig_municipios = px.choropleth(
+                    df_por_municipio,
+                    locations=CHAVE_MUNICIPIOS,
+                    geojson=geojson_municipios,
+                    featureidkey=f"properties.{CHAVE_MUNICIPIOS}",
+                    color='COBERTURA',
+                    hover_name='no_municipio',
+                    hover_data={
+                        'COBERTURA': ':.2f',
+                        'QT_DOSES': ':,.0f',
+                        'QT_POPULACAO': ':,.0f',
+                        'sg_uf': True,
+                        CHAVE_MUNICIPIOS: False
+                    },
+                    labels={
+                        'COBERTURA': 'Cobertura (%)',
+                        'QT_DOSES': 'Doses Aplicadas',
+                        'QT_POPULACAO': 'População',
+                        'sg_uf': 'UF'
+                    },
+                    color_continuous_scale=[
+                        [0, '#790E18'],      # Rubi (0%)
+                        [0.2, '#ff4444'],    # Vermelho (20%)
+                        [0.4, '#ff9900'],    # Laranja (40%)
+                        [0.6, '#ffdd00'],    # Amarelo (60%)
+                        [0.8, '#44dd44'],    # Verde (80%)
+                        [meta_municipios/100, '#000099'],  # Azul (meta)
+                        [1, '#000099']       # Azul (100%)
+                    ],
+                    range_color=[0, 110],
+                    title=f"Cobertura de {nome_cobertura} por Município - Meta: {meta_municipios:.1f}%"
+                )
+                fig_municipios.update_geos(fitbounds="locations", visible=False)
+                # Sem contorno: com milhares de polígonos as bordas pesam mais que o preenchimento
+                fig_municipios.update_traces(marker_line_width=0)
+                fig_municipios.update_layout(height=600, margin={"r":0,"t":50,"l":0,"b":0})
+                return fig_municipios
+        
+            with instrumentacao_secao.etapa('mapa_municipios.figura', len(df_por_municipio)):
+                # Refeita do cache enquanto dados, vacina, meta e geometria não mudam
+                fig_municipios = cache_figuras.obter(
+                    (df_por_municipio, nome_cobertura, meta_municipios, 'municipios', uf_detalhe),
+                    construir_fig_municipios,
+                )
+        
+            with instrumentacao_secao.etapa('mapa_municipios.plotly_chart'):
+                st.plotly_chart(fig_municipios, width='stretch')
+
+            # Municípios com dados mas sem forma na malha (instalados depois de 2005) não aparecem no mapa
+            sem_geometria = municipios_sem_geometria(df_por_municipio[CHAVE_MUNICIPIOS], geojson_municipios)
+            if sem_geometria:
+                fora_do_mapa = df_por_municipio.loc[df_por_municipio[CHAVE_MUNICIPIOS].isin(sem_geometria)]
+                st.caption(
+                    f"{len(sem_geometria)} município(s) com dados fora do mapa, sem geometria na malha do IBGE: "
+                    + ", ".join(
+                        f"{nome} ({uf})" if pd.notna(nome) else f"código {codigo}"
+                        for nome, uf, codigo in zip(fora_do_mapa['no_municipio'], fora_do_mapa['sg_uf'],
+                                                    fora_do_mapa[CHAVE_MUNICIPIOS])
+                    )
+                    + ". Eles continuam na tabela abaixo."
+                )
+        
+            st.subheader("Dados por Município")
+            df_tabela_municipios = df_por_municipio[['sg_uf', 'no_municipio', 'COBERTURA', 'FAIXA', 'QT_DOSES', 'QT_POPULACAO']]
+            df_tabela_municipios.columns = ['UF', 'Município', 'Cobertura (%)', 'Faixa', 'Doses Aplicadas', 'População']
+            df_tabela_municipios = df_tabela_municipios.sort_values('Cobertura (%)', ascending=False)
+            st.dataframe(df_tabela_municipios, width='stretch', hide_index=True)
+    
+        # Vacina e nível do mapa reexecutam só este fragmento, sobre o cubo e os filtros já resolvidos
+        @st.fragment
+        def secao_mapa():
+            instrumentacao_secao = instrumentacao_fragmento()
+            # Seleção de vacina para visualizar no mapa
+            if 'DS_COBERTURA' in data_ano.columns:
+                coberturas_para_mapa = coberturas_disponiveis
+                cobertura_selecionada_mapa = st.selectbox("Selecione a vacina para visualizar no mapa:", coberturas_para_mapa)
+        
+                # Nível do mapa: estados (padrão) ou municípios
+                nivel_mapa = st.radio("Nível do mapa", ["Estados", "Municípios"], horizontal=True, key="nivel_mapa")
+        
+                if nivel_mapa == "Municípios":
+                    exibir_mapa_municipios(cobertura_selecionada_mapa, instrumentacao_secao)
+                else:
+                    # Doses e população por estado da cobertura selecionada, consultadas no cubo
+                    with instrumentacao_secao.etapa('mapa.dados') as etapa:
+                        df_por_uf = cache_resultados.obter(
+                            CacheResultados.chave('mapa.dados', versao_dados, ano_selecionado, regiao_selecionada,
+                                                  uf_selecionado, municipio_selecionado, vacina=cobertura_selecionada_mapa),
+                            lambda: cobertura_por_uf(
+                                cubo, ano_selecionado, cobertura_selecionada_mapa,
+                                regiao_selecionada, uf_selecionado, municipio_selecionado
+                            ),
+                        )
+                        etapa.saida(len(df_por_uf))
+        
+                    if len(df_por_uf) > 0:
+                        df_por_uf['COBERTURA'] = df_por_uf['COBERTURA'].round(2)
             
-            # Calcular cobertura
-            df_por_uf['COBERTURA'] = (df_por_uf['QT_DOSES'] / df_por_uf['QT_POPULACAO']) * 100
-            df_por_uf['COBERTURA'] = df_por_uf['COBERTURA'].round(2)
+                        # Adicionar nome completo do estado
+                        df_por_uf['no_uf'] = df_por_uf['sg_uf'].map(geografia.nome_uf_por_sigla)
             
-            # Adicionar nome completo do estado
-            if 'sg_uf' in estados_df.columns:
-                df_por_uf = df_por_uf.merge(
-                    estados_df[['sg_uf', 'no_uf']],
-                    on='sg_uf',
-                    how='left'
-                )
+                        # Buscar a meta da cobertura selecionada
+                        meta_mapa = meta_cobertura(cobertura_selecionada_mapa)
             
-            # Buscar a meta da cobertura selecionada
-            meta_mapa = get_meta_cobertura(cobertura_selecionada_mapa)
+                        # Geometria das UFs empacotada em dados/ (lida uma vez por processo), recortada às UFs
+                        # exibidas; só se o arquivo versionado faltar o mapa recorre ao GeoJSON de origem na internet
+                        geometria_estados = carregar_geometria(ARQUIVO_GEOMETRIA_ESTADOS)
+                        if geometria_estados is not None:
+                            geojson_estados = recortar(geometria_estados, df_por_uf['sg_uf'], CHAVE_ESTADOS)
+                        else:
+                            geojson_estados = ORIGEM_GEOMETRIA_ESTADOS
             
-            # Criar mapa coroplético do Brasil
-            fig_mapa = px.choropleth(
-                df_por_uf,
-                locations='sg_uf',
-                locationmode='geojson-id',
-                color='COBERTURA',
-                hover_name='no_uf' if 'no_uf' in df_por_uf.columns else 'sg_uf',
-                hover_data={
-                    'COBERTURA': ':.2f',
-                    'QT_DOSES': ':,.0f',
-                    'QT_POPULACAO': ':,.0f',
-                    'sg_uf': False
-                },
-                labels={
-                    'COBERTURA': 'Cobertura (%)',
-                    'QT_DOSES': 'Doses Aplicadas',
-                    'QT_POPULACAO': 'População'
-                },
-                color_continuous_scale=[
-                    [0, '#790E18'],      # Rubi (0%)
-                    [0.2, '#ff4444'],    # Vermelho (20%)
-                    [0.4, '#ff9900'],    # Laranja (40%)
-                    [0.6, '#ffdd00'],    # Amarelo (60%)
-                    [0.8, '#44dd44'],    # Verde (80%)
-                    [meta_mapa/100, '#000099'],  # Azul (meta)
-                    [1, '#000099']       # Azul (100%)
-                ],
-                range_color=[0, 110],
-                geojson="https://raw.githubusercontent.com/codeforamerica/click_that_hood/master/public/data/brazil-states.geojson",
-                featureidkey="properties.sigla",
-                title=f"Cobertura de {cobertura_selecionada_mapa} por Estado - Meta: {meta_mapa:.1f}%"
-            )
+                        def construir_fig_mapa():
+                            # Criar mapa coroplético do Brasil
+                            fig_mapa = px.choropleth(
+                                df_por_uf,
+                                locations='sg_uf',
+                                locationmode='geojson-id',
+                                color='COBERTURA',
+                                hover_name='no_uf' if 'no_uf' in df_por_uf.columns else 'sg_uf',
+                                hover_data={
+                                    'COBERTURA': ':.2f',
+                                    'QT_DOSES': ':,.0f',
+                                    'QT_POPULACAO': ':,.0f',
+                                    'sg_uf': False
+                                },
+                                labels={
+                                    'COBERTURA': 'Cobertura (%)',
+                                    'QT_DOSES': 'Doses Aplicadas',
+                                    'QT_POPULACAO': 'População'
+                                },
+                                color_continuous_scale=[
+                                    [0, '#790E18'],      # Rubi (0%)
+                                    [0.2, '#ff4444'],    # Vermelho (20%)
+                                    [0.4, '#ff9900'],    # Laranja (40%)
+                                    [0.6, '#ffdd00'],    # Amarelo (60%)
+                                    [0.8, '#44dd44'],    # Verde (80%)
+                                    [meta_mapa/100, '#000099'],  # Azul (meta)
+                                    [1, '#000099']       # Azul (100%)
+                                ],
+                                range_color=[0, 110],
+                                geojson=geojson_estados,
+                                featureidkey=f"properties.{CHAVE_ESTADOS}",
+                                title=f"Cobertura de {cobertura_selecionada_mapa} por Estado - Meta: {meta_mapa:.1f}%"
+                            )
             
-            fig_mapa.update_geos(
-                fitbounds="locations",
-                visible=False
-            )
+                            fig_mapa.update_geos(
+                                fitbounds="locations",
+                                visible=False
+                            )
             
-            fig_mapa.update_layout(
-                height=600,
-                margin={"r":0,"t":50,"l":0,"b":0}
-            )
+                            fig_mapa.update_layout(
+                                height=600,
+                                margin={"r":0,"t":50,"l":0,"b":0}
+                            )
+                            return fig_mapa
             
-            st.plotly_chart(fig_mapa, width='stretch')
+                        with instrumentacao_secao.etapa('mapa.figura'):
+                            # Refeita do cache enquanto dados, vacina, meta e geometria não mudam
+                            origem_geometria = ORIGEM_GEOMETRIA_ESTADOS if geometria_estados is None else ARQUIVO_GEOMETRIA_ESTADOS
+                            fig_mapa = cache_figuras.obter(
+                                (df_por_uf, cobertura_selecionada_mapa, meta_mapa, origem_geometria), construir_fig_mapa
+                            )
             
-            # Adicionar tabela com dados por estado
-            st.subheader("Dados por Estado")
-            df_tabela_mapa = df_por_uf.copy()
-            if 'no_uf' in df_tabela_mapa.columns:
-                df_tabela_mapa = df_tabela_mapa[['sg_uf', 'no_uf', 'COBERTURA', 'QT_DOSES', 'QT_POPULACAO']]
-                df_tabela_mapa.columns = ['UF', 'Estado', 'Cobertura (%)', 'Doses Aplicadas', 'População']
-            else:
-                df_tabela_mapa = df_tabela_mapa[['sg_uf', 'COBERTURA', 'QT_DOSES', 'QT_POPULACAO']]
-                df_tabela_mapa.columns = ['UF', 'Cobertura (%)', 'Doses Aplicadas', 'População']
+                        with instrumentacao_secao.etapa('mapa.plotly_chart'):
+                            st.plotly_chart(fig_mapa, width='stretch')
+            
+                        # Adicionar tabela com dados por estado
+                        st.subheader("Dados por Estado")
+                        df_tabela_mapa = df_por_uf.copy()
+                        # Faixa de cada estado classificada de uma vez para a coluna inteira
+                        df_tabela_mapa['FAIXA'], _ = classificar_coberturas(df_tabela_mapa['COBERTURA'], meta_mapa)
+                        if 'no_uf' in df_tabela_mapa.columns:
+                            df_tabela_mapa = df_tabela_mapa[['sg_uf', 'no_uf', 'COBERTURA', 'FAIXA', 'QT_DOSES', 'QT_POPULACAO']]
+                            df_tabela_mapa.columns = ['UF', 'Estado', 'Cobertura (%)', 'Faixa', 'Doses Aplicadas', 'População']
+                        else:
+                            df_tabela_mapa = df_tabela_mapa[['sg_uf', 'COBERTURA', 'FAIXA', 'QT_DOSES', 'QT_POPULACAO']]
+                            df_tabela_mapa.columns = ['UF', 'Cobertura (%)', 'Faixa', 'Doses Aplicadas', 'População']
             
-            df_tabela_mapa = df_tabela_mapa.sort_values('Cobertura (%)', ascending=False)
-            st.dataframe(df_tabela_mapa, width='stretch', hide_index=True)
+                        df_tabela_mapa = df_tabela_mapa.sort_values('Cobertura (%)', ascending=False)
+                        with instrumentacao_secao.etapa('mapa.dataframe', len(df_tabela_mapa)):
+                            st.dataframe(df_tabela_mapa, width='stretch', hide_index=True)
             
-        else:
-            st.warning("Não há dados disponíveis para a cobertura selecionada com os filtros aplicados.")
-    else:
-        st.warning("Coluna DS_COBERTURA não encontrada nos dados.")
+                    else:
+                        st.warning("Não há dados disponíveis para a cobertura selecionada com os filtros aplicados.")
+            else:
+                st.warning("Coluna DS_COBERTURA não encontrada nos dados.")
+        
+        secao_mapa()
 
-with aba3:
-    st.header("Tabelas de Dados")
-    st.subheader(f"📊 Filtros: {filtros_str}")
+if aba3.open is not False:
+    with aba3, instrumentacao.etapa('aba.tabelas', linhas_selecao):
+        st.header("Tabelas de Dados")
+        st.subheader(f"📊 Filtros: {filtros_str}")
     
-    # Configuração da paginação
-    linhas_por_pagina = st.selectbox("Linhas por página", [10, 25, 50, 100, 500], index=2)
-    total_paginas = (len(data_agrupado) - 1) // linhas_por_pagina + 1
+        # Ordenação e busca feitas no servidor sobre a tabela da seleção (em cache)
+        tabela_paginada = obter_tabela(
+            versao_dados, ano_selecionado, regiao_selecionada, uf_selecionado, municipio_selecionado, descricao_selecionada
+        )
+    
+        # Mudanças de ordenação, busca ou tamanho de página voltam para a primeira página
+        def voltar_primeira_pagina():
+            st.session_state.pagina_atual = 1
+    
+        # Busca, ordenação, tamanho de página e navegação reexecutam só este fragmento,
+        # que lê a página da tabela da seleção já em cache
+        @st.fragment
+        def secao_paginas():
+            instrumentacao_secao = instrumentacao_fragmento()
+            col_busca, col_ordem, col_sentido = st.columns([3, 2, 1])
+            with col_busca:
+                texto_busca = st.text_input("Buscar município ou vacina", key="busca_tabela", on_change=voltar_primeira_pagina)
+            with col_ordem:
+                coluna_ordem = st.selectbox(
+                    "Ordenar por", ["Ordem original"] + list(tabela_paginada.data.columns),
+                    key="ordem_tabela", on_change=voltar_primeira_pagina
+                )
+            with col_sentido:
+                decrescente = st.checkbox("Decrescente", key="decrescente_tabela", on_change=voltar_primeira_pagina)
+            coluna_ordem = None if coluna_ordem == "Ordem original" else coluna_ordem
+    
+            # Configuração da paginação
+            linhas_por_pagina = st.selectbox("Linhas por página", [10, 25, 50, 100, 500], index=2, on_change=voltar_primeira_pagina)
+            total_registros = tabela_paginada.total(texto_busca)
+            total_paginas = max(1, (total_registros - 1) // linhas_por_pagina + 1)
 
-    # Ajustar página atual quando total de páginas diminuir
-    if "pagina_atual" not in st.session_state:
-        st.session_state.pagina_atual = 1
-    if st.session_state.pagina_atual > total_paginas:
-        st.session_state.pagina_atual = total_paginas
+            # Ajustar página atual quando total de páginas diminuir
+            if "pagina_atual" not in st.session_state:
+                st.session_state.pagina_atual = 1
+            if st.session_state.pagina_atual > total_paginas:
+                st.session_state.pagina_atual = total_paginas
     
-    # Controles de navegação
-    col1, col2, col3 = st.columns([1, 3, 1])
-    with col1:
-        if st.button("⬅️ Anterior", disabled=("pagina_atual" not in st.session_state or st.session_state.pagina_atual == 1)):
-            st.session_state.pagina_atual -= 1
-            st.rerun()
+            # Navegação por callbacks: a página muda antes do rerun, sem um segundo rerun
+            def mudar_pagina(passo):
+                st.session_state.pagina_atual += passo
     
-    with col2:
-        pagina_atual = st.number_input(
-            "Página", 
-            min_value=1, 
-            max_value=total_paginas, 
-            value=st.session_state.get("pagina_atual", 1),
-            key="input_pagina"
-        )
-        if pagina_atual != st.session_state.get("pagina_atual", 1):
-            st.session_state.pagina_atual = pagina_atual
-            st.rerun()
-        
-        st.write(f"Total: {total_paginas} páginas ({len(data_agrupado):,} registros)")
+            # Controles de navegação
+            col1, col2, col3 = st.columns([1, 3, 1])
+            with col1:
+                st.button("⬅️ Anterior", disabled=st.session_state.pagina_atual == 1, on_click=mudar_pagina, args=(-1,))
+    
+            with col2:
+                st.number_input("Página", min_value=1, max_value=total_paginas, key="pagina_atual")
+                st.write(f"Total: {total_paginas} páginas ({total_registros:,} registros)")
     
-    with col3:
-        if st.button("Próxima ➡️", disabled=("pagina_atual" not in st.session_state or st.session_state.pagina_atual == total_paginas)):
-            st.session_state.pagina_atual += 1
-            st.rerun()
+            with col3:
+                st.button("Próxima ➡️", disabled=st.session_state.pagina_atual == total_paginas, on_click=mudar_pagina, args=(1,))
     
-    # Calcular índices da página atual
-    inicio = (st.session_state.pagina_atual - 1) * linhas_por_pagina
-    fim = inicio + linhas_por_pagina
+            # Calcular índices da página atual
+            inicio = (st.session_state.pagina_atual - 1) * linhas_por_pagina
+            fim = inicio + linhas_por_pagina
     
-    # Exibir dados da página atual
-    st.dataframe(data_agrupado.iloc[inicio:fim], width='stretch')
-    st.info(f"Mostrando registros {inicio + 1} a {min(fim, len(data_agrupado))} de {len(data_agrupado):,}")
-    st.markdown("---")  
-with aba4:
+            # Exibir dados da página atual (uma fatia da permutação de ordenação/busca)
+            with instrumentacao_secao.etapa('tabelas.dataframe', total_registros) as etapa:
+                pagina = tabela_paginada.pagina(
+                    st.session_state.pagina_atual, linhas_por_pagina, coluna_ordem, decrescente, texto_busca
+                )
+                st.dataframe(pagina, width='stretch')
+                etapa.saida(len(pagina))
+            st.info(f"Mostrando registros {min(inicio + 1, total_registros)} a {min(fim, total_registros)} de {total_registros:,}")
         
+        secao_paginas()
     
-    # Gráfico de evolução mensal de todas as coberturas
-    st.header("Gráficos de Cobertura por Estado")
-    st.subheader(f"📊 Filtros: {filtros_str}")
+        # Exportação: o arquivo só é gerado (em blocos) quando o botão de download é clicado
+        with st.expander("⬇️ Exportar dados"):
+            col_conteudo, col_formato = st.columns(2)
+            with col_conteudo:
+                conteudo_exportacao = st.radio(
+                    "Conteúdo", ["Dados filtrados", "Cobertura por UF"], horizontal=True, key="conteudo_exportacao"
+                )
+            with col_formato:
+                formato_exportacao = st.radio(
+                    "Formato", list(FORMATOS_EXPORTACAO), horizontal=True, key="formato_exportacao"
+                )
+            extensao, tipo_mime = FORMATOS_EXPORTACAO[formato_exportacao]
+        
+            def gerar_exportacao(conteudo=conteudo_exportacao, extensao=extensao):
+                if conteudo == "Cobertura por UF":
+                    dados_exportacao = tabela_coberturas(
+                        cubo, 'uf', ano_selecionado, regiao_selecionada,
+                        uf_selecionado, municipio_selecionado, descricao_selecionada
+                    )
+                else:
+                    dados_exportacao = tabela_paginada.data
+                return exportar(dados_exportacao, extensao)
+        
+            nome_arquivo = "dados_filtrados" if conteudo_exportacao == "Dados filtrados" else "cobertura_por_uf"
+            st.download_button(
+                f"Baixar {formato_exportacao}",
+                data=gerar_exportacao,
+                file_name=f"{nome_arquivo}_{ano_selecionado}.{extensao}",
+                mime=tipo_mime,
+                on_click="ignore",
+            )
+        st.markdown("---")  
+if aba4.open is not False:
+    with aba4, instrumentacao.etapa('aba.dashboards'):
+        
     
-    st.subheader("📈 Evolução Mensal da Cobertura Vacinal")
+        # Gráfico de evolução mensal de todas as coberturas
+        st.header("Gráficos de Cobertura por Estado")
+        st.subheader(f"📊 Filtros: {filtros_str}")
     
-    # Selecionar cobertura para visualizar a evolução
-    cobertura_evolucao = st.selectbox(
-        "Selecione a vacina para visualizar a evolução mensal:",
-        coberturas_disponiveis,
-        key="select_cobertura_evolucao"
-    )
+        st.subheader("📈 Evolução Mensal da Cobertura Vacinal")
     
-    if cobertura_evolucao:
-        # Filtrar dados por cobertura selecionada (usar data_todos_anos para pegar todos os anos)
-        df_evolucao = data_todos_anos[data_todos_anos['DS_COBERTURA'] == cobertura_evolucao].copy()
-        
-        # Aplicar filtros geográficos se houver
-        if regiao_selecionada != 'Todas' and 'REGIAO' in df_evolucao.columns:
-            df_evolucao = df_evolucao[df_evolucao['REGIAO'] == regiao_selecionada]
-        if uf_selecionado != 'Todos' and 'sg_uf' in df_evolucao.columns:
-            df_evolucao = df_evolucao[df_evolucao['sg_uf'] == uf_selecionado]
-        if municipio_selecionado != 'Todos' and 'no_municipio' in df_evolucao.columns:
-            df_evolucao = df_evolucao[df_evolucao['no_municipio'] == municipio_selecionado]
+        # A vacina da evolução reexecuta só este fragmento
+        @st.fragment
+        def secao_evolucao():
+            instrumentacao_secao = instrumentacao_fragmento()
+            # Selecionar cobertura para visualizar a evolução
+            cobertura_evolucao = st.selectbox(
+                "Selecione a vacina para visualizar a evolução mensal:",
+                coberturas_disponiveis,
+                key="select_cobertura_evolucao"
+            )
+    
+            if cobertura_evolucao:
+                # Doses e população por ano e mês (todos os anos) da seleção geográfica, consultadas no cubo
+                # com a cobertura calculada sobre doses e população acumuladas no ano
+                with instrumentacao_secao.etapa('evolucao.dados') as etapa:
+                    # A série cobre todos os anos: o ano selecionado não entra na chave
+                    evolucao = cache_resultados.obter(
+                        CacheResultados.chave('evolucao.dados', versao_dados, None, regiao_selecionada,
+                                              uf_selecionado, municipio_selecionado, vacina=cobertura_evolucao),
+                        lambda: evolucao_mensal(
+                            cubo, cobertura_evolucao, regiao_selecionada, uf_selecionado, municipio_selecionado
+                        ),
+                    )
+                    etapa.saida(len(evolucao))
         
-        if len(df_evolucao) > 0 and 'NU_MES' in df_evolucao.columns and 'NU_ANO' in df_evolucao.columns:
-            # Agrupar por ano e mês
-            evolucao = df_evolucao.groupby(['NU_ANO', 'NU_MES']).agg({
-                'QT_DOSES': 'sum',
-                'QT_POPULACAO': 'sum'
-            }).reset_index()
-            
-            # Ordenar por ano e mês
-            evolucao = evolucao.sort_values(['NU_ANO', 'NU_MES'])
-            
-            # Calcular doses e população acumuladas POR ANO
-            evolucao['QT_DOSES_ACUMULADAS'] = evolucao.groupby('NU_ANO')['QT_DOSES'].cumsum()
-            evolucao['QT_POPULACAO_ACUMULADA'] = evolucao.groupby('NU_ANO')['QT_POPULACAO'].cumsum()
-            
-            # Calcular cobertura (doses acumuladas / população acumulada)
-            evolucao['COBERTURA'] = (evolucao['QT_DOSES_ACUMULADAS'] / evolucao['QT_POPULACAO_ACUMULADA']) * 100
+                if len(evolucao) > 0:
+                    # Criar nome do mês
+                    meses_nomes = {
+                        1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun',
+                        7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'
+                    }
+                    evolucao['MES_NOME'] = evolucao['NU_MES'].map(meses_nomes)
             
-            # Criar nome do mês
-            meses_nomes = {
-                1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun',
-                7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'
-            }
-            evolucao['MES_NOME'] = evolucao['NU_MES'].map(meses_nomes)
+                    # Criar coluna de ano como string para o gráfico
+                    evolucao['ANO_STR'] = evolucao['NU_ANO'].astype(str)
             
-            # Criar coluna de ano como string para o gráfico
-            evolucao['ANO_STR'] = evolucao['NU_ANO'].astype(str)
+                    # Ordem dos meses
+                    ordem_meses = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
             
-            # Ordem dos meses
-            ordem_meses = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+                    # Buscar meta da cobertura
+                    meta_evolucao = meta_cobertura(cobertura_evolucao)
             
-            # Buscar meta da cobertura
-            meta_evolucao = get_meta_cobertura(cobertura_evolucao)
+                    def construir_fig_evolucao():
+                        # Criar gráfico de linhas com uma linha para cada ano
+                        fig_evolucao = px.line(
+                            evolucao,
+                            x='MES_NOME',
+                            y='COBERTURA',
+                            color='ANO_STR',
+                            title=f'Evolução Mensal da Cobertura - {cobertura_evolucao} (Todos os Anos)',
+                            labels={'MES_NOME': 'Mês', 'COBERTURA': 'Cobertura (%)', 'ANO_STR': 'Ano'},
+                            markers=True,
+                            category_orders={'MES_NOME': ordem_meses}
+                        )
             
-            # Criar gráfico de linhas com uma linha para cada ano
-            fig_evolucao = px.line(
-                evolucao,
-                x='MES_NOME',
-                y='COBERTURA',
-                color='ANO_STR',
-                title=f'Evolução Mensal da Cobertura - {cobertura_evolucao} (Todos os Anos)',
-                labels={'MES_NOME': 'Mês', 'COBERTURA': 'Cobertura (%)', 'ANO_STR': 'Ano'},
-                markers=True,
-                category_orders={'MES_NOME': ordem_meses}
-            )
+                        # Adicionar linha horizontal da meta
+                        fig_evolucao.add_hline(
+                            y=meta_evolucao,
+                            line_dash="dash",
+                            line_color="red",
+                            annotation_text=f"Meta: {meta_evolucao:.1f}%",
+                            annotation_position="right"
+                        )
             
-            # Adicionar linha horizontal da meta
-            fig_evolucao.add_hline(
-                y=meta_evolucao,
-                line_dash="dash",
-                line_color="red",
-                annotation_text=f"Meta: {meta_evolucao:.1f}%",
-                annotation_position="right"
-            )
+                        # Configurar layout
+                        fig_evolucao.update_traces(
+                            line_width=3,
+                            marker=dict(size=8)
+                        )
             
-            # Configurar layout
-            fig_evolucao.update_traces(
-                line_width=3,
-                marker=dict(size=8)
-            )
+                        fig_evolucao.update_layout(
+                            height=500,
+                            xaxis_title='Mês',
+                            yaxis_title='Cobertura (%)',
+                            yaxis=dict(range=[0, max(110, meta_evolucao + 10)]),
+                            hovermode='x unified',
+                            showlegend=True,
+                            legend=dict(
+                                title="Ano",
+                                orientation="v",
+                                yanchor="top",
+                                y=1,
+                                xanchor="left",
+                                x=1.02
+                            )
+                        )
+                        return fig_evolucao
             
-            fig_evolucao.update_layout(
-                height=500,
-                xaxis_title='Mês',
-                yaxis_title='Cobertura (%)',
-                yaxis=dict(range=[0, max(110, meta_evolucao + 10)]),
-                hovermode='x unified',
-                showlegend=True,
-                legend=dict(
-                    title="Ano",
-                    orientation="v",
-                    yanchor="top",
-                    y=1,
-                    xanchor="left",
-                    x=1.02
-                )
-            )
+                    with instrumentacao_secao.etapa('evolucao.figura'):
+                        fig_evolucao = cache_figuras.obter(
+                            (evolucao, cobertura_evolucao, meta_evolucao), construir_fig_evolucao
+                        )
             
-            st.plotly_chart(fig_evolucao, width='stretch')
+                    with instrumentacao_secao.etapa('evolucao.plotly_chart'):
+                        st.plotly_chart(fig_evolucao, width='stretch')
             
-            # Mostrar estatísticas por ano
-            anos_presentes = sorted(evolucao['NU_ANO'].unique())
-            st.markdown("### 📊 Estatísticas por Ano")
-            cols = st.columns(len(anos_presentes))
-            for idx, ano in enumerate(anos_presentes):
-                dados_ano = evolucao[evolucao['NU_ANO'] == ano]
-                with cols[idx]:
-                    st.metric(f"Ano {ano}", f"{dados_ano['COBERTURA'].max():.2f}%".replace('.', ','), 
-                             help=f"Maior cobertura em {ano}")
+                    # Mostrar estatísticas por ano
+                    anos_presentes = sorted(evolucao['NU_ANO'].unique())
+                    st.markdown("### 📊 Estatísticas por Ano")
+                    cols = st.columns(len(anos_presentes))
+                    for idx, ano in enumerate(anos_presentes):
+                        dados_ano = evolucao[evolucao['NU_ANO'] == ano]
+                        with cols[idx]:
+                            st.metric(f"Ano {ano}", f"{dados_ano['COBERTURA'].max():.2f}%".replace('.', ','), 
+                                     help=f"Maior cobertura em {ano}")
             
-            # Demonstração do cálculo
-            st.markdown("---")
-            st.subheader("📋 Demonstração do Cálculo da Evolução Mensal")
+                    # Demonstração do cálculo
+                    st.markdown("---")
+                    st.subheader("📋 Demonstração do Cálculo da Evolução Mensal")
             
-            # Criar tabela com os cálculos incluindo o ano
-            tabela_calculo = evolucao[['NU_ANO', 'MES_NOME', 'QT_DOSES', 'QT_DOSES_ACUMULADAS', 'QT_POPULACAO', 'QT_POPULACAO_ACUMULADA', 'COBERTURA']].copy()
-            tabela_calculo['COBERTURA_FORMATADA'] = tabela_calculo['COBERTURA'].apply(lambda x: f"{x:.2f}%".replace('.', ','))
+                    # Criar tabela com os cálculos incluindo o ano
+                    tabela_calculo = evolucao[['NU_ANO', 'MES_NOME', 'QT_DOSES', 'QT_DOSES_ACUMULADAS', 'QT_POPULACAO', 'QT_POPULACAO_ACUMULADA', 'COBERTURA']].copy()
+                    tabela_calculo['COBERTURA_FORMATADA'] = tabela_calculo['COBERTURA'].apply(lambda x: f"{x:.2f}%".replace('.', ','))
             
-            # Formatar números no padrão brasileiro
-            tabela_calculo['QT_DOSES_FORMATADA'] = tabela_calculo['QT_DOSES'].apply(formatar_numero_br)
-            tabela_calculo['QT_DOSES_ACUMULADAS_FORMATADA'] = tabela_calculo['QT_DOSES_ACUMULADAS'].apply(formatar_numero_br)
-            tabela_calculo['QT_POPULACAO_FORMATADA'] = tabela_calculo['QT_POPULACAO'].apply(formatar_numero_br)
-            tabela_calculo['QT_POPULACAO_ACUMULADA_FORMATADA'] = tabela_calculo['QT_POPULACAO_ACUMULADA'].apply(formatar_numero_br)
+                    # Formatar números no padrão brasileiro
+                    tabela_calculo['QT_DOSES_FORMATADA'] = tabela_calculo['QT_DOSES'].apply(formatar_numero_br)
+                    tabela_calculo['QT_DOSES_ACUMULADAS_FORMATADA'] = tabela_calculo['QT_DOSES_ACUMULADAS'].apply(formatar_numero_br)
+                    tabela_calculo['QT_POPULACAO_FORMATADA'] = tabela_calculo['QT_POPULACAO'].apply(formatar_numero_br)
+                    tabela_calculo['QT_POPULACAO_ACUMULADA_FORMATADA'] = tabela_calculo['QT_POPULACAO_ACUMULADA'].apply(formatar_numero_br)
             
-            # Renomear colunas
-            tabela_calculo_display = tabela_calculo[['NU_ANO', 'MES_NOME', 'QT_DOSES_FORMATADA', 'QT_DOSES_ACUMULADAS_FORMATADA', 'QT_POPULACAO_FORMATADA', 'QT_POPULACAO_ACUMULADA_FORMATADA', 'COBERTURA_FORMATADA']].rename(
-                columns={
-                    'NU_ANO': 'Ano',
-                    'MES_NOME': 'Mês',
-                    'QT_DOSES_FORMATADA': 'Doses do Mês',
-                    'QT_DOSES_ACUMULADAS_FORMATADA': 'Doses Acumuladas',
-                    'QT_POPULACAO_FORMATADA': 'População do Mês',
-                    'QT_POPULACAO_ACUMULADA_FORMATADA': 'População Acumulada',
-                    'COBERTURA_FORMATADA': 'Cobertura (%)'
-                }
-            )
+                    # Renomear colunas
+                    tabela_calculo_display = tabela_calculo[['NU_ANO', 'MES_NOME', 'QT_DOSES_FORMATADA', 'QT_DOSES_ACUMULADAS_FORMATADA', 'QT_POPULACAO_FORMATADA', 'QT_POPULACAO_ACUMULADA_FORMATADA', 'COBERTURA_FORMATADA']].rename(
+                        columns={
+                            'NU_ANO': 'Ano',
+                            'MES_NOME': 'Mês',
+                            'QT_DOSES_FORMATADA': 'Doses do Mês',
+                            'QT_DOSES_ACUMULADAS_FORMATADA': 'Doses Acumuladas',
+                            'QT_POPULACAO_FORMATADA': 'População do Mês',
+                            'QT_POPULACAO_ACUMULADA_FORMATADA': 'População Acumulada',
+                            'COBERTURA_FORMATADA': 'Cobertura (%)'
+                        }
+                    )
             
-            st.dataframe(tabela_calculo_display, width='stretch', hide_index=True)
+                    st.dataframe(tabela_calculo_display, width='stretch', hide_index=True)
             
-            # Explicação do cálculo
-          #  st.info("""
-          #  **Como o cálculo é feito:**
+                    # Explicação do cálculo
+                  #  st.info("""
+                  #  **Como o cálculo é feito:**
             
-          #  - **Doses do Mês**: Quantidade de doses aplicadas no mês específico
-          #  - **Doses Acumuladas**: Soma cumulativa das doses (Janeiro + Fevereiro + Março + ...)
-          #  - **População do Mês**: População alvo do mês específico
-          #  - **População Acumulada**: Soma cumulativa da população (Janeiro + Fevereiro + Março + ...)
-          #  - **Cobertura (%)**: (Doses Acumuladas / População Acumulada) × 100
+                  #  - **Doses do Mês**: Quantidade de doses aplicadas no mês específico
+                  #  - **Doses Acumuladas**: Soma cumulativa das doses (Janeiro + Fevereiro + Março + ...)
+                  #  - **População do Mês**: População alvo do mês específico
+                  #  - **População Acumulada**: Soma cumulativa da população (Janeiro + Fevereiro + Março + ...)
+                  #  - **Cobertura (%)**: (Doses Acumuladas / População Acumulada) × 100
             
-          #  **Exemplos:**
-          #  - **Janeiro**: (Doses de Jan / População de Jan) × 100
-          #  - **Fevereiro**: (Doses de Jan + Fev / População de Jan + Fev) × 100
-          #  - **Março**: (Doses de Jan + Fev + Mar / População de Jan + Fev + Mar) × 100
-          #  """)
-        else:
-            st.warning("Não há dados mensais disponíveis para esta cobertura com os filtros aplicados.")
-    else:
-        st.info("Selecione uma cobertura para visualizar a evolução mensal.")
+                  #  **Exemplos:**
+                  #  - **Janeiro**: (Doses de Jan / População de Jan) × 100
+                  #  - **Fevereiro**: (Doses de Jan + Fev / População de Jan + Fev) × 100
+                  #  - **Março**: (Doses de Jan + Fev + Mar / População de Jan + Fev + Mar) × 100
+                  #  """)
+                else:
+                    st.warning("Não há dados mensais disponíveis para esta cobertura com os filtros aplicados.")
+            else:
+                st.info("Selecione uma cobertura para visualizar a evolução mensal.")
+        
+        secao_evolucao()
     
-    st.markdown("---")
+        st.markdown("---")
     
-    # Selecionar cobertura para visualizar
-    cobertura_grafico = st.selectbox(
-        "Selecione a cobertura vacinal",
-        coberturas_disponiveis,
-        key="select_cobertura_grafico"
-    )
+        # A vacina do gráfico por estado reexecuta só este fragmento
+        @st.fragment
+        def secao_barras():
+            instrumentacao_secao = instrumentacao_fragmento()
+            # Selecionar cobertura para visualizar
+            cobertura_grafico = st.selectbox(
+                "Selecione a cobertura vacinal",
+                coberturas_disponiveis,
+                key="select_cobertura_grafico"
+            )
     
-    if cobertura_grafico:
-        # Filtrar dados por cobertura selecionada
-        df_grafico = data_agrupado[data_agrupado['DS_COBERTURA'] == cobertura_grafico].copy()
+            if cobertura_grafico:
+                # Calcular cobertura por estado a partir do cubo
+                with instrumentacao_secao.etapa('barras.dados') as etapa:
+                    cobertura_por_estado = cache_resultados.obter(
+                        CacheResultados.chave('barras.dados', versao_dados, ano_selecionado, regiao_selecionada,
+                                              uf_selecionado, municipio_selecionado, vacina=cobertura_grafico),
+                        lambda: cobertura_por_uf(
+                            cubo, ano_selecionado, cobertura_grafico,
+                            regiao_selecionada, uf_selecionado, municipio_selecionado
+                        ),
+                    )
+                    etapa.saida(len(cobertura_por_estado))
         
-        if len(df_grafico) > 0 and 'sg_uf' in df_grafico.columns:
-            # Calcular cobertura por estado
-            cobertura_por_estado = df_grafico.groupby('sg_uf').agg({
-                'QT_DOSES': 'sum',
-                'QT_POPULACAO': 'sum'
-            }).reset_index()
+                if len(cobertura_por_estado) > 0:
+                    # Ordenar por cobertura crescente (para exibir melhor no gráfico vertical)
+                    cobertura_por_estado = cobertura_por_estado.sort_values('COBERTURA', ascending=False)
             
-            cobertura_por_estado['COBERTURA'] = (
-                cobertura_por_estado['QT_DOSES'] / cobertura_por_estado['QT_POPULACAO']
-            ) * 100
+                    # Buscar meta da cobertura
+                    meta_valor = meta_cobertura(cobertura_grafico)
             
-            # Ordenar por cobertura crescente (para exibir melhor no gráfico vertical)
-            cobertura_por_estado = cobertura_por_estado.sort_values('COBERTURA', ascending=False)
+                    def construir_fig_barras():
+                        # Criar gráfico de barras verticais
+                        fig = px.bar(
+                            cobertura_por_estado,
+                            x='sg_uf',
+                            y='COBERTURA',
+                            title=f'Cobertura de {cobertura_grafico} por Estado',
+                            labels={'COBERTURA': 'Cobertura (%)', 'sg_uf': 'Estado'},
+                            text='COBERTURA',
+                            color='COBERTURA',
+                            color_continuous_scale=[
+                                [0, '#790E18'],      # Rubi para 0%
+                                [0.2, '#ff4444'],    # Vermelho para 20%
+                                [0.4, '#ff9900'],    # Laranja para 40%
+                                [0.6, '#ffdd00'],    # Amarelo para 60%
+                                [0.8, '#44dd44'],    # Verde para 80%
+                                [meta_valor/100, '#000099'],  # Azul na meta
+                                [1, '#000099']       # Azul acima da meta
+                            ],
+                            range_color=[0, 100]
+                        )
             
-            # Buscar meta da cobertura
-            meta_valor = get_meta_cobertura(cobertura_grafico)
+                        # Adicionar linha horizontal da meta
+                        fig.add_hline(
+                            y=meta_valor,
+                            line_dash="dash",
+                            line_color="red",
+                            annotation_text=f"Meta: {f'{meta_valor:.1f}'.replace('.', ',')}%",
+                            annotation_position="top right"
+                        )
             
-            # Criar gráfico de barras verticais
-            fig = px.bar(
-                cobertura_por_estado,
-                x='sg_uf',
-                y='COBERTURA',
-                title=f'Cobertura de {cobertura_grafico} por Estado',
-                labels={'COBERTURA': 'Cobertura (%)', 'sg_uf': 'Estado'},
-                text='COBERTURA',
-                color='COBERTURA',
-                color_continuous_scale=[
-                    [0, '#790E18'],      # Rubi para 0%
-                    [0.2, '#ff4444'],    # Vermelho para 20%
-                    [0.4, '#ff9900'],    # Laranja para 40%
-                    [0.6, '#ffdd00'],    # Amarelo para 60%
-                    [0.8, '#44dd44'],    # Verde para 80%
-                    [meta_valor/100, '#000099'],  # Azul na meta
-                    [1, '#000099']       # Azul acima da meta
-                ],
-                range_color=[0, 100]
-            )
+                        # Formatar texto nas barras
+                        fig.update_traces(
+                            texttemplate='%{text:.2f}%',
+                            textposition='outside',
+                            textfont_size=10
+                        )
             
-            # Adicionar linha horizontal da meta
-            fig.add_hline(
-                y=meta_valor,
-                line_dash="dash",
-                line_color="red",
-                annotation_text=f"Meta: {f'{meta_valor:.1f}'.replace('.', ',')}%",
-                annotation_position="top right"
-            )
+                        # Configurar layout
+                        fig.update_layout(
+                            height=600,
+                            showlegend=False,
+                            xaxis=dict(
+                                title='Estado'
+                            ),
+                            yaxis=dict(
+                                title='Cobertura (%)',
+                                range=[0, max(105, meta_valor + 10)]
+                            )
+                        )
+                        return fig
             
-            # Formatar texto nas barras
-            fig.update_traces(
-                texttemplate='%{text:.2f}%',
-                textposition='outside',
-                textfont_size=10
-            )
+                    with instrumentacao_secao.etapa('barras.figura'):
+                        fig = cache_figuras.obter(
+                            (cobertura_por_estado, cobertura_grafico, meta_valor), construir_fig_barras
+                        )
             
-            # Configurar layout
-            fig.update_layout(
-                height=600,
-                showlegend=False,
-                xaxis=dict(
-                    title='Estado'
-                ),
-                yaxis=dict(
-                    title='Cobertura (%)',
-                    range=[0, max(105, meta_valor + 10)]
-                )
-            )
-            
-            st.plotly_chart(fig, width='stretch')
+                    with instrumentacao_secao.etapa('barras.plotly_chart'):
+                        st.plotly_chart(fig, width='stretch')
             
-            st.markdown("---")
+                    st.markdown("---")
             
-            # Mostrar estatísticas
-            col1, col2, col3 = st.columns(3)
+                    # Mostrar estatísticas
+                    col1, col2, col3 = st.columns(3)
             
-            with col1:
-                st.metric("Maior Cobertura", f"{cobertura_por_estado['COBERTURA'].max():.2f}%".replace('.', ','))
+                    with col1:
+                        st.metric("Maior Cobertura", f"{cobertura_por_estado['COBERTURA'].max():.2f}%".replace('.', ','))
             
-            with col2:
-                st.metric("Menor Cobertura", f"{cobertura_por_estado['COBERTURA'].min():.2f}%".replace('.', ','))
+                    with col2:
+                        st.metric("Menor Cobertura", f"{cobertura_por_estado['COBERTURA'].min():.2f}%".replace('.', ','))
             
-            with col3:
-                estados_acima_meta = len(cobertura_por_estado[cobertura_por_estado['COBERTURA'] > meta_valor])
-                st.metric("Estados Acima da Meta", f"{estados_acima_meta} de {len(cobertura_por_estado)}")
+                    with col3:
+                        estados_acima_meta = len(cobertura_por_estado[cobertura_por_estado['COBERTURA'] > meta_valor])
+                        st.metric("Estados Acima da Meta", f"{estados_acima_meta} de {len(cobertura_por_estado)}")
             
-            # Mostrar tabela de dados
-            st.subheader("Dados por Estado")
-            cobertura_display = cobertura_por_estado.copy()
-            cobertura_display['COBERTURA'] = cobertura_display['COBERTURA'].apply(
-                lambda x: f"{x:.2f}%".replace('.', ',')
-            )
-            cobertura_display['QT_DOSES_FORMATADA'] = cobertura_display['QT_DOSES'].apply(formatar_numero_br)
-            cobertura_display['QT_POPULACAO_FORMATADA'] = cobertura_display['QT_POPULACAO'].apply(formatar_numero_br)
-            cobertura_display = cobertura_display.sort_values('sg_uf')
-            st.dataframe(
-                cobertura_display[['sg_uf', 'QT_DOSES_FORMATADA', 'QT_POPULACAO_FORMATADA', 'COBERTURA']].rename(
-                    columns={
-                        'sg_uf': 'Estado',
-                        'QT_DOSES_FORMATADA': 'Doses Aplicadas',
-                        'QT_POPULACAO_FORMATADA': 'População',
-                        'COBERTURA': 'Cobertura'
-                    }
-                ),
-                width='stretch',
-                hide_index=True
-            )
-        else:
-            st.warning("Não há dados disponíveis para esta cobertura com os filtros aplicados.")
-
-
+                    # Mostrar tabela de dados
+                    st.subheader("Dados por Estado")
+                    cobertura_display = cobertura_por_estado.copy()
+                    cobertura_display['COBERTURA'] = cobertura_display['COBERTURA'].apply(
+                        lambda x: f"{x:.2f}%".replace('.', ',')
+                    )
+                    cobertura_display['QT_DOSES_FORMATADA'] = cobertura_display['QT_DOSES'].apply(formatar_numero_br)
+                    cobertura_display['QT_POPULACAO_FORMATADA'] = cobertura_display['QT_POPULACAO'].apply(formatar_numero_br)
+                    cobertura_display = cobertura_display.sort_values('sg_uf')
+                    st.dataframe(
+                        cobertura_display[['sg_uf', 'QT_DOSES_FORMATADA', 'QT_POPULACAO_FORMATADA', 'COBERTURA']].rename(
+                            columns={
+                                'sg_uf': 'Estado',
+                                'QT_DOSES_FORMATADA': 'Doses Aplicadas',
+                                'QT_POPULACAO_FORMATADA': 'População',
+                                'COBERTURA': 'Cobertura'
+                            }
+                        ),
+                        width='stretch',
+                        hide_index=True
+                    )
+                else:
+                    st.warning("Não há dados disponíveis para esta cobertura com os filtros aplicados.")
+        
+        secao_barras()
 
+# Painel de depuração com as medições deste rerun (as etapas também vão para o log)
+if instrumentacao.ativo:
+    # Memória incremental da sessão: resultados que a página monta neste rerun (posições da seleção,
+    # totais e resumo) e session_state, sem os dados compartilhados
+    objetos_sessao = {'totais_coberturas': totais_coberturas, 'posicoes_selecao': posicoes_selecao}
+    if aba1.open is not False:
+        objetos_sessao['resumo'] = resumo
+    objetos_sessao.update({f"session_state.{chave}": valor for chave, valor in st.session_state.items()})
+    instrumentacao.registrar_sessao(objetos_sessao, [data_ano, *cubo.values()])
+    estatisticas_cache = cache_resultados.estatisticas()
+    instrumentacao.registrar_evento('dpni.cache', **estatisticas_cache)
+    estatisticas_figuras = cache_figuras.estatisticas()
+    instrumentacao.registrar_evento('dpni.cache_figuras', **estatisticas_figuras)
+    with st.sidebar.expander("Instrumentação", expanded=False):
+        # As seções das abas (aba.*) incluem as etapas internas (mapa.*, tabelas.* ...)
+        st.caption(f"Execução {instrumentacao.execucao}")
+        st.dataframe(instrumentacao.tabela(), width='stretch', hide_index=True)
+        st.metric("Memória da sessão", f"{instrumentacao.memoria_sessao['memoria_sessao_mb']:.2f} MB",
+                  help="Resultados deste rerun e session_state, sem os dados compartilhados entre sessões")
+        st.caption("Cache de resultados (processo)")
+        st.dataframe(pd.Series(estatisticas_cache, name='valor').rename_axis('contador').reset_index(),
+                     width='stretch', hide_index=True)
+        st.caption("Cache de figuras (processo)")
+        st.dataframe(pd.Series(estatisticas_figuras, name='valor').rename_axis('contador').reset_index(),
+                     width='stretch', hide_index=True)
 
+# Fim do rerun completo: fragmentos rerodados sozinhos depois daqui medem à parte
+instrumentacao.encerrar()
@@ -0,0 +1 @@
+"""Processamento dos dados de cobertura vacinal do DPNI usado pelo Dashboard."""
@@ -0,0 +1,242 @@
+"""Armazenamento colunar particionado (Parquet ou Arrow IPC) dos dados agregados.
+
+A ingestão converte o extrato de residência, já agregado e enriquecido com os
+CSVs de municípios e estados, em um dataset particionado por NU_ANO e CO_UF
+(layout hive: NU_ANO=2025/CO_UF=35/...). A leitura usa projeção de colunas e
+poda de partições, e no formato Arrow IPC os arquivos são mapeados em memória.
+
+Uso: python -m dpni.armazenamento [--destino DIR] [--formato parquet|arrow] [--memoria-maxima 2GB]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+from dpni.carga import (
+    ARQUIVO_ESTADOS,
+    ARQUIVO_MUNICIPIOS,
+    ARQUIVO_RESIDENCIA,
+    COLUNAS_AGRUPAMENTO,
+    assinatura_arquivos,
+    carregar_dados_agrupados,
+)
+from dpni.cubo import construir_cubo, gravar_cubo, ler_cubo
+from dpni.esquema import aplicar_esquema
+
+DIRETORIO_ARMAZENAMENTO = "dados/residencia_colunar"
+ARQUIVO_MANIFESTO = "_manifesto.json"
+ARQUIVO_CUBO = "_cubo.parquet"
+# Incrementar quando o conteúdo gravado mudar, para forçar a reconstrução
+VERSAO_ARMAZENAMENTO = 5
+COLUNAS_PARTICAO = ['NU_ANO', 'CO_UF']
+FORMATOS = {'parquet': 'parquet', 'arrow': 'ipc'}
+
+
+def _particionamento():
+    esquema = pa.schema([('NU_ANO', pa.int16()), ('CO_UF', pa.int8())])
+    return ds.partitioning(esquema, flavor='hive')
+
+
+def caminho_manifesto(destino=DIRETORIO_ARMAZENAMENTO):
+    return os.path.join(destino, ARQUIVO_MANIFESTO)
+
+
+def ler_manifesto(destino=DIRETORIO_ARMAZENAMENTO):
+    """Retorna o manifesto do armazenamento ou None se ele ainda não foi construído"""
+    try:
+        with open(caminho_manifesto(destino), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def _gravar_manifesto(destino, manifesto):
+    temporario = caminho_manifesto(destino) + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=1)
+    os.replace(temporario, caminho_manifesto(destino))
+
+
+def _substituir_diretorio(temporario, destino):
+    """Troca o diretório de destino pelo recém-construído com o menor intervalo possível"""
+    antigo = destino + '.antigo'
+    shutil.rmtree(antigo, ignore_errors=True)
+    if os.path.exists(destino):
+        os.replace(destino, antigo)
+    os.replace(temporario, destino)
+    shutil.rmtree(antigo, ignore_errors=True)
+
+
+def gravar_armazenamento(data_agrupado, destino=DIRETORIO_ARMAZENAMENTO, formato='parquet', origem=()):
+    """Grava o DataFrame agregado e enriquecido como dataset particionado e retorna o manifesto"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}. Use um de {sorted(FORMATOS)}")
+    faltando = [col for col in COLUNAS_AGRUPAMENTO + COLUNAS_PARTICAO if col not in data_agrupado.columns]
+    if faltando:
+        raise ValueError(f"Colunas ausentes para o armazenamento: {faltando}")
+
+    data_agrupado = aplicar_esquema(data_agrupado)
+    tabela = pa.Table.from_pandas(data_agrupado, preserve_index=False)
+    temporario = destino + '.construindo'
+    shutil.rmtree(temporario, ignore_errors=True)
+    ds.write_dataset(
+        tabela,
+        temporario,
+        format=FORMATOS[formato],
+        partitioning=_particionamento(),
+        existing_data_behavior='overwrite_or_ignore',
+    )
+    gravar_cubo(construir_cubo(data_agrupado), os.path.join(temporario, ARQUIVO_CUBO))
+
+    particoes = (
+        data_agrupado[COLUNAS_PARTICAO].drop_duplicates()
+        .sort_values(COLUNAS_PARTICAO).values.tolist()
+    )
+    manifesto = {
+        'versao': VERSAO_ARMAZENAMENTO,
+        'formato': formato,
+        'colunas': data_agrupado.columns.tolist(),
+        'anos': sorted(int(ano) for ano in data_agrupado['NU_ANO'].unique()),
+        'particoes': [[int(ano), int(uf)] for ano, uf in particoes],
+        'origem': [list(item) for item in origem],
+        'construido_em': time.time(),
+    }
+    _gravar_manifesto(temporario, manifesto)
+    _substituir_diretorio(temporario, destino)
+    return manifesto
+
+
+def construir_armazenamento(destino=DIRETORIO_ARMAZENAMENTO, formato='parquet',
+                            caminho_residencia=ARQUIVO_RESIDENCIA,
+                            caminho_municipios=ARQUIVO_MUNICIPIOS,
+                            caminho_estados=ARQUIVO_ESTADOS,
+                            memoria_maxima=None):
+    """Ingestão completa: lê o ZIP, agrega, enriquece e grava o dataset colunar.
+
+    memoria_maxima ativa a agregação em blocos (ver dpni.carga.agregar_dados_em_blocos).
+    """
+    origem = assinatura_arquivos(caminho_residencia, caminho_municipios, caminho_estados)
+    data_agrupado, _ = carregar_dados_agrupados(caminho_residencia, caminho_municipios, caminho_estados, memoria_maxima)
+    return gravar_armazenamento(data_agrupado, destino, formato, origem)
+
+
+def armazenamento_atualizado(manifesto, origem):
+    """Indica se o manifesto foi construído a partir dos mesmos arquivos (pelo hash do conteúdo)"""
+    if manifesto is None or manifesto.get('versao') != VERSAO_ARMAZENAMENTO:
+        return False
+    return [item[3] for item in manifesto.get('origem', [])] == [item[3] for item in origem]
+
+
+def assinatura_armazenamento(destino=DIRETORIO_ARMAZENAMENTO, caminho_residencia=ARQUIVO_RESIDENCIA,
+                             caminho_municipios=ARQUIVO_MUNICIPIOS, caminho_estados=ARQUIVO_ESTADOS):
+    """Chave barata (stat) que muda quando os arquivos de origem ou o manifesto mudam"""
+    origem = ()
+    if os.path.exists(caminho_residencia):
+        origem = assinatura_arquivos(caminho_residencia, caminho_municipios, caminho_estados)
+    try:
+        versao_manifesto = os.stat(caminho_manifesto(destino)).st_mtime_ns
+    except FileNotFoundError:
+        versao_manifesto = None
+    return origem, versao_manifesto
+
+
+def garantir_armazenamento(destino=DIRETORIO_ARMAZENAMENTO, formato='parquet',
+                           caminho_residencia=ARQUIVO_RESIDENCIA,
+                           caminho_municipios=ARQUIVO_MUNICIPIOS,
+                           caminho_estados=ARQUIVO_ESTADOS, memoria_maxima=None):
+    """Retorna o manifesto, reconstruindo o armazenamento se o extrato de origem mudou.
+
+    Sem o ZIP de origem, usa o armazenamento existente (por exemplo, gerado em outra máquina).
+    """
+    manifesto = ler_manifesto(destino)
+    if os.path.exists(caminho_residencia):
+        origem = assinatura_arquivos(caminho_residencia, caminho_municipios, caminho_estados)
+        if not armazenamento_atualizado(manifesto, origem):
+            formato = manifesto['formato'] if manifesto else formato
+            manifesto = construir_armazenamento(destino, formato, caminho_residencia, caminho_municipios,
+                                                caminho_estados, memoria_maxima)
+    elif manifesto is None:
+        raise FileNotFoundError(f"Nem {caminho_residencia} nem o armazenamento em {destino} foram encontrados")
+    return manifesto
+
+
+def carregar_cubo(destino=DIRETORIO_ARMAZENAMENTO):
+    """Lê o cubo pré-agregado materializado na ingestão (ver dpni.cubo)"""
+    return ler_cubo(os.path.join(destino, ARQUIVO_CUBO))
+
+
+def abrir_armazenamento(destino=DIRETORIO_ARMAZENAMENTO, memory_map=None):
+    """Abre o dataset particionado. Por padrão o formato Arrow IPC é mapeado em memória"""
+    manifesto = ler_manifesto(destino)
+    if manifesto is None:
+        raise FileNotFoundError(f"Armazenamento colunar não encontrado em {destino}")
+    formato = manifesto['formato']
+    if memory_map is None:
+        memory_map = formato == 'arrow'
+    return ds.dataset(
+        destino,
+        format=FORMATOS[formato],
+        partitioning=_particionamento(),
+        filesystem=pafs.LocalFileSystem(use_mmap=memory_map),
+        exclude_invalid_files=False,
+        ignore_prefixes=['_', '.'],
+    )
+
+
+def ler_armazenamento(destino=DIRETORIO_ARMAZENAMENTO, colunas=None, anos=None, ufs=None,
+                      filtros=None, memory_map=None, ordenar=True):
+    """Lê o dataset com projeção de colunas e poda de partições.
+
+    anos e ufs restringem as partições lidas; filtros é um dict {coluna: valor ou lista}
+    aplicado às demais colunas. Com ordenar=True as linhas voltam na mesma ordem do
+    agrupamento em memória (COLUNAS_AGRUPAMENTO).
+    """
+    dataset = abrir_armazenamento(destino, memory_map)
+    manifesto = ler_manifesto(destino)
+    colunas = list(colunas) if colunas is not None else manifesto['colunas']
+
+    expressao = None
+    condicoes = dict(filtros or {})
+    if anos is not None:
+        condicoes['NU_ANO'] = [int(ano) for ano in anos]
+    if ufs is not None:
+        condicoes['CO_UF'] = [int(uf) for uf in ufs]
+    for coluna, valor in condicoes.items():
+        valores = valor if isinstance(valor, (list, tuple, set)) else [valor]
+        condicao = ds.field(coluna).isin(list(valores))
+        expressao = condicao if expressao is None else expressao & condicao
+
+    colunas_ordem = [col for col in COLUNAS_AGRUPAMENTO if col in colunas] if ordenar else []
+    colunas_lidas = colunas + [col for col in colunas_ordem if col not in colunas]
+    data = aplicar_esquema(dataset.to_table(columns=colunas_lidas, filter=expressao).to_pandas())
+    if colunas_ordem:
+        # As categorias estão em ordem alfabética, então ordenar pelos códigos equivale a ordenar as strings
+        data = data.sort_values(colunas_ordem, kind='stable', ignore_index=True)
+    return data[colunas]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Converte o extrato de residência em armazenamento colunar particionado")
+    parser.add_argument('--residencia', default=ARQUIVO_RESIDENCIA)
+    parser.add_argument('--municipios', default=ARQUIVO_MUNICIPIOS)
+    parser.add_argument('--estados', default=ARQUIVO_ESTADOS)
+    parser.add_argument('--destino', default=DIRETORIO_ARMAZENAMENTO)
+    parser.add_argument('--formato', choices=sorted(FORMATOS), default='parquet')
+    parser.add_argument('--memoria-maxima', default=None,
+                        help="agrega o extrato em blocos sem passar deste teto (ex.: 512MB, 2GB)")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    manifesto = construir_armazenamento(args.destino, args.formato, args.residencia, args.municipios,
+                                        args.estados, args.memoria_maxima)
+    print(f"{len(manifesto['particoes'])} partições gravadas em {args.destino} "
+          f"({manifesto['formato']}) em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
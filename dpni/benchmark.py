@@ -0,0 +1,175 @@
+"""Benchmark das etapas do pipeline do Dashboard sobre um extrato (real ou sintético).
+
+Cada etapa é cronometrada isoladamente (melhor de N repetições) e medida em
+memória com tracemalloc (pico alocado durante uma execução à parte): leitura do
+CSV, agregação, enriquecimento, ingestão colunar, leitura do ano, índice de
+filtros, cadeia de filtros, cards, e preparo dos dados do mapa, da evolução e do
+gráfico de barras. Os resultados podem ser acumulados em um CSV de histórico,
+comparado com a execução anterior da mesma escala para acompanhar regressões.
+
+Uso: python -m dpni.benchmark [--residencia dados/residencia.zip | --municipios 500 --anos 2024 2025]
+                              [--repeticoes 3] [--historico benchmark.csv] [--rotulo v1.2]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from dpni.armazenamento import carregar_cubo, gravar_armazenamento, ler_armazenamento
+from dpni.carga import (
+    ARQUIVO_ESTADOS,
+    ARQUIVO_MUNICIPIOS,
+    agregar_dados,
+    carregar_geografia,
+    enriquecer_dados,
+    ler_residencia,
+)
+from dpni.esquema import aplicar_esquema
+from dpni.indice import IndiceFiltros
+from dpni.motor import coberturas_selecao, cobertura_por_uf, evolucao_mensal, filtrar_dados
+from dpni.sintetico import gerar_residencia
+
+COLUNAS_RESULTADO = ['rotulo', 'executado_em', 'escala', 'etapa', 'segundos', 'pico_memoria_mb', 'linhas']
+
+
+def medir(funcao, repeticoes=3):
+    """(resultado, melhor tempo em segundos, pico de memória em MB) de funcao()"""
+    tempos = []
+    for _ in range(max(1, repeticoes)):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    # Memória medida em uma execução separada: o tracemalloc deixa o código mais lento
+    tracemalloc.start()
+    try:
+        funcao()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return resultado, min(tempos), pico / (1 << 20)
+
+
+def _selecoes(data_ano):
+    """Seleções típicas do Dashboard: Brasil, uma região, uma UF e um município dessa UF"""
+    selecoes = [('Todas', 'Todos', 'Todos')]
+    regioes = data_ano['REGIAO'].dropna()
+    if len(regioes):
+        regiao = regioes.iloc[0]
+        selecoes.append((regiao, 'Todos', 'Todos'))
+        linha = data_ano[data_ano['REGIAO'] == regiao].dropna(subset=['sg_uf', 'no_municipio']).head(1)
+        if len(linha):
+            uf, municipio = linha['sg_uf'].iloc[0], linha['no_municipio'].iloc[0]
+            selecoes += [(regiao, uf, 'Todos'), (regiao, uf, municipio)]
+    return selecoes
+
+
+def executar_benchmark(caminho_residencia, caminho_municipios=ARQUIVO_MUNICIPIOS,
+                       caminho_estados=ARQUIVO_ESTADOS, repeticoes=3):
+    """Mede cada etapa e retorna uma lista de dicionários {etapa, segundos, pico_memoria_mb, linhas}"""
+    resultados = []
+
+    def etapa(nome, funcao, linhas=len):
+        resultado, segundos, pico = medir(funcao, repeticoes)
+        resultados.append({'etapa': nome, 'segundos': segundos, 'pico_memoria_mb': pico,
+                           'linhas': linhas(resultado)})
+        print(f"{nome:<22} {segundos:>9.4f}s {pico:>10.1f} MB")
+        return resultado
+
+    data = etapa('leitura_csv', lambda: ler_residencia(caminho_residencia))
+    data_agrupado = etapa('agregacao', lambda: agregar_dados(data))
+    geografia = carregar_geografia(caminho_municipios, caminho_estados)
+    data_agrupado = etapa('enriquecimento',
+                          lambda: aplicar_esquema(enriquecer_dados(data_agrupado, geografia)))
+    del data
+
+    with tempfile.TemporaryDirectory() as destino:
+        manifesto = etapa('ingestao_colunar', lambda: gravar_armazenamento(data_agrupado, destino),
+                          linhas=lambda manifesto: len(manifesto['particoes']))
+        ano = manifesto['anos'][-1]
+        cubo = carregar_cubo(destino)
+        data_ano = etapa('leitura_ano', lambda: ler_armazenamento(destino, anos=[ano]))
+
+    indice = etapa('indice_filtros', lambda: IndiceFiltros(data_ano), linhas=lambda indice: indice.total)
+    selecoes = _selecoes(data_ano)
+    coberturas = sorted(data_ano['DS_COBERTURA'].dropna().unique())
+    total = lambda partes: sum(len(parte) for parte in partes)
+
+    etapa('cadeia_filtros', lambda: [filtrar_dados(data_ano, indice, *selecao, descricao)
+                                     for selecao in selecoes for descricao in ['Todos'] + coberturas[:1]],
+          linhas=total)
+    etapa('cards', lambda: [coberturas_selecao(cubo, ano, *selecao) for selecao in selecoes], linhas=total)
+
+    def dados_mapa():
+        partes = []
+        for cobertura in coberturas:
+            por_uf = cobertura_por_uf(cubo, ano, cobertura)
+            por_uf['COBERTURA'] = por_uf['COBERTURA'].round(2)
+            por_uf['no_uf'] = por_uf['sg_uf'].map(geografia.nome_uf_por_sigla)
+            partes.append(por_uf)
+        return partes
+
+    etapa('mapa', dados_mapa, linhas=total)
+    etapa('evolucao', lambda: [evolucao_mensal(cubo, cobertura, *selecao)
+                               for selecao in selecoes for cobertura in coberturas], linhas=total)
+    etapa('barras', lambda: [cobertura_por_uf(cubo, ano, cobertura, *selecao).sort_values('COBERTURA', ascending=False)
+                             for selecao in selecoes for cobertura in coberturas], linhas=total)
+    return resultados
+
+
+def comparar_com_anterior(historico, atual):
+    """Imprime a razão de tempo de cada etapa em relação à última execução da mesma escala no histórico"""
+    anteriores = historico[(historico['escala'] == atual['escala'].iloc[0])
+                           & (historico['executado_em'] != atual['executado_em'].iloc[0])]
+    if anteriores.empty:
+        return
+    ultima = anteriores[anteriores['executado_em'] == anteriores['executado_em'].max()].set_index('etapa')
+    print(f"\nComparação com {ultima['rotulo'].iloc[0]} ({ultima['executado_em'].iloc[0]}):")
+    for _, linha in atual.iterrows():
+        if linha['etapa'] in ultima.index:
+            razao = linha['segundos'] / max(ultima.loc[linha['etapa'], 'segundos'], 1e-9)
+            print(f"{linha['etapa']:<22} {razao:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cronometra e mede a memória de cada etapa do pipeline")
+    parser.add_argument('--residencia', default=None, help="extrato a medir; sem ele, um sintético é gerado")
+    parser.add_argument('--municipios', type=int, default=None, help="municípios do extrato sintético (padrão: todos)")
+    parser.add_argument('--anos', type=int, nargs='+', default=[2024, 2025])
+    parser.add_argument('--arquivo-municipios', default=ARQUIVO_MUNICIPIOS)
+    parser.add_argument('--arquivo-estados', default=ARQUIVO_ESTADOS)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--historico', default=None, help="CSV onde os resultados são acumulados")
+    parser.add_argument('--rotulo', default='', help="identificação da execução (versão, commit...)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporario:
+        caminho = args.residencia
+        if caminho is None:
+            caminho = os.path.join(temporario, 'residencia.zip')
+            linhas = gerar_residencia(caminho, args.anos, args.arquivo_municipios, args.municipios)
+            escala = f"sintetico:{args.municipios or 'todos'}x{len(args.anos)}anos"
+            print(f"Extrato sintético com {linhas:,} linhas\n")
+        else:
+            escala = os.path.basename(caminho)
+        resultados = executar_benchmark(caminho, args.arquivo_municipios, args.arquivo_estados, args.repeticoes)
+
+    atual = pd.DataFrame(resultados)
+    atual.insert(0, 'escala', escala)
+    atual.insert(0, 'executado_em', datetime.now().isoformat(timespec='seconds'))
+    atual.insert(0, 'rotulo', args.rotulo)
+    atual = atual[COLUNAS_RESULTADO]
+    if args.historico:
+        if os.path.exists(args.historico):
+            historico = pd.concat([pd.read_csv(args.historico, keep_default_na=False), atual], ignore_index=True)
+            comparar_com_anterior(historico, atual)
+        else:
+            historico = atual
+        historico.to_csv(args.historico, index=False)
+
+
+if __name__ == '__main__':
+    main()
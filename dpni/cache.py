@@ -0,0 +1,287 @@
+"""Cache de resultados em dois níveis (memória e disco) para as combinações de filtros.
+
+Os resultados de cada seção do Dashboard (resumo dos cards, tabela do mapa, série
+da evolução, barras por UF) são guardados pela chave (seção, versão dos dados, ano,
+região, UF, município, cobertura, vacina do widget). O nível em memória é um LRU
+limitado pelo tamanho dos resultados em bytes; o nível em disco guarda cada
+resultado em um arquivo e sobrevive a reinícios, também limitado em bytes (saem
+primeiro os arquivos usados há mais tempo). Como a versão dos dados faz parte da
+chave, uma nova ingestão nunca devolve resultados antigos: eles só deixam de ser
+pedidos e saem pelos limites.
+
+O nível em disco é opcional e vem desligado: liga com DPNI_CACHE_RESULTADOS
+apontando para um diretório (por exemplo dados/cache_resultados). Os arquivos são
+pickles do pandas, e ler um pickle executa código: o diretório deve pertencer só a
+este aplicativo, sem escrita por outros usuários. Cada falha também grava o
+resultado em disco, o que só compensa para seções de cálculo caro.
+
+O CacheFiguras guarda o JSON das figuras Plotly pelo hash das suas entradas
+(dados e parâmetros): um rerun que não muda as entradas de um gráfico não paga
+de novo a montagem e a validação da figura.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from dpni.esquema import memoria_em_bytes
+
+VARIAVEL_CACHE_RESULTADOS = "DPNI_CACHE_RESULTADOS"
+MAXIMO_BYTES_MEMORIA = 64 << 20
+MAXIMO_BYTES_DISCO = 512 << 20
+MAXIMO_BYTES_FIGURAS = 128 << 20
+# Ao passar do limite do disco, apaga até ficar nesta fração dele
+FRACAO_APOS_LIMPEZA = 0.9
+
+
+def diretorio_cache_configurado():
+    """Diretório do nível em disco indicado pela variável de ambiente (None, o padrão, desliga o disco)"""
+    return os.environ.get(VARIAVEL_CACHE_RESULTADOS) or None
+
+
+def _tamanho(valor):
+    """Bytes ocupados pelo resultado"""
+    if isinstance(valor, pd.DataFrame):
+        return memoria_em_bytes(valor)
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    return len(pickle.dumps(valor))
+
+
+def _copia(valor):
+    """Cópia entregue a quem pediu, para que alterações dela não cheguem ao cache"""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy()
+    return valor
+
+
+class CacheResultados:
+    """LRU em memória, limitado em bytes, com um segundo nível opcional em disco"""
+
+    def __init__(self, diretorio=None, maximo_bytes_memoria=MAXIMO_BYTES_MEMORIA,
+                 maximo_bytes_disco=MAXIMO_BYTES_DISCO):
+        self.diretorio = diretorio
+        self.maximo_bytes_memoria = maximo_bytes_memoria
+        self.maximo_bytes_disco = maximo_bytes_disco
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self._trava = threading.Lock()
+        self.contadores = {
+            'acertos_memoria': 0,
+            'acertos_disco': 0,
+            'falhas': 0,
+            'despejos_memoria': 0,
+            'despejos_disco': 0,
+        }
+        self._bytes_disco = 0
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+            self._bytes_disco = sum(entrada.stat().st_size for entrada in self._arquivos_disco())
+
+    @staticmethod
+    def chave(secao, versao, ano=None, regiao=None, uf=None, municipio=None, descricao=None, vacina=None):
+        """Chave de um resultado; dimensões que a seção não usa ficam None"""
+        return (secao, versao, ano, regiao, uf, municipio, descricao, vacina)
+
+    def obter(self, chave, calcular):
+        """Resultado da chave, da memória, do disco ou de calcular() (nessa ordem)"""
+        with self._trava:
+            entrada = self._memoria.get(chave)
+            if entrada is not None:
+                self._memoria.move_to_end(chave)
+                self.contadores['acertos_memoria'] += 1
+                return _copia(entrada[0])
+
+        valor = self._ler_disco(chave)
+        if valor is not None:
+            with self._trava:
+                self.contadores['acertos_disco'] += 1
+        else:
+            valor = calcular()
+            with self._trava:
+                self.contadores['falhas'] += 1
+            self._gravar_disco(chave, valor)
+        self._guardar_memoria(chave, valor)
+        return _copia(valor)
+
+    def _guardar_memoria(self, chave, valor):
+        tamanho = _tamanho(valor)
+        if tamanho > self.maximo_bytes_memoria:
+            return
+        with self._trava:
+            antigo = self._memoria.pop(chave, None)
+            if antigo is not None:
+                self._bytes_memoria -= antigo[1]
+            self._memoria[chave] = (valor, tamanho)
+            self._bytes_memoria += tamanho
+            while self._bytes_memoria > self.maximo_bytes_memoria:
+                _, (_, tamanho_despejado) = self._memoria.popitem(last=False)
+                self._bytes_memoria -= tamanho_despejado
+                self.contadores['despejos_memoria'] += 1
+
+    # Nível em disco
+
+    def _caminho(self, chave):
+        nome = hashlib.sha256(json.dumps(chave, default=str, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return os.path.join(self.diretorio, nome + '.pkl')
+
+    def _arquivos_disco(self):
+        return [entrada for entrada in os.scandir(self.diretorio) if entrada.name.endswith('.pkl')]
+
+    def _ler_disco(self, chave):
+        if not self.diretorio:
+            return None
+        caminho = self._caminho(chave)
+        try:
+            valor = pd.read_pickle(caminho)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Arquivo de outra versão do pandas ou corrompido: é recalculado
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+            return None
+        # O mtime marca o último uso: a limpeza apaga primeiro os menos usados
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return valor
+
+    def _gravar_disco(self, chave, valor):
+        if not self.diretorio:
+            return
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pd.to_pickle(valor, temporario)
+        tamanho = os.path.getsize(temporario)
+        # Regravar uma chave substitui o arquivo: só a diferença de tamanho entra na conta
+        try:
+            anterior = os.path.getsize(caminho)
+        except FileNotFoundError:
+            anterior = 0
+        os.replace(temporario, caminho)
+        with self._trava:
+            self._bytes_disco += tamanho - anterior
+            passou = self._bytes_disco > self.maximo_bytes_disco
+        if passou:
+            self._limpar_disco()
+
+    def _limpar_disco(self):
+        """Apaga os arquivos usados há mais tempo até ficar abaixo do limite"""
+        # Outro processo pode apagar arquivos durante a varredura: esses saem da conta
+        arquivos = []
+        for entrada in self._arquivos_disco():
+            with contextlib.suppress(FileNotFoundError):
+                estado = entrada.stat()
+                arquivos.append((estado.st_mtime, estado.st_size, entrada.path))
+        arquivos.sort()
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        alvo = self.maximo_bytes_disco * FRACAO_APOS_LIMPEZA
+        despejados = 0
+        for _, tamanho, caminho in arquivos:
+            if total <= alvo:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(caminho)
+                despejados += 1
+            total -= tamanho
+        with self._trava:
+            self._bytes_disco = total
+            self.contadores['despejos_disco'] += despejados
+
+    def limpar(self):
+        """Esvazia os dois níveis (os contadores continuam)"""
+        with self._trava:
+            self._memoria.clear()
+            self._bytes_memoria = 0
+        if self.diretorio:
+            for entrada in self._arquivos_disco():
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entrada.path)
+            with self._trava:
+                self._bytes_disco = 0
+
+    def estatisticas(self):
+        """Contadores de acertos, falhas e despejos, ocupação de cada nível e taxa de acerto"""
+        with self._trava:
+            estatisticas = dict(self.contadores)
+            estatisticas.update({
+                'entradas_memoria': len(self._memoria),
+                'bytes_memoria': self._bytes_memoria,
+                'bytes_disco': self._bytes_disco,
+            })
+        pedidos = estatisticas['acertos_memoria'] + estatisticas['acertos_disco'] + estatisticas['falhas']
+        acertos = estatisticas['acertos_memoria'] + estatisticas['acertos_disco']
+        estatisticas['taxa_acerto'] = acertos / pedidos if pedidos else None
+        return estatisticas
+
+
+def assinatura_entradas(*entradas):
+    """Hash das entradas de uma figura: DataFrames e Series pelo conteúdo, o resto pelo JSON"""
+    resumo = hashlib.sha256()
+    for entrada in entradas:
+        if isinstance(entrada, (pd.DataFrame, pd.Series)):
+            quadro = entrada.to_frame() if isinstance(entrada, pd.Series) else entrada
+            resumo.update(json.dumps([list(quadro.columns), [str(tipo) for tipo in quadro.dtypes]],
+                                     default=str).encode('utf-8'))
+            resumo.update(pd.util.hash_pandas_object(entrada, index=True).values.tobytes())
+        else:
+            resumo.update(json.dumps(entrada, default=str, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        resumo.update(b'\0')
+    return resumo.hexdigest()
+
+
+class CacheFiguras:
+    """JSON de figuras Plotly por hash das entradas, em LRU limitado em bytes"""
+
+    def __init__(self, maximo_bytes=MAXIMO_BYTES_FIGURAS):
+        self.maximo_bytes = maximo_bytes
+        self._figuras = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+        self.contadores = {'acertos': 0, 'falhas': 0, 'despejos': 0}
+
+    def obter(self, entradas, construir):
+        """Figura das entradas: refeita do JSON guardado ou montada por construir()"""
+        chave = assinatura_entradas(*entradas)
+        with self._trava:
+            texto = self._figuras.get(chave)
+            if texto is not None:
+                self._figuras.move_to_end(chave)
+                self.contadores['acertos'] += 1
+        if texto is not None:
+            # O JSON saiu de uma figura já validada ao ser montada: refazê-la sem validar
+            # é o que poupa o custo (o st.plotly_chart não valida de novo um go.Figure)
+            return go.Figure(json.loads(texto), _validate=False)
+
+        figura = construir()
+        texto = pio.to_json(figura, validate=False)
+        with self._trava:
+            self.contadores['falhas'] += 1
+            if len(texto) <= self.maximo_bytes and chave not in self._figuras:
+                self._figuras[chave] = texto
+                self._bytes += len(texto)
+                while self._bytes > self.maximo_bytes:
+                    _, despejado = self._figuras.popitem(last=False)
+                    self._bytes -= len(despejado)
+                    self.contadores['despejos'] += 1
+        return figura
+
+    def estatisticas(self):
+        """Acertos, falhas, despejos e ocupação"""
+        with self._trava:
+            estatisticas = dict(self.contadores)
+            estatisticas.update({'entradas': len(self._figuras), 'bytes': self._bytes})
+        pedidos = estatisticas['acertos'] + estatisticas['falhas']
+        estatisticas['taxa_acerto'] = estatisticas['acertos'] / pedidos if pedidos else None
+        return estatisticas
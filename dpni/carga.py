@@ -0,0 +1,198 @@
+"""Carga, agregação e enriquecimento do extrato de residência do DPNI."""
+import hashlib
+import os
+import re
+import threading
+
+import pandas as pd
+
+from dpni.esquema import aplicar_esquema
+from dpni.geografia import Geografia
+
+ARQUIVO_RESIDENCIA = "dados/residencia.zip"
+ARQUIVO_MUNICIPIOS = "dados/municipio.csv"
+ARQUIVO_ESTADOS = "dados/estados_brasil.csv"
+
+COLUNAS_AGRUPAMENTO = ['TP_COBERTURA', 'DS_COBERTURA', 'CO_IBGE', 'NU_ANO', 'NU_MES', 'NU_IDADE']
+
+# Teto de memória padrão para a agregação em blocos (ex.: "2GB"); vazio usa a leitura completa
+VARIAVEL_MEMORIA_MAXIMA = "DPNI_MEMORIA_MAXIMA"
+UNIDADES_TAMANHO = {'': 1, 'B': 1, 'KB': 1 << 10, 'MB': 1 << 20, 'GB': 1 << 30, 'TB': 1 << 40}
+
+# Hashes já calculados por (caminho, mtime, tamanho), compartilhados pelo processo
+_hashes_conhecidos = {}
+_trava_hashes = threading.Lock()
+
+
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    """Calcula o SHA-256 do conteúdo do arquivo lendo em blocos"""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def assinatura_arquivos(*caminhos):
+    """Retorna (caminho, mtime, tamanho, sha256) de cada arquivo.
+
+    O hash do conteúdo só é recalculado quando o mtime ou o tamanho mudam, então
+    uma chamada com os arquivos inalterados custa apenas um stat por arquivo.
+    """
+    assinatura = []
+    for caminho in caminhos:
+        info = os.stat(caminho)
+        chave = (os.path.abspath(caminho), info.st_mtime_ns, info.st_size)
+        with _trava_hashes:
+            conteudo = _hashes_conhecidos.get(chave)
+        if conteudo is None:
+            conteudo = hash_arquivo(caminho)
+            with _trava_hashes:
+                _hashes_conhecidos[chave] = conteudo
+        assinatura.append((caminho, info.st_mtime_ns, info.st_size, conteudo))
+    return tuple(assinatura)
+
+
+def ler_residencia(caminho=ARQUIVO_RESIDENCIA):
+    """Lê o extrato de residência (CSV separado por ';' dentro do ZIP)"""
+    return pd.read_csv(caminho, sep=';', compression='zip')
+
+
+def ler_estados(caminho=ARQUIVO_ESTADOS):
+    """Lê a tabela de estados com os códigos de UF normalizados em 2 dígitos"""
+    estados_df = pd.read_csv(caminho, dtype=str)
+    if 'co_uf' in estados_df.columns:
+        estados_df['co_uf'] = estados_df['co_uf'].astype(str).str.zfill(2)
+    return estados_df
+
+
+def ler_municipios(caminho=ARQUIVO_MUNICIPIOS):
+    """Lê a tabela de municípios com os códigos IBGE normalizados em 6 dígitos"""
+    municipios_df = pd.read_csv(caminho, sep=';', dtype=str)
+    if 'co_municipio_ibge' in municipios_df.columns:
+        municipios_df['co_municipio_ibge'] = municipios_df['co_municipio_ibge'].astype(str).str.zfill(6)
+    return municipios_df
+
+
+def agregar_dados(data):
+    """Agrupa o extrato pelas colunas de agrupamento.
+
+    Conta os registros de cada grupo em 'qt_registros' e soma as demais colunas
+    numéricas. Se faltar alguma coluna de agrupamento, devolve os dados sem alteração.
+    """
+    if not set(COLUNAS_AGRUPAMENTO).issubset(data.columns):
+        return data
+
+    # Encontrar uma coluna para contar que não esteja no agrupamento
+    coluna_contagem = [col for col in data.columns if col not in COLUNAS_AGRUPAMENTO][0]
+
+    # Contar registros por grupo e somar colunas numéricas
+    agg_dict = {coluna_contagem: 'count'}
+    agg_dict.update({col: 'sum' for col in data.select_dtypes(include=['number']).columns if col not in COLUNAS_AGRUPAMENTO})
+
+    data_agrupado = data.groupby(COLUNAS_AGRUPAMENTO).agg(agg_dict).reset_index()
+    data_agrupado.rename(columns={coluna_contagem: 'qt_registros'}, inplace=True)
+    return data_agrupado
+
+
+def interpretar_tamanho(valor):
+    """Converte '512MB', '2GB' ou um número de bytes em inteiro (bytes)"""
+    if valor is None or isinstance(valor, int):
+        return valor
+    correspondencia = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?B?)\s*', str(valor).upper())
+    if not correspondencia:
+        raise ValueError(f"Tamanho inválido: {valor!r}. Use por exemplo 512MB ou 2GB")
+    numero, unidade = correspondencia.groups()
+    if unidade and not unidade.endswith('B'):
+        unidade += 'B'
+    return int(float(numero) * UNIDADES_TAMANHO[unidade])
+
+
+def _bytes_por_linha(caminho, amostra=5000):
+    """Estima o consumo de memória por linha do extrato a partir de uma amostra"""
+    data = pd.read_csv(caminho, sep=';', compression='zip', nrows=amostra)
+    return max(1, int(data.memory_usage(deep=True, index=True).sum() / max(len(data), 1)))
+
+
+def agregar_dados_em_blocos(caminho=ARQUIVO_RESIDENCIA, memoria_maxima='1GB', linhas_por_bloco=None):
+    """Agrega o extrato lendo o ZIP em blocos, sem materializar o CSV inteiro.
+
+    Cada bloco é agregado parcialmente pelas colunas de agrupamento e as contagens e
+    somas parciais são combinadas. Metade do teto de memória vai para o bloco lido e
+    metade para os parciais acumulados, que são compactados quando passam desse
+    limite. O resultado é igual ao de agregar_dados(ler_residencia(caminho)).
+    """
+    memoria_maxima = interpretar_tamanho(memoria_maxima)
+    if linhas_por_bloco is None:
+        # O bloco bruto e sua agregação parcial convivem em memória
+        linhas_por_bloco = max(1000, memoria_maxima // 2 // (3 * _bytes_por_linha(caminho)))
+    limite_parciais = memoria_maxima // 2
+
+    colunas_soma = None
+    parciais = []
+    memoria_parciais = 0
+    for bloco in pd.read_csv(caminho, sep=';', compression='zip', chunksize=linhas_por_bloco):
+        if colunas_soma is None:
+            if not set(COLUNAS_AGRUPAMENTO).issubset(bloco.columns):
+                # Sem as colunas de agrupamento não há o que agregar: mesma saída do caminho em memória
+                return ler_residencia(caminho)
+            coluna_contagem = [col for col in bloco.columns if col not in COLUNAS_AGRUPAMENTO][0]
+            colunas_soma = [col for col in bloco.select_dtypes(include=['number']).columns if col not in COLUNAS_AGRUPAMENTO]
+            agg_dict = {coluna_contagem: 'count'}
+            agg_dict.update({col: 'sum' for col in colunas_soma})
+        else:
+            nao_numericas = [col for col in colunas_soma if not pd.api.types.is_numeric_dtype(bloco[col])]
+            if nao_numericas:
+                raise ValueError(f"Colunas {nao_numericas} deixaram de ser numéricas no meio do extrato; use a leitura completa")
+
+        parcial = bloco.groupby(COLUNAS_AGRUPAMENTO).agg(agg_dict)
+        del bloco
+        parciais.append(parcial)
+        memoria_parciais += parcial.memory_usage(deep=True, index=True).sum()
+        if memoria_parciais > limite_parciais and len(parciais) > 1:
+            parciais = [pd.concat(parciais).groupby(level=COLUNAS_AGRUPAMENTO).sum()]
+            memoria_parciais = parciais[0].memory_usage(deep=True, index=True).sum()
+            if memoria_parciais > limite_parciais:
+                raise MemoryError(
+                    f"Os grupos agregados ocupam {memoria_parciais / (1 << 20):.0f} MB, "
+                    f"acima do limite de {limite_parciais / (1 << 20):.0f} MB para parciais"
+                )
+
+    if colunas_soma is None:
+        return ler_residencia(caminho)
+    data_agrupado = pd.concat(parciais).groupby(level=COLUNAS_AGRUPAMENTO).sum().reset_index()
+    data_agrupado.rename(columns={coluna_contagem: 'qt_registros'}, inplace=True)
+    return data_agrupado
+
+
+def carregar_geografia(caminho_municipios=ARQUIVO_MUNICIPIOS, caminho_estados=ARQUIVO_ESTADOS):
+    """Constrói a dimensão geográfica a partir dos CSVs de municípios e estados"""
+    return Geografia(ler_municipios(caminho_municipios), ler_estados(caminho_estados))
+
+
+def enriquecer_dados(data_agrupado, geografia):
+    """Adiciona região, UF, nome do município e nome/sigla da UF a partir do código IBGE"""
+    if 'CO_IBGE' not in data_agrupado.columns:
+        return data_agrupado
+    return geografia.enriquecer(data_agrupado)
+
+
+def carregar_dados_agrupados(caminho_residencia=ARQUIVO_RESIDENCIA,
+                             caminho_municipios=ARQUIVO_MUNICIPIOS,
+                             caminho_estados=ARQUIVO_ESTADOS,
+                             memoria_maxima=None):
+    """Lê, agrega, enriquece e aplica o esquema compacto. Retorna (data_agrupado, geografia)
+
+    Com memoria_maxima (ou a variável de ambiente DPNI_MEMORIA_MAXIMA) o extrato é
+    agregado em blocos respeitando esse teto; sem ele, é lido por inteiro.
+    """
+    memoria_maxima = memoria_maxima or os.environ.get(VARIAVEL_MEMORIA_MAXIMA) or None
+    geografia = carregar_geografia(caminho_municipios, caminho_estados)
+    if memoria_maxima:
+        data_agrupado = agregar_dados_em_blocos(caminho_residencia, memoria_maxima)
+    else:
+        data_agrupado = agregar_dados(ler_residencia(caminho_residencia))
+    if set(COLUNAS_AGRUPAMENTO).issubset(data_agrupado.columns):
+        data_agrupado = enriquecer_dados(data_agrupado, geografia)
+        data_agrupado = aplicar_esquema(data_agrupado)
+    return data_agrupado, geografia
@@ -0,0 +1,351 @@
+"""Coleta dos extratos de residência do DPNI por HTTP, em paralelo e condicional.
+
+Os extratos são baixados por ano e/ou UF a partir de um modelo de URL (por
+exemplo https://servidor/residencia_{ano}_{uf}.zip), com um pool de conexões
+compartilhado por várias threads. Cada arquivo guarda o ETag e o Last-Modified
+da última versão em dados/coleta/_coleta.json: um arquivo inalterado custa uma
+requisição respondida com 304, sem corpo. Downloads interrompidos continuam do
+byte em que pararam (Range + If-Range) e o arquivo só substitui o anterior depois
+de conferido o SHA-256, quando há um checksum publicado.
+
+Os arquivos que mudaram são entregues à ingestão: os de cada ano são juntados em
+um extrato do ano e aplicados como delta (dpni.ingestao); sem armazenamento
+ainda, todos viram um extrato só e passam pela ingestão completa.
+
+Uso: python -m dpni.coleta --origem 'https://servidor/residencia_{ano}_{uf}.zip' --anos 2024 2025
+                           [--ufs SP RJ] [--checksum MODELO.sha256] [--paralelismo 8] [--sem-ingestao]
+"""
+import argparse
+import json
+import os
+import string
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from dpni.armazenamento import DIRETORIO_ARMAZENAMENTO, construir_armazenamento, ler_manifesto
+from dpni.carga import ARQUIVO_ESTADOS, ARQUIVO_MUNICIPIOS, hash_arquivo, ler_estados
+from dpni.ingestao import ingerir_delta
+
+# Modelo de URL padrão dos extratos; {ano}, {uf} (sigla) e {co_uf} são preenchidos por arquivo
+VARIAVEL_ORIGEM = "DPNI_ORIGEM_EXTRATOS"
+DIRETORIO_COLETA = "dados/coleta"
+ARQUIVO_ESTADO_COLETA = "_coleta.json"
+
+PARALELISMO_PADRAO = 8
+TENTATIVAS = 3
+TIMEOUT = (10, 120)
+TAMANHO_BLOCO = 64 << 10
+
+
+def criar_sessao(conexoes=PARALELISMO_PADRAO, tentativas=TENTATIVAS):
+    """Session com pool de conexões do tamanho do paralelismo e novas tentativas nos erros do servidor"""
+    sessao = requests.Session()
+    novas_tentativas = Retry(total=tentativas, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                             allowed_methods=('GET', 'HEAD'))
+    adaptador = HTTPAdapter(pool_connections=conexoes, pool_maxsize=conexoes, max_retries=novas_tentativas)
+    sessao.mount('http://', adaptador)
+    sessao.mount('https://', adaptador)
+    sessao.headers['User-Agent'] = 'dpni-coleta'
+    return sessao
+
+
+def campos_modelo(modelo):
+    """Nomes dos campos ({ano}, {uf}...) usados no modelo de URL"""
+    return {campo for _, campo, _, _ in string.Formatter().parse(modelo) if campo}
+
+
+def listar_arquivos(modelo, anos=(), ufs=None, modelo_checksum=None):
+    """[(url, nome do arquivo local, ano, url do checksum)] de cada combinação de ano e UF que o modelo usa.
+
+    ufs: {co_uf (2 dígitos): sigla}. modelo_checksum aceita os mesmos campos e {url}.
+    """
+    campos = campos_modelo(modelo)
+    combinacoes_anos = anos if 'ano' in campos else [None]
+    combinacoes_ufs = sorted(ufs.items()) if ufs and campos & {'uf', 'co_uf'} else [(None, None)]
+    arquivos = []
+    for ano in combinacoes_anos:
+        for co_uf, sigla in combinacoes_ufs:
+            url = modelo.format(ano=ano, uf=sigla, co_uf=co_uf)
+            nome = os.path.basename(requests.utils.urlparse(url).path) or 'residencia.zip'
+            url_checksum = modelo_checksum.format(ano=ano, uf=sigla, co_uf=co_uf, url=url) if modelo_checksum else None
+            arquivos.append((url, nome, ano, url_checksum))
+    return arquivos
+
+
+def ler_estado(diretorio=DIRETORIO_COLETA):
+    """Validadores (ETag, Last-Modified) e SHA-256 da última versão de cada URL"""
+    caminho = os.path.join(diretorio, ARQUIVO_ESTADO_COLETA)
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def _gravar_json(caminho, conteudo):
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(conteudo, arquivo, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def gravar_estado(estado, diretorio=DIRETORIO_COLETA):
+    os.makedirs(diretorio, exist_ok=True)
+    _gravar_json(os.path.join(diretorio, ARQUIVO_ESTADO_COLETA), estado)
+
+
+def checksum_publicado(sessao, url, timeout=TIMEOUT):
+    """SHA-256 publicado em um arquivo de checksum (formato do sha256sum: o hash é a primeira palavra)"""
+    resposta = sessao.get(url, timeout=timeout)
+    resposta.raise_for_status()
+    return resposta.text.split()[0].lower()
+
+
+def _validador_parcial(caminho_parcial):
+    """ETag ou Last-Modified da versão a que pertence o download parcial (None se não há parcial)"""
+    if not os.path.exists(caminho_parcial) or not os.path.exists(caminho_parcial + '.json'):
+        return None
+    with open(caminho_parcial + '.json', encoding='utf-8') as arquivo:
+        return json.load(arquivo).get('validador')
+
+
+def _descartar_parcial(caminho_parcial):
+    for caminho in (caminho_parcial, caminho_parcial + '.json'):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+
+def _transferir(sessao, url, caminho, registro, timeout):
+    """Uma requisição: condicional se já há arquivo local, com Range se há download parcial.
+
+    Retorna (status HTTP, cabeçalhos da resposta); o corpo fica em caminho + '.parcial'.
+    """
+    parcial = caminho + '.parcial'
+    cabecalhos = {}
+    if registro and os.path.exists(caminho):
+        if registro.get('etag'):
+            cabecalhos['If-None-Match'] = registro['etag']
+        if registro.get('last_modified'):
+            cabecalhos['If-Modified-Since'] = registro['last_modified']
+    validador = _validador_parcial(parcial)
+    inicio = os.path.getsize(parcial) if validador else 0
+    if inicio:
+        # If-Range: se o arquivo mudou no servidor, a resposta é o arquivo inteiro (200), não a continuação
+        cabecalhos['Range'] = f"bytes={inicio}-"
+        cabecalhos['If-Range'] = validador
+
+    with sessao.get(url, headers=cabecalhos, stream=True, timeout=timeout) as resposta:
+        if resposta.status_code == 304:
+            return 304, resposta.headers
+        if resposta.status_code == 416:
+            # O parcial não corresponde ao arquivo do servidor: recomeça do zero
+            _descartar_parcial(parcial)
+            return 416, resposta.headers
+        resposta.raise_for_status()
+        continuando = resposta.status_code == 206
+        validador = resposta.headers.get('ETag') or resposta.headers.get('Last-Modified')
+        if not continuando:
+            inicio = 0
+            if validador:
+                _gravar_json(parcial + '.json', {'url': url, 'validador': validador})
+            else:
+                # Sem validador não há como retomar com segurança
+                _descartar_parcial(parcial)
+        esperado = resposta.headers.get('Content-Length')
+        with open(parcial, 'ab' if continuando else 'wb') as arquivo:
+            for bloco in resposta.iter_content(TAMANHO_BLOCO):
+                arquivo.write(bloco)
+        if esperado is not None and os.path.getsize(parcial) != inicio + int(esperado):
+            raise requests.exceptions.ChunkedEncodingError(f"Download incompleto de {url}")
+        return resposta.status_code, resposta.headers
+
+
+def baixar(sessao, url, caminho, registro=None, url_checksum=None, tentativas=TENTATIVAS, timeout=TIMEOUT):
+    """Baixa url em caminho, se mudou desde o registro anterior. Retorna (situação, registro novo).
+
+    situação: 'inalterado' (304, ou conteúdo com o mesmo SHA-256), 'baixado' ou 'retomado'.
+    Conexões interrompidas no meio do corpo continuam do ponto em que pararam.
+    """
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    parcial = caminho + '.parcial'
+    for tentativa in range(tentativas + 1):
+        try:
+            status, cabecalhos = _transferir(sessao, url, caminho, registro, timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if tentativa == tentativas:
+                raise
+            continue
+        if status != 416:
+            break
+    else:
+        raise requests.exceptions.RetryError(f"Não foi possível retomar o download de {url}")
+
+    if status == 304:
+        return 'inalterado', registro
+
+    sha256 = hash_arquivo(parcial)
+    if url_checksum:
+        esperado = checksum_publicado(sessao, url_checksum, timeout)
+        if sha256 != esperado:
+            _descartar_parcial(parcial)
+            raise ValueError(f"SHA-256 de {url} não confere: {sha256} (esperado {esperado})")
+    os.replace(parcial, caminho)
+    _descartar_parcial(parcial)
+
+    novo = {
+        'arquivo': os.path.basename(caminho),
+        'etag': cabecalhos.get('ETag'),
+        'last_modified': cabecalhos.get('Last-Modified'),
+        'sha256': sha256,
+        'tamanho': os.path.getsize(caminho),
+        'baixado_em': time.time(),
+    }
+    if registro and registro.get('sha256') == sha256:
+        # Servidor sem validadores: o arquivo veio de novo, mas é o mesmo
+        return 'inalterado', novo
+    return ('retomado' if status == 206 else 'baixado'), novo
+
+
+def coletar(modelo, anos=(), ufs=None, diretorio=DIRETORIO_COLETA, modelo_checksum=None,
+            paralelismo=PARALELISMO_PADRAO, sessao=None):
+    """Baixa em paralelo os arquivos do modelo que mudaram. Retorna {url: (situação, caminho, ano)}"""
+    estado = ler_estado(diretorio)
+    arquivos = listar_arquivos(modelo, anos, ufs, modelo_checksum)
+    sessao = sessao or criar_sessao(paralelismo)
+
+    resultado, erros = {}, {}
+    with ThreadPoolExecutor(max_workers=paralelismo) as executor:
+        futuros = {
+            executor.submit(baixar, sessao, url, os.path.join(diretorio, nome), estado.get(url), url_checksum):
+                (url, nome, ano)
+            for url, nome, ano, url_checksum in arquivos
+        }
+        for futuro, (url, nome, ano) in futuros.items():
+            try:
+                situacao, registro = futuro.result()
+            except Exception as erro:
+                erros[url] = erro
+                continue
+            estado[url] = registro
+            resultado[url] = (situacao, os.path.join(diretorio, nome), ano)
+    # O estado só guarda versões completas e conferidas; os arquivos com erro são tentados de novo na próxima coleta
+    gravar_estado(estado, diretorio)
+    if erros:
+        detalhes = '; '.join(f"{url}: {erro}" for url, erro in erros.items())
+        raise RuntimeError(f"{len(erros)} de {len(arquivos)} arquivos falharam ({detalhes})")
+    return resultado
+
+
+def _linhas_extrato(caminho):
+    """Arquivo binário com o CSV do extrato (dentro do ZIP ou solto)"""
+    if zipfile.is_zipfile(caminho):
+        pacote = zipfile.ZipFile(caminho)
+        nomes = [nome for nome in pacote.namelist() if not nome.endswith('/')]
+        if len(nomes) != 1:
+            raise ValueError(f"{caminho} deveria ter um único CSV, tem {len(nomes)} arquivos")
+        return pacote.open(nomes[0])
+    return open(caminho, 'rb')
+
+
+def juntar_extratos(caminhos, saida):
+    """Junta os CSVs de vários extratos em um ZIP com um único CSV (um cabeçalho)"""
+    os.makedirs(os.path.dirname(saida) or '.', exist_ok=True)
+    temporario = saida + '.tmp'
+    cabecalho = None
+    with zipfile.ZipFile(temporario, 'w', compression=zipfile.ZIP_DEFLATED) as pacote, \
+            pacote.open(os.path.splitext(os.path.basename(saida))[0] + '.csv', 'w', force_zip64=True) as escrita:
+        for caminho in caminhos:
+            with _linhas_extrato(caminho) as leitura:
+                primeira = leitura.readline()
+                if cabecalho is None:
+                    cabecalho = primeira
+                    escrita.write(cabecalho)
+                elif primeira.strip() != cabecalho.strip():
+                    raise ValueError(f"Cabeçalho de {caminho} difere do primeiro extrato")
+                ultimo = b'\n'
+                for bloco in iter(lambda: leitura.read(TAMANHO_BLOCO), b''):
+                    escrita.write(bloco)
+                    ultimo = bloco[-1:]
+                if ultimo != b'\n':
+                    escrita.write(b'\n')
+    os.replace(temporario, saida)
+    return saida
+
+
+def entregar_para_ingestao(resultado, diretorio=DIRETORIO_COLETA, destino=DIRETORIO_ARMAZENAMENTO,
+                           caminho_municipios=ARQUIVO_MUNICIPIOS, caminho_estados=ARQUIVO_ESTADOS,
+                           memoria_maxima=None):
+    """Aplica ao armazenamento os anos com arquivos novos. Retorna os anos ingeridos (None = ingestão completa).
+
+    Cada ano com mudança é juntado a partir de todos os seus arquivos (inclusive os
+    inalterados), porque o delta substitui os meses do ano no Brasil inteiro.
+    """
+    alterados = {ano for situacao, _, ano in resultado.values() if situacao != 'inalterado'}
+    if not alterados:
+        return []
+    if ler_manifesto(destino) is None or None in alterados:
+        extrato = juntar_extratos(sorted(caminho for _, caminho, _ in resultado.values()),
+                                  os.path.join(diretorio, 'residencia.zip'))
+        construir_armazenamento(destino, 'parquet', extrato, caminho_municipios, caminho_estados, memoria_maxima)
+        return None
+
+    for ano in sorted(alterados):
+        caminhos = sorted(caminho for _, caminho, ano_arquivo in resultado.values() if ano_arquivo == ano)
+        extrato = juntar_extratos(caminhos, os.path.join(diretorio, f"delta_{ano}.zip"))
+        ingerir_delta(extrato, destino, caminho_municipios, caminho_estados, memoria_maxima)
+    return sorted(alterados)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baixa os extratos de residência que mudaram e os entrega à ingestão")
+    parser.add_argument('--origem', default=os.environ.get(VARIAVEL_ORIGEM),
+                        help=f"modelo de URL com {{ano}}, {{uf}} ou {{co_uf}} (padrão: ${VARIAVEL_ORIGEM})")
+    parser.add_argument('--anos', type=int, nargs='*', default=[])
+    parser.add_argument('--ufs', nargs='*', default=None, help="siglas das UFs (padrão: todas)")
+    parser.add_argument('--checksum', default=None,
+                        help="modelo de URL do arquivo .sha256 de cada extrato (aceita {url}, {ano}, {uf}, {co_uf})")
+    parser.add_argument('--diretorio', default=DIRETORIO_COLETA)
+    parser.add_argument('--paralelismo', type=int, default=PARALELISMO_PADRAO)
+    parser.add_argument('--municipios', default=ARQUIVO_MUNICIPIOS)
+    parser.add_argument('--estados', default=ARQUIVO_ESTADOS)
+    parser.add_argument('--destino', default=DIRETORIO_ARMAZENAMENTO)
+    parser.add_argument('--memoria-maxima', default=None)
+    parser.add_argument('--sem-ingestao', action='store_true', help="só baixa, sem atualizar o armazenamento")
+    args = parser.parse_args(argv)
+    if not args.origem:
+        parser.error(f"informe --origem ou a variável {VARIAVEL_ORIGEM}")
+    if 'ano' in campos_modelo(args.origem) and not args.anos:
+        parser.error("o modelo usa {ano}: informe --anos")
+
+    estados = ler_estados(args.estados)
+    ufs = dict(zip(estados['co_uf'], estados['sg_uf']))
+    if args.ufs:
+        siglas = {sigla.upper() for sigla in args.ufs}
+        ufs = {co_uf: sigla for co_uf, sigla in ufs.items() if sigla in siglas}
+
+    inicio = time.perf_counter()
+    resultado = coletar(args.origem, args.anos, ufs, args.diretorio, args.checksum, args.paralelismo)
+    contagem = {}
+    for situacao, _, _ in resultado.values():
+        contagem[situacao] = contagem.get(situacao, 0) + 1
+    resumo = ', '.join(f"{quantidade} {situacao}" for situacao, quantidade in sorted(contagem.items()))
+    print(f"{len(resultado)} arquivos em {args.diretorio} ({resumo}) em {time.perf_counter() - inicio:.1f}s")
+
+    if args.sem_ingestao:
+        return
+    anos = entregar_para_ingestao(resultado, args.diretorio, args.destino, args.municipios, args.estados,
+                                  args.memoria_maxima)
+    if anos is None:
+        print(f"Ingestão completa em {args.destino}")
+    elif anos:
+        print(f"Anos atualizados em {args.destino}: {', '.join(map(str, anos))}")
+    else:
+        print("Nada mudou desde a última coleta")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Cubo pré-agregado de doses e população por geografia × ano × mês × cobertura.
+
+O cubo é materializado na ingestão com quatro níveis geográficos (Brasil, região,
+UF e município). Ao carregar, cada nível vira um DataFrame indexado pela sua chave
+geográfica, ano, cobertura e mês, de modo que cards, mapa e gráficos do Dashboard
+passam a ser consultas por índice em vez de somas sobre os dados linha a linha.
+
+Cada linha traz também doses e população acumuladas no ano até o mês (por unidade
+geográfica e cobertura), então a série da Evolução Mensal sai pronta do cubo.
+"""
+import pandas as pd
+
+from dpni.esquema import aplicar_esquema
+
+NIVEIS = ['brasil', 'regiao', 'uf', 'municipio']
+COLUNAS_VALOR = ['QT_DOSES', 'QT_POPULACAO']
+COLUNAS_ACUMULADAS = ['QT_DOSES_ACUMULADAS', 'QT_POPULACAO_ACUMULADA']
+COLUNAS_TEMPO = ['NU_ANO', 'DS_COBERTURA', 'NU_MES']
+
+# Colunas geográficas de cada nível: a primeira é a chave usada no índice
+COLUNAS_NIVEL = {
+    'brasil': [],
+    'regiao': ['REGIAO'],
+    'uf': ['sg_uf', 'CO_UF', 'REGIAO'],
+    'municipio': ['no_municipio', 'CO_IBGE', 'sg_uf', 'CO_UF', 'REGIAO'],
+}
+COLUNAS_CUBO = ['NIVEL', 'REGIAO', 'CO_UF', 'sg_uf', 'CO_IBGE', 'no_municipio'] + COLUNAS_TEMPO + COLUNAS_VALOR + COLUNAS_ACUMULADAS
+
+
+def acumular_no_ano(parte, chaves):
+    """Acrescenta doses e população acumuladas mês a mês dentro de cada ano e grupo de chaves"""
+    parte = parte.sort_values(chaves + ['NU_ANO', 'NU_MES'], kind='stable', ignore_index=True)
+    acumuladas = parte.groupby(chaves + ['NU_ANO'], dropna=False, sort=False, observed=True)[COLUNAS_VALOR].cumsum()
+    parte[COLUNAS_ACUMULADAS] = acumuladas.to_numpy()
+    return parte
+
+
+def construir_cubo(data_agrupado):
+    """Soma doses e população em cada nível geográfico. Retorna um DataFrame longo com a coluna NIVEL"""
+    partes = []
+    for nivel in NIVEIS:
+        # Região sem nome não entra no nível de região (não pode ser selecionada no filtro)
+        manter_nulos = nivel != 'regiao'
+        parte = data_agrupado.groupby(
+            COLUNAS_NIVEL[nivel] + COLUNAS_TEMPO, dropna=not manter_nulos, sort=False, observed=True
+        )[COLUNAS_VALOR].sum().reset_index()
+        parte = acumular_no_ano(parte, COLUNAS_NIVEL[nivel] + ['DS_COBERTURA'])
+        parte.insert(0, 'NIVEL', nivel)
+        partes.append(parte)
+    cubo = pd.concat(partes, ignore_index=True)
+    return cubo.reindex(columns=COLUNAS_CUBO)
+
+
+def indexar_cubo(cubo):
+    """Separa o cubo longo em um DataFrame por nível, indexado por chave, ano, cobertura e mês"""
+    niveis = {}
+    for nivel in NIVEIS:
+        colunas = COLUNAS_NIVEL[nivel]
+        # No cubo longo os códigos dos níveis sem UF/município ficam nulos (float); por nível voltam a inteiros
+        parte = aplicar_esquema(cubo.loc[cubo['NIVEL'] == nivel, colunas + COLUNAS_TEMPO + COLUNAS_VALOR + COLUNAS_ACUMULADAS])
+        niveis[nivel] = parte.set_index(colunas[:1] + COLUNAS_TEMPO).sort_index()
+    return niveis
+
+
+def gravar_cubo(cubo, caminho):
+    cubo.to_parquet(caminho, index=False)
+
+
+def ler_cubo(caminho):
+    """Lê o cubo gravado na ingestão e devolve os níveis já indexados"""
+    return indexar_cubo(pd.read_parquet(caminho))
+
+
+def _linhas(niveis, ano, regiao, uf, municipio):
+    """Linhas do nível mais agregado que equivale à seleção geográfica (do ano ou de todos os anos)"""
+    if municipio != 'Todos':
+        linhas = niveis['municipio'].loc[[municipio]] if municipio in niveis['municipio'].index.levels[0] else niveis['municipio'].iloc[:0]
+        if uf != 'Todos':
+            linhas = linhas[linhas['sg_uf'] == uf]
+        if regiao != 'Todas':
+            linhas = linhas[linhas['REGIAO'] == regiao]
+    elif uf != 'Todos':
+        linhas = niveis['uf'].loc[[uf]] if uf in niveis['uf'].index.levels[0] else niveis['uf'].iloc[:0]
+        if regiao != 'Todas':
+            linhas = linhas[linhas['REGIAO'] == regiao]
+    elif regiao != 'Todas':
+        linhas = niveis['regiao'].loc[[regiao]] if regiao in niveis['regiao'].index.levels[0] else niveis['regiao'].iloc[:0]
+    else:
+        linhas = niveis['brasil']
+    linhas = linhas.reset_index()
+    if ano is not None:
+        linhas = linhas[linhas['NU_ANO'] == ano]
+    return linhas
+
+
+def totais_por_cobertura(niveis, ano, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+    """Doses e população somadas por cobertura para a seleção (índice: DS_COBERTURA)"""
+    linhas = _linhas(niveis, ano, regiao, uf, municipio)
+    if descricao != 'Todos':
+        linhas = linhas[linhas['DS_COBERTURA'] == descricao]
+    return linhas.groupby('DS_COBERTURA', observed=True)[COLUNAS_VALOR].sum()
+
+
+def totais_por_uf(niveis, ano, cobertura, regiao='Todas', uf='Todos', municipio='Todos'):
+    """Doses e população por sg_uf de uma cobertura, equivalente ao groupby('sg_uf') dos dados filtrados"""
+    if municipio != 'Todos':
+        linhas = _linhas(niveis, ano, regiao, uf, municipio)
+    else:
+        linhas = niveis['uf'].reset_index()
+        linhas = linhas[linhas['NU_ANO'] == ano]
+        if regiao != 'Todas':
+            linhas = linhas[linhas['REGIAO'] == regiao]
+        if uf != 'Todos':
+            linhas = linhas[linhas['sg_uf'] == uf]
+    linhas = linhas[linhas['DS_COBERTURA'] == cobertura]
+    return linhas.groupby('sg_uf', observed=True)[COLUNAS_VALOR].sum().reset_index()
+
+
+def serie_acumulada(niveis, cobertura, regiao='Todas', uf='Todos', municipio='Todos'):
+    """Doses e população do mês e acumuladas no ano, por ano e mês, de uma cobertura em todos os anos.
+
+    Para uma unidade geográfica é uma leitura das colunas acumuladas do cubo. Só
+    quando a seleção junta várias unidades (municípios homônimos) a soma e o
+    acumulado são refeitos, porque um mês ausente em uma delas quebraria a soma dos
+    acumulados.
+    """
+    if municipio != 'Todos':
+        nivel, chave = 'municipio', municipio
+    elif uf != 'Todos':
+        nivel, chave = 'uf', uf
+    elif regiao != 'Todas':
+        nivel, chave = 'regiao', regiao
+    else:
+        nivel, chave = 'brasil', None
+    tabela = niveis[nivel]
+    if chave is None:
+        linhas = tabela.loc[(slice(None), cobertura), :] if cobertura in tabela.index.levels[1] else tabela.iloc[:0]
+    elif chave in tabela.index.levels[0] and cobertura in tabela.index.levels[2]:
+        linhas = tabela.loc[(chave, slice(None), cobertura), :]
+    else:
+        linhas = tabela.iloc[:0]
+    linhas = linhas.reset_index()
+    if nivel == 'municipio' and uf != 'Todos':
+        linhas = linhas[linhas['sg_uf'] == uf]
+    if nivel in ('municipio', 'uf') and regiao != 'Todas':
+        linhas = linhas[linhas['REGIAO'] == regiao]
+    if nivel == 'municipio' and linhas['CO_IBGE'].nunique() > 1:
+        serie = linhas.groupby(['NU_ANO', 'NU_MES'])[COLUNAS_VALOR].sum().reset_index()
+        return acumular_no_ano(serie, [])
+    return linhas[['NU_ANO', 'NU_MES'] + COLUNAS_VALOR + COLUNAS_ACUMULADAS].reset_index(drop=True)
+
+
+def totais_por_nivel(niveis, nivel, ano=None, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+    """Doses e população por ano, unidade do nível ('brasil', 'regiao', 'uf' ou 'municipio') e cobertura.
+
+    As linhas vêm do nível mais agregado que ainda comporta a seleção geográfica e o
+    nível pedido; ano=None traz todos os anos.
+    """
+    if municipio != 'Todos' or nivel == 'municipio':
+        origem = 'municipio'
+    elif uf != 'Todos' or nivel == 'uf':
+        origem = 'uf'
+    elif regiao != 'Todas' or nivel == 'regiao':
+        origem = 'regiao'
+    else:
+        origem = 'brasil'
+    linhas = niveis[origem].reset_index()
+    if ano is not None:
+        linhas = linhas[linhas['NU_ANO'] == ano]
+    for coluna, valor, todos in [('REGIAO', regiao, 'Todas'), ('sg_uf', uf, 'Todos'),
+                                 ('no_municipio', municipio, 'Todos'), ('DS_COBERTURA', descricao, 'Todos')]:
+        if valor != todos:
+            linhas = linhas[linhas[coluna] == valor]
+    chaves = ['NU_ANO'] + COLUNAS_NIVEL[nivel] + ['DS_COBERTURA']
+    return linhas.groupby(chaves, dropna=False, observed=True)[COLUNAS_VALOR].sum().reset_index()
@@ -0,0 +1,131 @@
+"""Esquema compacto de tipos do DataFrame agregado e enriquecido.
+
+Códigos IBGE viram inteiros, rótulos de baixa cardinalidade viram categorias
+(com as categorias em ordem alfabética, para que ordenações e listas de opções
+fiquem iguais às feitas com strings) e anos, meses, idades e contagens usam o
+menor inteiro que comporta os valores.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_CATEGORICAS = ['TP_COBERTURA', 'DS_COBERTURA', 'no_municipio', 'sg_uf', 'no_uf', 'REGIAO']
+
+# Tipo alvo de cada coluna inteira. A conversão só é feita se não perder informação
+# (valores nulos ou fora da faixa mantêm o tipo original da coluna).
+TIPOS_INTEIROS = {
+    'CO_IBGE': 'int32',
+    'CO_UF': 'int8',
+    'CO_REGIAO': 'int8',
+    'NU_ANO': 'int16',
+    'NU_MES': 'int8',
+    'NU_IDADE': 'int16',
+}
+
+# Contagens e somas usam o menor inteiro com sinal que comporta o maior valor
+COLUNAS_CONTAGEM = ['qt_registros', 'QT_DOSES', 'QT_POPULACAO', 'QT_DOSES_ACUMULADAS', 'QT_POPULACAO_ACUMULADA']
+
+
+def _converter_inteiro(serie, tipo):
+    """Converte para o inteiro indicado, ou devolve a série original se houver perda"""
+    if serie.dtype == tipo:
+        return serie
+    valores = pd.to_numeric(serie, errors='coerce')
+    if valores.isna().any() or (valores.isna() != serie.isna()).any():
+        return serie
+    limites = np.iinfo(tipo)
+    if len(valores) and (valores.min() < limites.min or valores.max() > limites.max):
+        return serie
+    if not np.array_equal(valores, np.floor(valores)):
+        return serie
+    return valores.astype(tipo)
+
+
+def _menor_inteiro(serie):
+    """Menor tipo inteiro com sinal que comporta os valores da série"""
+    if not pd.api.types.is_numeric_dtype(serie) or serie.isna().any():
+        return None
+    maximo = serie.abs().max() if len(serie) else 0
+    for tipo in ('int8', 'int16', 'int32', 'int64'):
+        if maximo <= np.iinfo(tipo).max:
+            return tipo
+    return None
+
+
+def _categorizar(serie):
+    """Converte para categoria com as categorias ordenadas alfabeticamente"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories
+        if categorias.is_monotonic_increasing:
+            return serie
+        return serie.cat.reorder_categories(sorted(categorias))
+    return serie.astype('category')
+
+
+def aplicar_esquema(data_agrupado):
+    """Aplica o esquema compacto às colunas presentes. Chamar de novo é praticamente gratuito"""
+    colunas = {}
+    for coluna in data_agrupado.columns:
+        serie = data_agrupado[coluna]
+        if coluna in COLUNAS_CATEGORICAS:
+            colunas[coluna] = _categorizar(serie)
+        elif coluna in TIPOS_INTEIROS:
+            colunas[coluna] = _converter_inteiro(serie, TIPOS_INTEIROS[coluna])
+        elif coluna in COLUNAS_CONTAGEM or pd.api.types.is_integer_dtype(serie):
+            tipo = _menor_inteiro(serie)
+            colunas[coluna] = _converter_inteiro(serie, tipo) if tipo else serie
+        else:
+            colunas[coluna] = serie
+    return pd.DataFrame(colunas, index=data_agrupado.index)
+
+
+def memoria_em_bytes(data_agrupado):
+    """Memória ocupada pelo DataFrame, contando o conteúdo das strings"""
+    return int(data_agrupado.memory_usage(deep=True, index=True).sum())
+
+
+def somente_leitura(data):
+    """O mesmo DataFrame com as colunas apoiadas em arrays somente leitura, sem copiar os dados.
+
+    Para os dados compartilhados entre sessões: uma atribuição acidental levanta
+    ValueError em vez de alterar os dados de todas as sessões.
+    """
+    colunas = {}
+    for coluna, serie in data.items():
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy()
+            codigos.flags.writeable = False
+            colunas[coluna] = pd.Categorical.from_codes(codigos, dtype=serie.dtype)
+        else:
+            valores = serie.to_numpy()
+            valores.flags.writeable = False
+            colunas[coluna] = valores
+    return pd.DataFrame(colunas, index=data.index, copy=False)
+
+
+def _arrays(objeto):
+    """Arrays numpy que guardam os valores (e o índice simples) de um DataFrame, Series ou array"""
+    if isinstance(objeto, pd.DataFrame):
+        for _, serie in objeto.items():
+            yield np.asarray(serie.cat.codes if isinstance(serie.dtype, pd.CategoricalDtype) else serie.array)
+    elif isinstance(objeto, pd.Series):
+        yield np.asarray(objeto.cat.codes if isinstance(objeto.dtype, pd.CategoricalDtype) else objeto.array)
+    elif isinstance(objeto, np.ndarray):
+        yield objeto
+    if isinstance(objeto, (pd.DataFrame, pd.Series)) and not isinstance(objeto.index, (pd.RangeIndex, pd.MultiIndex)):
+        yield objeto.index.to_numpy()
+
+
+def memoria_propria(objeto, compartilhados=()):
+    """Bytes de objeto que não são vistas dos arrays dos DataFrames compartilhados.
+
+    Seleções tomadas como fatias dos dados compartilhados não contam; cópias e
+    resultados calculados contam pelo tamanho dos seus arrays. Outros objetos
+    contam pelo sys.getsizeof.
+    """
+    if not isinstance(objeto, (pd.DataFrame, pd.Series, np.ndarray)):
+        return sys.getsizeof(objeto)
+    bases = [array for compartilhado in compartilhados for array in _arrays(compartilhado)]
+    return sum(array.nbytes for array in _arrays(objeto)
+               if not any(np.may_share_memory(array, base) for base in bases))
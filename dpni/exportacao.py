@@ -0,0 +1,94 @@
+"""Exportação em blocos de DataFrames para CSV, Parquet e XLSX.
+
+Cada formato é escrito bloco a bloco (fatias de linhas), então exportar os dados
+de todo o Brasil não cria cópias inteiras do DataFrame (nem uma string CSV inteira)
+além do próprio arquivo gerado. O arquivo fica em memória: o st.download_button
+lê o conteúdo inteiro em bytes de qualquer forma. O XLSX usa o modo write-only do
+openpyxl e abre uma nova planilha a cada limite do Excel.
+"""
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LINHAS_POR_BLOCO = 50_000
+# Limite de linhas do Excel, descontado o cabeçalho
+LINHAS_POR_PLANILHA = 1_048_575
+
+FORMATOS_EXPORTACAO = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'XLSX': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def blocos(data, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Fatias consecutivas de até linhas_por_bloco linhas"""
+    for inicio in range(0, len(data), linhas_por_bloco):
+        yield data.iloc[inicio:inicio + linhas_por_bloco]
+
+
+def exportar_csv(data, saida, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """CSV separado por ';' (como o extrato do DPNI), em UTF-8"""
+    saida.write((';'.join(map(str, data.columns)) + '\n').encode('utf-8'))
+    for bloco in blocos(data, linhas_por_bloco):
+        saida.write(bloco.to_csv(sep=';', index=False, header=False).encode('utf-8'))
+
+
+def _esquema_parquet(data, linhas_por_bloco):
+    """Esquema Arrow inferido do primeiro bloco; colunas só com nulos nele ficam como texto"""
+    esquema = pa.Schema.from_pandas(data.iloc[:linhas_por_bloco], preserve_index=False)
+    for posicao, campo in enumerate(esquema):
+        if pa.types.is_null(campo.type):
+            esquema = esquema.set(posicao, campo.with_type(pa.string()))
+    return esquema
+
+
+def exportar_parquet(data, saida, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Parquet com um row group por bloco"""
+    esquema = _esquema_parquet(data, linhas_por_bloco)
+    with pq.ParquetWriter(saida, esquema) as escritor:
+        for bloco in blocos(data, linhas_por_bloco):
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+
+
+def _linhas_python(bloco):
+    """Linhas do bloco com valores Python (nulos como None), como o openpyxl espera"""
+    colunas = [serie.astype(object).where(serie.notna(), None).tolist() for _, serie in bloco.items()]
+    return zip(*colunas)
+
+
+def exportar_xlsx(data, saida, linhas_por_bloco=LINHAS_POR_BLOCO, titulo='Dados'):
+    """XLSX em modo write-only; passa para outra planilha a cada LINHAS_POR_PLANILHA linhas"""
+    from openpyxl import Workbook
+
+    livro = Workbook(write_only=True)
+    cabecalho = [str(coluna) for coluna in data.columns]
+    planilha, linhas_planilha = None, LINHAS_POR_PLANILHA
+    for bloco in blocos(data, linhas_por_bloco):
+        for linha in _linhas_python(bloco):
+            if linhas_planilha == LINHAS_POR_PLANILHA:
+                numero = len(livro.worksheets) + 1
+                planilha = livro.create_sheet(titulo if numero == 1 else f"{titulo} {numero}")
+                planilha.append(cabecalho)
+                linhas_planilha = 0
+            planilha.append(linha)
+            linhas_planilha += 1
+    if planilha is None:
+        livro.create_sheet(titulo).append(cabecalho)
+    livro.save(saida)
+
+
+EXPORTADORES = {'csv': exportar_csv, 'parquet': exportar_parquet, 'xlsx': exportar_xlsx}
+
+
+def exportar(data, formato, saida=None, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Escreve data no formato ('csv', 'parquet' ou 'xlsx') e devolve o arquivo posicionado no início.
+
+    Sem saída, escreve em um io.BytesIO, um dos tipos que o st.download_button aceita.
+    """
+    if saida is None:
+        saida = io.BytesIO()
+    EXPORTADORES[formato](data, saida, linhas_por_bloco)
+    saida.seek(0)
+    return saida
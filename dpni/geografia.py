@@ -0,0 +1,129 @@
+"""Dimensão geográfica: hierarquia região → UF → município construída uma única vez.
+
+Guarda as chaves inteiras, os nomes e as listas de opções já ordenadas de cada
+nível, de modo que os filtros em cascata do Dashboard são respondidos direto da
+hierarquia. Os nomes das linhas de fatos são resolvidos por códigos (factorize +
+take) em vez de merges com as tabelas de municípios e estados.
+"""
+import numpy as np
+import pandas as pd
+
+# Código de região (primeiro dígito do código IBGE) para nome da região
+MAPA_REGIAO = {
+    '1': 'Norte',
+    '2': 'Nordeste',
+    '3': 'Sudeste',
+    '4': 'Sul',
+    '5': 'Centro-Oeste'
+}
+ORDEM_REGIOES = ['Norte', 'Nordeste', 'Sudeste', 'Sul', 'Centro-Oeste']
+
+COLUNAS_ATRIBUTOS = ['CO_REGIAO', 'CO_UF', 'no_municipio', 'no_uf', 'sg_uf', 'REGIAO']
+
+
+def regiao_do_codigo(codigo):
+    """Nome da região a partir de um código IBGE de UF ou município"""
+    return MAPA_REGIAO.get(str(codigo)[0])
+
+
+class Geografia:
+    """Hierarquia geográfica e tabelas de consulta construídas a partir dos CSVs de referência"""
+
+    def __init__(self, municipios_df, estados_df):
+        # Municípios: código IBGE de 6 dígitos → nome
+        if {'co_municipio_ibge', 'no_municipio'}.issubset(municipios_df.columns):
+            municipios = municipios_df[['co_municipio_ibge', 'no_municipio']].drop_duplicates('co_municipio_ibge')
+            self.nome_municipio = dict(zip(municipios['co_municipio_ibge'].astype(str).str.zfill(6), municipios['no_municipio']))
+        else:
+            self.nome_municipio = {}
+
+        # Estados: código de 2 dígitos → (nome, sigla)
+        if {'co_uf', 'no_uf', 'sg_uf'}.issubset(estados_df.columns):
+            estados = estados_df[['co_uf', 'no_uf', 'sg_uf']].drop_duplicates('co_uf')
+            codigos = estados['co_uf'].astype(str).str.zfill(2)
+            self.nome_uf = dict(zip(codigos, estados['no_uf']))
+            self.sigla_uf = dict(zip(codigos, estados['sg_uf']))
+        else:
+            self.nome_uf = {}
+            self.sigla_uf = {}
+        self.codigo_uf = {sigla: int(codigo) for codigo, sigla in self.sigla_uf.items()}
+        self.nome_uf_por_sigla = {self.sigla_uf[codigo]: nome for codigo, nome in self.nome_uf.items()}
+
+        # Hierarquia: região → UFs e região/UF → municípios, com as opções já ordenadas
+        ufs_por_regiao = {}
+        for codigo, sigla in self.sigla_uf.items():
+            ufs_por_regiao.setdefault(regiao_do_codigo(codigo), set()).add(sigla)
+        municipios_por_uf = {}
+        municipios_por_regiao = {}
+        for codigo, nome in self.nome_municipio.items():
+            if pd.isna(nome):
+                continue
+            sigla = self.sigla_uf.get(codigo[:2])
+            if sigla is not None:
+                municipios_por_uf.setdefault(sigla, set()).add(nome)
+            municipios_por_regiao.setdefault(regiao_do_codigo(codigo), set()).add(nome)
+
+        self.regioes = [regiao for regiao in ORDEM_REGIOES if regiao in ufs_por_regiao]
+        self._ufs = {regiao: sorted(siglas) for regiao, siglas in ufs_por_regiao.items() if regiao}
+        self._ufs['Todas'] = sorted(self.codigo_uf)
+        self._municipios_uf = {sigla: sorted(nomes) for sigla, nomes in municipios_por_uf.items()}
+        self._municipios_regiao = {regiao: sorted(nomes) for regiao, nomes in municipios_por_regiao.items() if regiao}
+        self._municipios_regiao['Todas'] = sorted(set().union(*municipios_por_regiao.values()))
+
+    def ufs(self, regiao='Todas'):
+        """Siglas das UFs da região, em ordem alfabética"""
+        return self._ufs.get(regiao, [])
+
+    def municipios(self, regiao='Todas', uf='Todos', codigos=None):
+        """Nomes (únicos) dos municípios da UF ou, sem UF, da região, em ordem alfabética.
+
+        Com codigos (CO_IBGE de 6 dígitos), só entram os municípios desses códigos,
+        isto é, os que têm dados.
+        """
+        if uf != 'Todos':
+            opcoes = self._municipios_uf.get(uf, [])
+        else:
+            opcoes = self._municipios_regiao.get(regiao, [])
+        if codigos is None:
+            return opcoes
+        nomes = set()
+        for codigo in codigos:
+            codigo = str(codigo).zfill(6)
+            if uf != 'Todos' and self.sigla_uf.get(codigo[:2]) != uf:
+                continue
+            if regiao != 'Todas' and regiao_do_codigo(codigo) != regiao:
+                continue
+            nomes.add(self.nome_municipio.get(codigo))
+        return [nome for nome in opcoes if nome in nomes]
+
+    def atributos(self, codigos_ibge):
+        """Região, UF e nomes de cada código IBGE informado (um por linha, na mesma ordem)"""
+        textos = [str(codigo) for codigo in codigos_ibge]
+        co_uf = [texto[:2].zfill(2) for texto in textos]
+        return pd.DataFrame({
+            'CO_REGIAO': [texto[0] for texto in textos],
+            'CO_UF': co_uf,
+            'no_municipio': [self.nome_municipio.get(texto.zfill(6), np.nan) for texto in textos],
+            'no_uf': [self.nome_uf.get(codigo, np.nan) for codigo in co_uf],
+            'sg_uf': [self.sigla_uf.get(codigo, np.nan) for codigo in co_uf],
+            'REGIAO': [regiao_do_codigo(texto) if texto else None for texto in textos],
+        })
+
+    def enriquecer(self, data_agrupado):
+        """Adiciona região, UF e nomes às linhas de fatos a partir de CO_IBGE.
+
+        Os atributos são calculados só para os códigos distintos e espalhados para as
+        linhas com take, sem merge.
+        """
+        codigos, unicos = pd.factorize(data_agrupado['CO_IBGE'], sort=True)
+        atributos = self.atributos(unicos)
+        data_agrupado = data_agrupado.copy()
+        data_agrupado['CO_IBGE'] = pd.Index([str(codigo).zfill(6) for codigo in unicos]).take(codigos)
+        for coluna in COLUNAS_ATRIBUTOS:
+            if coluna.startswith('CO_'):
+                data_agrupado[coluna] = atributos[coluna].to_numpy()[codigos]
+                continue
+            # Categorias sobre os valores distintos: a expansão para as linhas é só um take de códigos
+            valores = pd.Categorical(atributos[coluna])
+            data_agrupado[coluna] = pd.Categorical.from_codes(valores.codes[codigos], dtype=valores.dtype)
+        return data_agrupado
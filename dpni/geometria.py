@@ -0,0 +1,361 @@
+"""Geometria das UFs e dos municípios empacotada em dados/, simplificada para a resolução de tela.
+
+O GeoJSON de origem é simplificado uma única vez com Douglas-Peucker, com as
+coordenadas arredondadas e só as propriedades usadas pelo mapa, e gravado em
+dados/geometria/. O Dashboard lê cada arquivo uma vez por processo e envia ao
+navegador apenas as feições exibidas, então o mapa funciona sem internet.
+
+Os municípios têm dois níveis de detalhe: um arquivo nacional com formas
+grosseiras (visão do Brasil ou de uma região) e um arquivo por UF com formas
+mais finas, usado quando o filtro seleciona uma única UF.
+
+Os arquivos versionados em dados/geometria/ vêm da malha municipal do IBGE de 2005
+(1:2.500.000, shapefile 55mu2500gsd), redistribuída no pacote django-gis-brasil
+0.3 do PyPI (ORIGEM_MALHA_IBGE). O subcomando malha os regenera: separa os
+municípios por UF, grava os dois níveis de detalhe dos municípios e obtém cada UF
+pela dissolução dos seus municípios, então as duas camadas se encaixam. Ler o
+shapefile e dissolver pedem pyshp e shapely, que só quem regenera precisa instalar.
+As demais URLs servem para empacotar outra fonte e, no Dashboard, a das UFs é só
+o último recurso se o arquivo versionado faltar.
+
+Uso: python -m dpni.geometria malha [--origem ZIP_OU_URL]
+     python -m dpni.geometria [estados] [--origem URL_OU_ARQUIVO] [--destino dados/geometria/estados.geojson]
+     python -m dpni.geometria municipios [--origem MODELO_COM_{co_uf}]
+"""
+import argparse
+import functools
+import hashlib
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+
+DIRETORIO_GEOMETRIA = "dados/geometria"
+ARQUIVO_GEOMETRIA_ESTADOS = os.path.join(DIRETORIO_GEOMETRIA, "estados.geojson")
+ORIGEM_GEOMETRIA_ESTADOS = (
+    "https://raw.githubusercontent.com/codeforamerica/click_that_hood/master/public/data/brazil-states.geojson"
+)
+CHAVE_ESTADOS = 'sigla'
+
+ARQUIVO_GEOMETRIA_MUNICIPIOS = os.path.join(DIRETORIO_GEOMETRIA, "municipios.geojson")
+DIRETORIO_GEOMETRIA_MUNICIPIOS_UF = os.path.join(DIRETORIO_GEOMETRIA, "municipios")
+# Um GeoJSON por UF (código IBGE de 2 dígitos), com o código do município de 7 dígitos em properties.id
+ORIGEM_GEOMETRIA_MUNICIPIOS = "https://raw.githubusercontent.com/tbrugz/geodata-br/master/geojson/geojs-{co_uf}-mun.json"
+CHAVE_MUNICIPIOS = 'co_ibge'
+
+# Malha municipal do IBGE (1:2.500.000, 2005) dentro do pacote django-gis-brasil 0.3:
+# origem dos arquivos versionados; os municípios têm o código de 7 dígitos em GEOCODIG_M
+ORIGEM_MALHA_IBGE = (
+    "https://files.pythonhosted.org/packages/34/44/d591dc94b4d6809348222fce62c80e7f56a18916985cb34beed36ed98d3d/"
+    "django-gis-brasil-0.3.zip"
+)
+SHA256_MALHA_IBGE = "43693d73c43d0962e92b5da15e295201512d8e360718b673ca222d1e4d08a953"
+SHAPEFILE_MALHA_IBGE = "55mu2500gsd"
+# Fechamento (buffer positivo e negativo, em graus: ~50 m) das frestas que a dissolução
+# deixa entre municípios vizinhos cujas bordas não coincidem exatamente
+FECHAMENTO_DISSOLUCAO = 0.0005
+
+# Níveis de detalhe dos municípios: (tolerância em graus, casas decimais)
+DETALHE_MUNICIPIOS = {
+    'brasil': (0.05, 2),
+    'uf': (0.005, 3),
+}
+
+# ~1 km de tolerância e ~100 m de precisão: abaixo de um pixel no mapa do Brasil inteiro
+TOLERANCIA_PADRAO = 0.01
+CASAS_DECIMAIS = 3
+# Limite de casas ao refazer uma feição que sumiu (6 casas ≈ 10 cm)
+CASAS_MAXIMAS = 6
+
+
+def _douglas_peucker(pontos, tolerancia):
+    """Máscara dos pontos mantidos pela simplificação de Douglas-Peucker (iterativa)"""
+    manter = np.zeros(len(pontos), dtype=bool)
+    manter[[0, -1]] = True
+    pilha = [(0, len(pontos) - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        a, b = pontos[inicio], pontos[fim]
+        trecho = pontos[inicio + 1:fim]
+        direcao = b - a
+        norma = np.hypot(*direcao)
+        if norma == 0:
+            distancias = np.hypot(*(trecho - a).T)
+        else:
+            distancias = np.abs(direcao[0] * (trecho[:, 1] - a[1]) - direcao[1] * (trecho[:, 0] - a[0])) / norma
+        maior = int(np.argmax(distancias))
+        if distancias[maior] > tolerancia:
+            meio = inicio + 1 + maior
+            manter[meio] = True
+            pilha += [(inicio, meio), (meio, fim)]
+    return manter
+
+
+def simplificar_anel(anel, tolerancia=TOLERANCIA_PADRAO, casas=CASAS_DECIMAIS):
+    """Anel simplificado e arredondado, ou None se ele some na resolução pedida"""
+    pontos = np.round(np.asarray(anel, dtype=float)[:, :2], casas)
+    # Pontos repetidos após o arredondamento não acrescentam nada
+    repetido = np.r_[False, (np.diff(pontos, axis=0) == 0).all(axis=1)]
+    pontos = pontos[~repetido]
+    if len(pontos) < 4:
+        return None
+    pontos = pontos[_douglas_peucker(pontos, tolerancia)]
+    if len(pontos) < 4:
+        return None
+    if not np.array_equal(pontos[0], pontos[-1]):
+        pontos = np.vstack([pontos, pontos[:1]])
+    return [[round(float(x), casas), round(float(y), casas)] for x, y in pontos]
+
+
+def _anel_minimo(poligonos):
+    """Anel externo do maior polígono, sem simplificar nem arredondar"""
+    externo = max((poligono[0] for poligono in poligonos), key=len)
+    return {'type': 'Polygon', 'coordinates': [[[float(x), float(y)] for x, y, *_ in externo]]}
+
+
+def simplificar_geometria(geometria, tolerancia=TOLERANCIA_PADRAO, casas=CASAS_DECIMAIS):
+    """Polygon/MultiPolygon simplificado; polígonos menores que a tolerância são descartados.
+
+    Se todos os polígonos somem, a feição é refeita sem tolerância e com mais casas
+    decimais (até CASAS_MAXIMAS) e, em último caso, fica com o anel externo original:
+    um município pequeno nunca desaparece do mapa.
+    """
+    poligonos = [geometria['coordinates']] if geometria['type'] == 'Polygon' else geometria['coordinates']
+    simplificados = []
+    for poligono in poligonos:
+        externo = simplificar_anel(poligono[0], tolerancia, casas)
+        if externo is None:
+            continue
+        furos = [anel for anel in (simplificar_anel(furo, tolerancia, casas) for furo in poligono[1:]) if anel]
+        simplificados.append([externo] + furos)
+    if not simplificados:
+        # Nunca perder a feição inteira
+        if tolerancia:
+            return simplificar_geometria(geometria, 0, casas)
+        if casas < CASAS_MAXIMAS:
+            return simplificar_geometria(geometria, 0, casas + 1)
+        return _anel_minimo(poligonos)
+    if len(simplificados) == 1:
+        return {'type': 'Polygon', 'coordinates': simplificados[0]}
+    return {'type': 'MultiPolygon', 'coordinates': simplificados}
+
+
+def simplificar_geojson(geojson, chave, tolerancia=TOLERANCIA_PADRAO, casas=CASAS_DECIMAIS, propriedades=('name',)):
+    """FeatureCollection simplificada, mantendo só a chave e as propriedades indicadas"""
+    feicoes = []
+    for feicao in geojson['features']:
+        geometria = simplificar_geometria(feicao['geometry'], tolerancia, casas)
+        if geometria is None:
+            continue
+        props = {nome: feicao['properties'][nome] for nome in (chave, *propriedades) if nome in feicao['properties']}
+        feicoes.append({'type': 'Feature', 'properties': props, 'geometry': geometria})
+    return {'type': 'FeatureCollection', 'features': feicoes}
+
+
+def _ler_bytes(origem):
+    """Conteúdo de um arquivo local ou de uma URL"""
+    if origem.startswith(('http://', 'https://')):
+        import requests
+        resposta = requests.get(origem, timeout=300)
+        resposta.raise_for_status()
+        return resposta.content
+    with open(origem, 'rb') as arquivo:
+        return arquivo.read()
+
+
+def ler_geojson(origem):
+    """Lê um GeoJSON de um arquivo local ou de uma URL"""
+    if origem.startswith(('http://', 'https://')):
+        import requests
+        resposta = requests.get(origem, timeout=60)
+        resposta.raise_for_status()
+        return resposta.json()
+    with open(origem, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def gravar_geojson(geojson, caminho):
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(geojson, arquivo, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temporario, caminho)
+
+
+@functools.lru_cache(maxsize=None)
+def carregar_geometria(caminho=ARQUIVO_GEOMETRIA_ESTADOS):
+    """GeoJSON empacotado, lido uma vez por processo (None se o arquivo não existe)"""
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def recortar(geojson, identificadores, chave=CHAVE_ESTADOS):
+    """FeatureCollection só com as feições cujos properties[chave] estão em identificadores"""
+    identificadores = set(identificadores)
+    return {
+        'type': 'FeatureCollection',
+        'features': [feicao for feicao in geojson['features'] if feicao['properties'].get(chave) in identificadores],
+    }
+
+
+def caminho_geometria_municipios(uf=None):
+    """Arquivo nacional (formas grosseiras) ou, com uma sigla de UF, o arquivo detalhado da UF"""
+    if uf is None:
+        return ARQUIVO_GEOMETRIA_MUNICIPIOS
+    return os.path.join(DIRETORIO_GEOMETRIA_MUNICIPIOS_UF, f"{uf}.geojson")
+
+
+def _chavear_municipios(geojson, propriedade='id'):
+    """Troca o código IBGE de 7 dígitos da origem pelo de 6 dígitos usado em CO_IBGE"""
+    for feicao in geojson['features']:
+        propriedades = feicao['properties']
+        propriedades[CHAVE_MUNICIPIOS] = str(propriedades.get(propriedade, ''))[:6]
+    return geojson
+
+
+def construir_geometria_municipios(ufs, origem=ORIGEM_GEOMETRIA_MUNICIPIOS, malha=None):
+    """Grava o arquivo detalhado de cada UF e o nacional grosseiro. ufs: {co_uf (2 dígitos): sigla}
+
+    malha, se informada, já traz a FeatureCollection de cada UF ({co_uf: geojson}, com
+    o código de 7 dígitos em properties.id) e dispensa a leitura de origem.
+    """
+    tolerancia_uf, casas_uf = DETALHE_MUNICIPIOS['uf']
+    tolerancia_brasil, casas_brasil = DETALHE_MUNICIPIOS['brasil']
+    nacional = []
+    for co_uf, sigla in sorted(ufs.items()):
+        geojson = malha[co_uf] if malha is not None else ler_geojson(origem.format(co_uf=co_uf, sg_uf=sigla))
+        geojson = _chavear_municipios(geojson)
+        gravar_geojson(simplificar_geojson(geojson, CHAVE_MUNICIPIOS, tolerancia_uf, casas_uf),
+                       caminho_geometria_municipios(sigla))
+        nacional += simplificar_geojson(geojson, CHAVE_MUNICIPIOS, tolerancia_brasil, casas_brasil)['features']
+    gravar_geojson({'type': 'FeatureCollection', 'features': nacional}, caminho_geometria_municipios())
+    return len(nacional)
+
+
+def ler_malha_ibge(origem=ORIGEM_MALHA_IBGE):
+    """Municípios da malha do IBGE por UF: {co_uf: FeatureCollection com id (7 dígitos) e name}.
+
+    origem é o zip do django-gis-brasil (URL ou arquivo local); o da URL padrão é
+    conferido pelo SHA-256. Precisa do pyshp.
+    """
+    import shapefile
+    conteudo = _ler_bytes(origem)
+    if origem == ORIGEM_MALHA_IBGE and hashlib.sha256(conteudo).hexdigest() != SHA256_MALHA_IBGE:
+        raise ValueError(f"SHA-256 divergente para {origem}")
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+        partes = {}
+        for nome in pacote.namelist():
+            base, _, extensao = os.path.basename(nome).rpartition('.')
+            if base == SHAPEFILE_MALHA_IBGE and extensao in ('shp', 'shx', 'dbf'):
+                partes[extensao] = io.BytesIO(pacote.read(nome))
+    if len(partes) < 3:
+        raise ValueError(f"{SHAPEFILE_MALHA_IBGE}.shp/.shx/.dbf não encontrados em {origem}")
+    leitor = shapefile.Reader(encoding='latin1', **partes)
+    malha = {}
+    for registro in leitor.iterShapeRecords():
+        atributos = registro.record.as_dict()
+        malha.setdefault(str(atributos['UF']).zfill(2), {'type': 'FeatureCollection', 'features': []})['features'].append({
+            'type': 'Feature',
+            'properties': {'id': str(atributos['GEOCODIG_M']), 'name': atributos['Nome_Munic']},
+            'geometry': registro.shape.__geo_interface__,
+        })
+    return malha
+
+
+def dissolver_estados(malha, ufs, nomes, fechamento=FECHAMENTO_DISSOLUCAO):
+    """FeatureCollection das UFs como a união dos seus municípios (na ordem de ufs). Precisa do shapely"""
+    from shapely.geometry import mapping, shape
+    from shapely.ops import unary_union
+    from shapely.validation import make_valid
+    feicoes = []
+    for co_uf, sigla in ufs.items():
+        uniao = unary_union([make_valid(shape(feicao['geometry'])) for feicao in malha[co_uf]['features']])
+        uniao = uniao.buffer(fechamento).buffer(-fechamento)
+        feicoes.append({'type': 'Feature', 'properties': {CHAVE_ESTADOS: sigla, 'name': nomes[co_uf]},
+                        'geometry': mapping(uniao)})
+    return {'type': 'FeatureCollection', 'features': feicoes}
+
+
+def geometria_municipios(codigos, uf=None):
+    """Feições dos municípios em codigos (CO_IBGE) no nível de detalhe da seleção.
+
+    Com uma UF selecionada usa as formas finas da UF; sem UF, as formas grosseiras
+    do arquivo nacional. Retorna None se o arquivo empacotado não existe.
+    """
+    geojson = carregar_geometria(caminho_geometria_municipios(uf))
+    if geojson is None:
+        return None
+    return recortar(geojson, (str(codigo).zfill(6) for codigo in codigos), CHAVE_MUNICIPIOS)
+
+
+def municipios_sem_geometria(codigos, geojson=None):
+    """Códigos (CO_IBGE de 6 dígitos) sem feição no GeoJSON dos municípios (por padrão, o nacional).
+
+    A malha de 2005 não tem os municípios instalados depois dela; esses ficam fora do mapa.
+    """
+    if geojson is None:
+        geojson = carregar_geometria(ARQUIVO_GEOMETRIA_MUNICIPIOS) or {'features': []}
+    presentes = {feicao['properties'].get(CHAVE_MUNICIPIOS) for feicao in geojson['features']}
+    return [codigo for codigo in (str(codigo).zfill(6) for codigo in codigos) if codigo not in presentes]
+
+
+def _relatar_sem_geometria(caminho_municipios):
+    """Lista os municípios da tabela de referência que ficaram sem forma no arquivo nacional"""
+    import pandas as pd
+    municipios = pd.read_csv(caminho_municipios, sep=';', dtype=str)
+    with open(ARQUIVO_GEOMETRIA_MUNICIPIOS, encoding='utf-8') as arquivo:
+        geojson = json.load(arquivo)
+    faltando = set(municipios_sem_geometria(municipios['co_municipio_ibge'], geojson))
+    if faltando:
+        nomes = municipios.loc[municipios['co_municipio_ibge'].str.zfill(6).isin(faltando)]
+        print(f"{len(faltando)} municípios de {caminho_municipios} sem geometria (ficam fora do mapa): "
+              + ', '.join(f"{nome} ({uf})" for nome, uf in zip(nomes['no_municipio'], nomes['sg_uf'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simplifica e empacota a geometria das UFs ou dos municípios em dados/")
+    parser.add_argument('camada', nargs='?', choices=['estados', 'municipios', 'malha'], default='estados',
+                        help="malha regenera as duas camadas a partir da malha do IBGE")
+    parser.add_argument('--origem', default=None,
+                        help="URL ou arquivo GeoJSON de origem (municípios: modelo com {co_uf} ou {sg_uf}; "
+                             "malha: zip do django-gis-brasil)")
+    parser.add_argument('--destino', default=ARQUIVO_GEOMETRIA_ESTADOS, help="arquivo da camada de estados")
+    parser.add_argument('--estados', default="dados/estados_brasil.csv", help="UFs cujos municípios são empacotados")
+    parser.add_argument('--municipios', default="dados/municipio.csv",
+                        help="tabela de referência conferida contra a geometria gravada")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO, help="em graus")
+    parser.add_argument('--casas', type=int, default=CASAS_DECIMAIS)
+    args = parser.parse_args(argv)
+
+    if args.camada in ('municipios', 'malha'):
+        import pandas as pd
+        estados = pd.read_csv(args.estados, dtype=str)
+        ufs = dict(zip(estados['co_uf'].str.zfill(2), estados['sg_uf']))
+    if args.camada == 'municipios':
+        total = construir_geometria_municipios(ufs, args.origem or ORIGEM_GEOMETRIA_MUNICIPIOS)
+        print(f"{total} municípios gravados em {DIRETORIO_GEOMETRIA} ({len(ufs)} arquivos por UF + nacional)")
+        _relatar_sem_geometria(args.municipios)
+        return
+    if args.camada == 'malha':
+        malha = ler_malha_ibge(args.origem or ORIGEM_MALHA_IBGE)
+        total = construir_geometria_municipios(ufs, malha=malha)
+        print(f"{total} municípios gravados em {DIRETORIO_GEOMETRIA} ({len(ufs)} arquivos por UF + nacional)")
+        _relatar_sem_geometria(args.municipios)
+        origem = dissolver_estados(malha, ufs, dict(zip(estados['co_uf'].str.zfill(2), estados['no_uf'])))
+    else:
+        origem = ler_geojson(args.origem or ORIGEM_GEOMETRIA_ESTADOS)
+    geojson = simplificar_geojson(origem, CHAVE_ESTADOS, args.tolerancia, args.casas)
+    gravar_geojson(geojson, args.destino)
+    antes = len(json.dumps(origem, separators=(',', ':')))
+    depois = os.path.getsize(args.destino)
+    print(f"{len(geojson['features'])} feições gravadas em {args.destino} ({antes / 1024:.0f} KB → {depois / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Índice de posições de linha para a cadeia de filtros do Dashboard.
+
+Para cada dimensão de filtro guarda, por valor, a lista ordenada das posições das
+linhas que têm esse valor. Uma combinação de filtros é resolvida intersectando
+essas listas (começando pela menor) e as linhas são tomadas uma única vez, então
+o custo acompanha o tamanho das seleções e não o do conjunto completo.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSOES_FILTRO = ['NU_ANO', 'REGIAO', 'sg_uf', 'no_municipio', 'DS_COBERTURA']
+
+_VAZIO = np.empty(0, dtype=np.int64)
+
+
+def _intersectar(menor, maior):
+    """Interseção de dois arrays ordenados e sem repetição, em O(len(menor) · log len(maior))"""
+    if len(menor) == 0 or len(maior) == 0:
+        return _VAZIO
+    posicoes = np.searchsorted(maior, menor)
+    posicoes[posicoes == len(maior)] = len(maior) - 1
+    return menor[maior[posicoes] == menor]
+
+
+class IndiceFiltros:
+    """Listas de posições de linha por valor de cada dimensão de filtro.
+
+    ordens ({coluna: ordem}, como devolvido por ordens()) reaproveita as ordenações
+    já calculadas, por exemplo mapeadas de um arquivo publicado.
+    """
+
+    def __init__(self, data, dimensoes=DIMENSOES_FILTRO, ordens=None):
+        self.total = len(data)
+        self._dimensoes = {}
+        for coluna in dimensoes:
+            if coluna not in data.columns:
+                continue
+            codigos, valores = pd.factorize(data[coluna])
+            if ordens and coluna in ordens:
+                ordem = ordens[coluna]
+            else:
+                # Ordenação estável: as posições de cada valor ficam contíguas e em ordem crescente
+                ordem = np.argsort(codigos, kind='stable').astype(np.int64)
+            contagens = np.bincount(codigos[codigos >= 0], minlength=len(valores))
+            inicio = int((codigos < 0).sum()) + np.concatenate(([0], np.cumsum(contagens)[:-1]))
+            faixas = {valor: (int(a), int(a + n)) for valor, a, n in zip(valores, inicio, contagens)}
+            self._dimensoes[coluna] = (ordem, faixas)
+
+    def ordens(self):
+        """{coluna: posições das linhas ordenadas pelo valor da coluna}"""
+        return {coluna: ordem for coluna, (ordem, _) in self._dimensoes.items()}
+
+    def posicoes(self, coluna, valor):
+        """Posições (ordenadas) das linhas com coluna == valor"""
+        ordem, faixas = self._dimensoes[coluna]
+        faixa = faixas.get(valor)
+        if faixa is None:
+            return _VAZIO
+        return ordem[faixa[0]:faixa[1]]
+
+    def selecionar(self, filtros):
+        """Posições das linhas que atendem a todos os filtros {coluna: valor}; None se não houver filtro"""
+        if not filtros:
+            return None
+        listas = sorted((self.posicoes(coluna, valor) for coluna, valor in filtros.items()), key=len)
+        resultado = listas[0]
+        for lista in listas[1:]:
+            resultado = _intersectar(resultado, lista)
+        return resultado
+
+    def aplicar(self, data, filtros):
+        """Linhas de data (o mesmo DataFrame usado na construção) que atendem aos filtros"""
+        posicoes = self.selecionar(filtros)
+        if posicoes is None:
+            return data
+        return data.take(posicoes)
@@ -0,0 +1,151 @@
+"""Ingestão incremental de extratos mensais (delta) no armazenamento colunar.
+
+Um extrato delta traz os meses novos ou corrigidos. Cada (NU_ANO, NU_MES) presente
+no delta substitui por inteiro as linhas desse mês no armazenamento, de modo que
+aplicar o mesmo delta de novo dá o mesmo resultado. Só as partições dos anos
+afetados são reescritas (e trocadas diretório a diretório), junto com as linhas
+desses anos no cubo; o custo acompanha o tamanho do delta e do ano, não o do
+histórico.
+
+Uso: python -m dpni.ingestao DELTA.zip [--destino DIR] [--memoria-maxima 512MB]
+"""
+import argparse
+import os
+import shutil
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from dpni.armazenamento import (
+    ARQUIVO_CUBO,
+    COLUNAS_PARTICAO,
+    DIRETORIO_ARMAZENAMENTO,
+    FORMATOS,
+    VERSAO_ARMAZENAMENTO,
+    _gravar_manifesto,
+    _particionamento,
+    _substituir_diretorio,
+    ler_armazenamento,
+    ler_manifesto,
+)
+from dpni.carga import ARQUIVO_ESTADOS, ARQUIVO_MUNICIPIOS, assinatura_arquivos, carregar_dados_agrupados
+from dpni.cubo import COLUNAS_CUBO, construir_cubo, gravar_cubo
+from dpni.esquema import aplicar_esquema
+
+# Quantos deltas aplicados ficam registrados no manifesto
+MAXIMO_HISTORICO_DELTAS = 120
+
+
+def meses_do_delta(delta):
+    """{ano: [meses]} presentes no delta agregado"""
+    pares = delta[['NU_ANO', 'NU_MES']].drop_duplicates()
+    return {int(ano): sorted(int(mes) for mes in grupo['NU_MES']) for ano, grupo in pares.groupby('NU_ANO')}
+
+
+def combinar_ano(atual, delta_ano, meses):
+    """Linhas do ano com os meses do delta substituídos pelas linhas do delta"""
+    if atual is None or atual.empty:
+        return delta_ano
+    mantidas = atual[~atual['NU_MES'].isin(meses)]
+    return pd.concat([mantidas, delta_ano[atual.columns]], ignore_index=True)
+
+
+def _trocar_anos(temporario, destino, anos):
+    """Troca os diretórios NU_ANO=... dos anos afetados pelos recém-gravados"""
+    for ano in anos:
+        nome = f"NU_ANO={ano}"
+        novo = os.path.join(temporario, nome)
+        atual = os.path.join(destino, nome)
+        if os.path.exists(novo):
+            _substituir_diretorio(novo, atual)
+        else:
+            # O ano ficou sem linhas: some do armazenamento
+            shutil.rmtree(atual, ignore_errors=True)
+
+
+def ingerir_delta(caminho_delta, destino=DIRETORIO_ARMAZENAMENTO,
+                  caminho_municipios=ARQUIVO_MUNICIPIOS, caminho_estados=ARQUIVO_ESTADOS,
+                  memoria_maxima=None):
+    """Aplica o extrato delta ao armazenamento existente e retorna o novo manifesto"""
+    manifesto = ler_manifesto(destino)
+    if manifesto is None:
+        raise FileNotFoundError(f"Armazenamento colunar não encontrado em {destino}; faça a ingestão completa antes")
+    if manifesto.get('versao') != VERSAO_ARMAZENAMENTO:
+        raise ValueError(f"Armazenamento em {destino} é da versão {manifesto.get('versao')}; "
+                         f"refaça a ingestão completa (versão {VERSAO_ARMAZENAMENTO})")
+
+    delta, _ = carregar_dados_agrupados(caminho_delta, caminho_municipios, caminho_estados, memoria_maxima)
+    faltando = [coluna for coluna in manifesto['colunas'] if coluna not in delta.columns]
+    if faltando:
+        raise ValueError(f"Colunas ausentes no delta: {faltando}")
+    meses = meses_do_delta(delta)
+
+    # Reescreve só os anos afetados, cada um a partir das suas partições e do delta
+    temporario = destino + '.delta'
+    shutil.rmtree(temporario, ignore_errors=True)
+    anos_existentes = set(manifesto['anos'])
+    cubos_novos = []
+    particoes_novas = []
+    for ano, meses_ano in meses.items():
+        atual = ler_armazenamento(destino, anos=[ano]) if ano in anos_existentes else None
+        delta_ano = delta[delta['NU_ANO'] == ano]
+        dados_ano = aplicar_esquema(combinar_ano(atual, delta_ano, meses_ano)[manifesto['colunas']])
+        ds.write_dataset(
+            pa.Table.from_pandas(dados_ano, preserve_index=False),
+            temporario,
+            format=FORMATOS[manifesto['formato']],
+            partitioning=_particionamento(),
+            existing_data_behavior='overwrite_or_ignore',
+        )
+        cubos_novos.append(construir_cubo(dados_ano))
+        particoes_novas += dados_ano[COLUNAS_PARTICAO].drop_duplicates().values.tolist()
+
+    # Cubo: as linhas dos anos afetados são trocadas pelas recalculadas
+    caminho_cubo = os.path.join(destino, ARQUIVO_CUBO)
+    cubo = pd.read_parquet(caminho_cubo)
+    cubo = pd.concat([cubo[~cubo['NU_ANO'].isin(list(meses))]] + cubos_novos, ignore_index=True)
+    cubo = cubo.reindex(columns=COLUNAS_CUBO)
+
+    _trocar_anos(temporario, destino, meses)
+    shutil.rmtree(temporario, ignore_errors=True)
+    gravar_cubo(cubo, caminho_cubo + '.tmp')
+    os.replace(caminho_cubo + '.tmp', caminho_cubo)
+
+    # Manifesto por último: a nova versão só aparece com partições e cubo já trocados
+    particoes = [par for par in manifesto['particoes'] if par[0] not in meses]
+    particoes += [[int(ano), int(uf)] for ano, uf in particoes_novas]
+    assinatura = assinatura_arquivos(caminho_delta)[0]
+    manifesto = dict(manifesto)
+    manifesto['particoes'] = sorted(particoes)
+    manifesto['anos'] = sorted({ano for ano, _ in particoes})
+    manifesto['deltas'] = (manifesto.get('deltas', []) + [{
+        'arquivo': os.path.basename(caminho_delta),
+        'sha256': assinatura[3],
+        'meses': {str(ano): meses_ano for ano, meses_ano in meses.items()},
+        'aplicado_em': time.time(),
+    }])[-MAXIMO_HISTORICO_DELTAS:]
+    manifesto['construido_em'] = time.time()
+    _gravar_manifesto(destino, manifesto)
+    return manifesto
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aplica um extrato delta (meses novos ou corrigidos) ao armazenamento colunar")
+    parser.add_argument('delta', help="ZIP com o CSV do extrato delta, no mesmo formato do extrato de residência")
+    parser.add_argument('--municipios', default=ARQUIVO_MUNICIPIOS)
+    parser.add_argument('--estados', default=ARQUIVO_ESTADOS)
+    parser.add_argument('--destino', default=DIRETORIO_ARMAZENAMENTO)
+    parser.add_argument('--memoria-maxima', default=None)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    manifesto = ingerir_delta(args.delta, args.destino, args.municipios, args.estados, args.memoria_maxima)
+    meses = manifesto['deltas'][-1]['meses']
+    descricao = ', '.join(f"{ano}: {', '.join(map(str, lista))}" for ano, lista in meses.items())
+    print(f"Meses substituídos ({descricao}) em {args.destino} em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
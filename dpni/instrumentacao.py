@@ -0,0 +1,151 @@
+"""Instrumentação opcional das etapas do pipeline e das seções do Dashboard.
+
+Cada etapa registra tempo de parede, linhas de entrada e de saída e a variação da
+memória residente do processo, e é emitida como uma linha de log JSON (logger
+'dpni.instrumentacao') para o coletor de logs. Desligada, etapa() devolve um
+contexto nulo compartilhado, então o custo é uma chamada de método por etapa.
+
+Também mede a memória própria de cada sessão do Dashboard (o que ela guarda além
+dos dados compartilhados), emitida como o evento 'dpni.sessao'.
+
+Liga com a variável de ambiente DPNI_INSTRUMENTACAO=1 (ou ativo=True).
+"""
+import json
+import logging
+import os
+import time
+import uuid
+
+import pandas as pd
+
+from dpni.esquema import memoria_propria
+
+VARIAVEL_INSTRUMENTACAO = "DPNI_INSTRUMENTACAO"
+COLUNAS_REGISTRO = ['etapa', 'segundos', 'linhas_entrada', 'linhas_saida', 'memoria_delta_mb']
+
+logger = logging.getLogger(__name__)
+
+try:
+    _TAMANHO_PAGINA = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _TAMANHO_PAGINA = 4096
+
+
+def memoria_residente():
+    """Memória residente do processo em bytes (None onde /proc não está disponível)"""
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * _TAMANHO_PAGINA
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def instrumentacao_ligada():
+    """Indica se a variável de ambiente pede a instrumentação"""
+    return os.environ.get(VARIAVEL_INSTRUMENTACAO, '').strip().lower() in ('1', 'true', 'sim', 'on')
+
+
+def configurar_log(nivel=logging.INFO):
+    """Envia as linhas JSON para o stderr (uma por linha, sem prefixo), se ninguém configurou o logger"""
+    if not logger.handlers:
+        manipulador = logging.StreamHandler()
+        manipulador.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(manipulador)
+        logger.propagate = False
+    logger.setLevel(nivel)
+
+
+class _EtapaInativa:
+    """Contexto nulo usado quando a instrumentação está desligada"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        return False
+
+    def saida(self, linhas):
+        pass
+
+
+_INATIVA = _EtapaInativa()
+
+
+class _Etapa:
+    """Medição de uma etapa; saida(linhas) informa as linhas produzidas"""
+
+    def __init__(self, instrumentacao, nome, linhas_entrada):
+        self._instrumentacao = instrumentacao
+        self.nome = nome
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida = None
+
+    def saida(self, linhas):
+        self.linhas_saida = linhas
+
+    def __enter__(self):
+        self._memoria = memoria_residente()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excecao):
+        segundos = time.perf_counter() - self._inicio
+        memoria = memoria_residente()
+        delta = None
+        if memoria is not None and self._memoria is not None:
+            delta = (memoria - self._memoria) / (1 << 20)
+        self._instrumentacao.registrar(self.nome, segundos, self.linhas_entrada, self.linhas_saida, delta)
+        return False
+
+
+class Instrumentacao:
+    """Registros das etapas de uma execução (um rerun do Dashboard ou um job em lote)"""
+
+    def __init__(self, ativo=None, execucao=None):
+        self.ativo = instrumentacao_ligada() if ativo is None else ativo
+        self.execucao = execucao or uuid.uuid4().hex[:12]
+        self.registros = []
+        self.memoria_sessao = None
+        self.encerrada = False
+        if self.ativo:
+            configurar_log()
+
+    def encerrar(self):
+        """Marca o fim da execução: o que for medido depois pertence a outra execução"""
+        self.encerrada = True
+
+    def etapa(self, nome, linhas_entrada=None):
+        """Contexto que mede a etapa: with instrumentacao.etapa('filtros', len(data)) as etapa: ..."""
+        if not self.ativo:
+            return _INATIVA
+        return _Etapa(self, nome, linhas_entrada)
+
+    def registrar(self, nome, segundos, linhas_entrada=None, linhas_saida=None, memoria_delta_mb=None):
+        registro = {
+            'etapa': nome,
+            'segundos': segundos,
+            'linhas_entrada': linhas_entrada,
+            'linhas_saida': linhas_saida,
+            'memoria_delta_mb': memoria_delta_mb,
+        }
+        self.registros.append(registro)
+        logger.info(json.dumps({'evento': 'dpni.etapa', 'execucao': self.execucao, **registro}, ensure_ascii=False))
+
+    def registrar_sessao(self, objetos, compartilhados=()):
+        """Memória própria da sessão em MB: objetos {nome: objeto} menos o que é vista de compartilhados"""
+        if not self.ativo:
+            return None
+        por_objeto = {nome: memoria_propria(objeto, compartilhados) / (1 << 20) for nome, objeto in objetos.items()}
+        maiores = dict(sorted(por_objeto.items(), key=lambda item: item[1], reverse=True)[:5])
+        self.memoria_sessao = {'memoria_sessao_mb': sum(por_objeto.values()), 'objetos': len(objetos), 'maiores_mb': maiores}
+        self.registrar_evento('dpni.sessao', **self.memoria_sessao)
+        return self.memoria_sessao['memoria_sessao_mb']
+
+    def registrar_evento(self, evento, **dados):
+        """Linha de log JSON avulsa (por exemplo, as estatísticas de um cache)"""
+        if self.ativo:
+            logger.info(json.dumps({'evento': evento, 'execucao': self.execucao, **dados}, ensure_ascii=False))
+
+    def tabela(self):
+        """Registros como DataFrame, na ordem em que as etapas terminaram"""
+        return pd.DataFrame(self.registros, columns=COLUNAS_REGISTRO)
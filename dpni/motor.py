@@ -0,0 +1,159 @@
+"""Motor de coberturas independente do Streamlit.
+
+Reúne o pipeline do Dashboard (carga → agregação → enriquecimento → filtro →
+cobertura) em uma API de funções que pode ser usada em jobs em lote, e uma linha
+de comando que emite as tabelas de cobertura de uma seleção de ano, geografia e
+vacina. Sem --ano, a tabela cobre todos os anos; com --nivel municipio, todos os
+municípios da seleção.
+
+Uso: python -m dpni.motor [--ano 2025] [--regiao R] [--uf SP] [--municipio NOME] [--cobertura BCG]
+                          [--nivel brasil|regiao|uf|municipio] [--formato json|csv|parquet] [--saida ARQUIVO]
+"""
+import argparse
+import sys
+
+from dpni.armazenamento import (
+    DIRETORIO_ARMAZENAMENTO,
+    FORMATOS,
+    carregar_cubo,
+    garantir_armazenamento,
+    ler_armazenamento,
+)
+from dpni.carga import ARQUIVO_ESTADOS, ARQUIVO_MUNICIPIOS, ARQUIVO_RESIDENCIA, carregar_geografia
+from dpni.cubo import NIVEIS, serie_acumulada, totais_por_cobertura, totais_por_nivel, totais_por_uf
+from dpni.esquema import somente_leitura
+from dpni.indice import IndiceFiltros
+from dpni.resumo import classificar_totais, resumo_coberturas
+
+FORMATOS_SAIDA = ['json', 'csv', 'parquet']
+
+
+def filtros_selecao(regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+    """Filtros {coluna: valor} da seleção, sem as opções 'Todas'/'Todos'"""
+    return {
+        coluna: valor
+        for coluna, valor, todos in [
+            ('REGIAO', regiao, 'Todas'),
+            ('sg_uf', uf, 'Todos'),
+            ('no_municipio', municipio, 'Todos'),
+            ('DS_COBERTURA', descricao, 'Todos'),
+        ]
+        if valor != todos
+    }
+
+
+def filtrar_dados(data, indice, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+    """Linhas de data (dados de um ano com o seu IndiceFiltros) que atendem à seleção"""
+    return indice.aplicar(data, filtros_selecao(regiao, uf, municipio, descricao))
+
+
+def coberturas_selecao(cubo, ano, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+    """Cobertura, meta, faixa e cor de cada vacina da seleção (índice: DS_COBERTURA)"""
+    return resumo_coberturas(totais_por_cobertura(cubo, ano, regiao, uf, municipio, descricao))
+
+
+def tabela_coberturas(cubo, nivel='brasil', ano=None, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+    """Tabela de cobertura por ano, unidade do nível e vacina, com meta, faixa e cor"""
+    tabela = totais_por_nivel(cubo, nivel, ano, regiao, uf, municipio, descricao)
+    return classificar_totais(tabela, tabela['DS_COBERTURA'])
+
+
+def cobertura_por_uf(cubo, ano, cobertura, regiao='Todas', uf='Todos', municipio='Todos'):
+    """Doses, população e cobertura (%) por sg_uf de uma vacina (dados do mapa e do gráfico de barras)"""
+    por_uf = totais_por_uf(cubo, ano, cobertura, regiao, uf, municipio)
+    # Mesma regra do resumo: cobertura 0 quando a população não é positiva
+    por_uf['COBERTURA'] = (por_uf['QT_DOSES'] / por_uf['QT_POPULACAO']).where(por_uf['QT_POPULACAO'] > 0, 0) * 100
+    return por_uf
+
+
+def evolucao_mensal(cubo, cobertura, regiao='Todas', uf='Todos', municipio='Todos'):
+    """Cobertura acumulada no ano, mês a mês, de uma vacina em todos os anos"""
+    # Doses e população acumuladas POR ANO já vêm calculadas da ingestão
+    evolucao = serie_acumulada(cubo, cobertura, regiao, uf, municipio)
+    populacao = evolucao['QT_POPULACAO_ACUMULADA']
+    evolucao['COBERTURA'] = (evolucao['QT_DOSES_ACUMULADAS'] / populacao).where(populacao > 0, 0) * 100
+    return evolucao
+
+
+class MotorCoberturas:
+    """Armazenamento, geografia e cubo carregados uma vez, com os dados por ano sob demanda"""
+
+    def __init__(self, destino=DIRETORIO_ARMAZENAMENTO, formato='parquet',
+                 caminho_residencia=ARQUIVO_RESIDENCIA, caminho_municipios=ARQUIVO_MUNICIPIOS,
+                 caminho_estados=ARQUIVO_ESTADOS, memoria_maxima=None):
+        self.destino = destino
+        self.manifesto = garantir_armazenamento(destino, formato, caminho_residencia, caminho_municipios,
+                                                caminho_estados, memoria_maxima)
+        self.geografia = carregar_geografia(caminho_municipios, caminho_estados)
+        self.cubo = {nivel: somente_leitura(tabela) for nivel, tabela in carregar_cubo(destino).items()}
+        self._anos = {}
+
+    @property
+    def anos(self):
+        return self.manifesto['anos']
+
+    def dados_ano(self, ano):
+        """Dados do ano e o índice de filtros, lidos uma única vez"""
+        if ano not in self._anos:
+            data = somente_leitura(ler_armazenamento(self.destino, anos=[ano]))
+            self._anos[ano] = (data, IndiceFiltros(data))
+        return self._anos[ano]
+
+    def dados(self, ano, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+        """Linhas agregadas da seleção"""
+        data, indice = self.dados_ano(ano)
+        return filtrar_dados(data, indice, regiao, uf, municipio, descricao)
+
+    def coberturas(self, ano, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+        return coberturas_selecao(self.cubo, ano, regiao, uf, municipio, descricao)
+
+    def tabela(self, nivel='brasil', ano=None, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+        return tabela_coberturas(self.cubo, nivel, ano, regiao, uf, municipio, descricao)
+
+
+def gravar_tabela(tabela, formato, saida=None):
+    """Grava a tabela em JSON (registros), CSV ou Parquet; sem saída, JSON e CSV vão para o stdout"""
+    if formato == 'parquet':
+        if not saida:
+            raise ValueError("O formato parquet exige --saida")
+        tabela.to_parquet(saida, index=False)
+    elif formato == 'csv':
+        tabela.to_csv(saida or sys.stdout, index=False)
+    else:
+        texto = tabela.to_json(orient='records', force_ascii=False, indent=2)
+        if saida:
+            with open(saida, 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto)
+        else:
+            sys.stdout.write(texto + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Emite tabelas de cobertura vacinal sem abrir o Dashboard")
+    parser.add_argument('--ano', type=int, default=None, help="sem ano, todos os anos do armazenamento")
+    parser.add_argument('--regiao', default='Todas')
+    parser.add_argument('--uf', default='Todos')
+    parser.add_argument('--municipio', default='Todos')
+    parser.add_argument('--cobertura', default='Todos', help="DS_COBERTURA da vacina")
+    parser.add_argument('--nivel', choices=NIVEIS, default='brasil',
+                        help="unidade geográfica de cada linha da tabela")
+    parser.add_argument('--formato', choices=FORMATOS_SAIDA, default='json')
+    parser.add_argument('--saida', default=None)
+    parser.add_argument('--residencia', default=ARQUIVO_RESIDENCIA)
+    parser.add_argument('--municipios', default=ARQUIVO_MUNICIPIOS)
+    parser.add_argument('--estados', default=ARQUIVO_ESTADOS)
+    parser.add_argument('--destino', default=DIRETORIO_ARMAZENAMENTO)
+    parser.add_argument('--formato-armazenamento', choices=sorted(FORMATOS), default='parquet')
+    parser.add_argument('--memoria-maxima', default=None)
+    args = parser.parse_args(argv)
+
+    motor = MotorCoberturas(args.destino, args.formato_armazenamento, args.residencia, args.municipios,
+                            args.estados, args.memoria_maxima)
+    if args.ano is not None and args.ano not in motor.anos:
+        parser.error(f"ano {args.ano} não encontrado (disponíveis: {', '.join(map(str, motor.anos))})")
+    tabela = motor.tabela(args.nivel, args.ano, args.regiao, args.uf, args.municipio, args.cobertura)
+    gravar_tabela(tabela, args.formato, args.saida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Publicação dos dados agregados em arquivos Arrow mapeados em memória, para vários processos.
+
+Um processo construtor grava, a partir do armazenamento colunar, um arquivo Arrow
+IPC sem compressão por ano (colunas já no esquema compacto, na ordem de leitura,
+com as ordenações do IndiceFiltros) e um por nível do cubo. As colunas
+categóricas são gravadas como os seus códigos inteiros, com as categorias nos
+metadados, de modo que todas as colunas voltam como arrays numpy apoiados
+diretamente no mapeamento: os processos do Dashboard anexam os arquivos sem
+copiar nem reprocessar nada, e as páginas ficam no cache do sistema, uma vez só
+para todos os processos.
+
+Cada publicação vai para um diretório próprio (versoes/<id>) e só passa a valer
+quando o ponteiro _atual.json é trocado (os.replace, atômico). Processos que
+ainda mapeiam uma versão antiga continuam lendo-a até trocarem de versão. As
+versões além das mais recentes são apagadas, mas nunca a anterior à atual nem
+uma substituída há menos de CARENCIA_VERSOES segundos, para que um processo que
+acabou de ler o ponteiro antigo ainda consiga anexá-la; se mesmo assim ela
+sumir, o Dashboard relê _atual.json e anexa a versão nova.
+
+Uso: python -m dpni.publicacao [--residencia ZIP] [--destino dados/residencia_colunar] [--diretorio dados/publicado]
+                               [--intervalo SEGUNDOS] [--manter 2] [--carencia 600]
+Nos processos do Dashboard: DPNI_PUBLICACAO=dados/publicado streamlit run Dashboard.py
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from dpni.armazenamento import (
+    DIRETORIO_ARMAZENAMENTO,
+    carregar_cubo,
+    garantir_armazenamento,
+    ler_armazenamento,
+    ler_manifesto,
+)
+from dpni.carga import ARQUIVO_ESTADOS, ARQUIVO_MUNICIPIOS, ARQUIVO_RESIDENCIA
+from dpni.cubo import NIVEIS
+from dpni.indice import IndiceFiltros
+
+VARIAVEL_PUBLICACAO = "DPNI_PUBLICACAO"
+DIRETORIO_PUBLICACAO = "dados/publicado"
+ARQUIVO_ATUAL = "_atual.json"
+DIRETORIO_VERSOES = "versoes"
+# Prefixos das colunas com as ordenações do IndiceFiltros (arquivo do ano) e com os
+# códigos dos níveis do MultiIndex (arquivos do cubo)
+PREFIXO_ORDEM = "_ordem_"
+PREFIXO_INDICE = "_indice_"
+VERSOES_MANTIDAS = 2
+# Segundos que uma versão substituída ainda fica em disco depois da publicação seguinte
+CARENCIA_VERSOES = 600
+
+
+def diretorio_publicacao_configurado():
+    """Diretório de publicação indicado pela variável de ambiente (None fora desse modo)"""
+    return os.environ.get(VARIAVEL_PUBLICACAO) or None
+
+
+def _nivel_json(nivel):
+    """Valores de um nível de índice, e as categorias se ele for categórico"""
+    if isinstance(nivel.dtype, pd.CategoricalDtype):
+        return {'valores': nivel.astype(object).tolist(), 'categorias': nivel.categories.tolist()}
+    return {'valores': nivel.tolist(), 'tipo': str(nivel.dtype)}
+
+
+def _nivel_de_json(nivel):
+    if 'categorias' in nivel:
+        return pd.CategoricalIndex(nivel['valores'], dtype=pd.CategoricalDtype(nivel['categorias']))
+    return pd.Index(nivel['valores'], dtype=nivel['tipo'])
+
+
+def _tabela_arrow(data, extras=None):
+    """Tabela Arrow com as colunas de data como arrays numpy (categóricas como códigos) em um único bloco.
+
+    Um MultiIndex é gravado como os códigos de cada nível, com os níveis nos metadados.
+    """
+    colunas, categorias, indice = {}, {}, None
+    if isinstance(data.index, pd.MultiIndex):
+        indice = {'nomes': list(data.index.names), 'niveis': [_nivel_json(nivel) for nivel in data.index.levels]}
+        for posicao, codigos in enumerate(data.index.codes):
+            colunas[f"{PREFIXO_INDICE}{posicao}"] = pa.array(np.asarray(codigos))
+    for coluna, serie in data.items():
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            categorias[coluna] = serie.cat.categories.tolist()
+            colunas[coluna] = pa.array(serie.cat.codes.to_numpy())
+        elif serie.dtype == object:
+            colunas[coluna] = pa.array(serie, from_pandas=True)
+        else:
+            # Sem from_pandas, NaN fica como valor (não como nulo) e a coluna volta sem cópia
+            colunas[coluna] = pa.array(serie.to_numpy())
+    for coluna, valores in (extras or {}).items():
+        colunas[coluna] = pa.array(valores)
+    metadados = {'dpni': json.dumps({'colunas': list(data.columns), 'categorias': categorias, 'indice': indice},
+                                    ensure_ascii=False)}
+    return pa.table(colunas).replace_schema_metadata(metadados)
+
+
+def gravar_arrow(data, caminho, extras=None):
+    """Grava data (e colunas extras) em Arrow IPC sem compressão, próprio para mapear em memória"""
+    tabela = _tabela_arrow(data, extras)
+    with pa.OSFile(caminho, 'wb') as arquivo, ipc.new_file(arquivo, tabela.schema) as escritor:
+        escritor.write_table(tabela, max_chunksize=max(len(data), 1))
+
+
+def anexar_arrow(caminho):
+    """(DataFrame, extras) apoiados no arquivo mapeado em memória, sem cópia das colunas numéricas e categóricas.
+
+    O MultiIndex é remontado sobre os códigos mapeados, também sem cópia.
+    """
+    # Os buffers da tabela mantêm o mapeamento vivo enquanto forem usados
+    tabela = ipc.open_file(pa.memory_map(caminho)).read_all()
+    metadados = json.loads(tabela.schema.metadata[b'dpni'])
+    colunas, extras = {}, {}
+    for nome in tabela.column_names:
+        coluna = tabela.column(nome)
+        array = coluna.chunk(0) if coluna.num_chunks == 1 else coluna.combine_chunks()
+        if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            valores = array.to_numpy(zero_copy_only=False)
+        else:
+            valores = array.to_numpy(zero_copy_only=True)
+        if nome in metadados['categorias']:
+            dtype = pd.CategoricalDtype(metadados['categorias'][nome])
+            valores = pd.Categorical.from_codes(valores, dtype=dtype)
+        if nome in metadados['colunas']:
+            colunas[nome] = valores
+        else:
+            extras[nome] = valores
+    indice = None
+    if metadados.get('indice'):
+        codigos = [extras.pop(f"{PREFIXO_INDICE}{posicao}") for posicao in range(len(metadados['indice']['niveis']))]
+        indice = pd.MultiIndex(levels=[_nivel_de_json(nivel) for nivel in metadados['indice']['niveis']],
+                               codes=codigos, names=metadados['indice']['nomes'], verify_integrity=False)
+    return pd.DataFrame(colunas, index=indice, copy=False), extras
+
+
+def _caminho_ano(diretorio, versao, ano):
+    return os.path.join(diretorio, DIRETORIO_VERSOES, versao, f"ano={ano}.arrow")
+
+
+def _caminho_nivel(diretorio, versao, nivel):
+    return os.path.join(diretorio, DIRETORIO_VERSOES, versao, f"cubo={nivel}.arrow")
+
+
+def ler_publicacao(diretorio=DIRETORIO_PUBLICACAO):
+    """Manifesto da versão publicada atual (None se nada foi publicado)"""
+    caminho = os.path.join(diretorio, ARQUIVO_ATUAL)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def assinatura_publicacao(diretorio=DIRETORIO_PUBLICACAO):
+    """(mtime, tamanho) do ponteiro da versão atual: muda a cada publicação e custa um stat"""
+    try:
+        info = os.stat(os.path.join(diretorio, ARQUIVO_ATUAL))
+    except FileNotFoundError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+def anexar_ano(diretorio, versao, ano):
+    """Dados do ano e o seu IndiceFiltros, anexados da versão publicada"""
+    data, extras = anexar_arrow(_caminho_ano(diretorio, versao, ano))
+    ordens = {nome[len(PREFIXO_ORDEM):]: valores for nome, valores in extras.items() if nome.startswith(PREFIXO_ORDEM)}
+    return data, IndiceFiltros(data, ordens=ordens)
+
+
+def anexar_cubo(diretorio, versao):
+    """Níveis do cubo, indexados como em dpni.cubo.indexar_cubo, anexados da versão publicada"""
+    return {nivel: anexar_arrow(_caminho_nivel(diretorio, versao, nivel))[0] for nivel in NIVEIS}
+
+
+def publicar(destino=DIRETORIO_ARMAZENAMENTO, diretorio=DIRETORIO_PUBLICACAO, manter=VERSOES_MANTIDAS,
+             carencia=CARENCIA_VERSOES):
+    """Publica o armazenamento como está em uma nova versão e troca o ponteiro. Retorna o manifesto publicado"""
+    manifesto = ler_manifesto(destino)
+    if manifesto is None:
+        raise FileNotFoundError(f"Armazenamento colunar não encontrado em {destino}")
+    # Nome ordenável pelo instante da publicação
+    versao = f"{time.time_ns():020d}"
+    temporario = os.path.join(diretorio, DIRETORIO_VERSOES, versao + '.construindo')
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    for ano in manifesto['anos']:
+        data = ler_armazenamento(destino, anos=[ano])
+        ordens = {PREFIXO_ORDEM + coluna: ordem for coluna, ordem in IndiceFiltros(data).ordens().items()}
+        gravar_arrow(data, os.path.join(temporario, f"ano={ano}.arrow"), ordens)
+        del data, ordens
+    for nivel, tabela in carregar_cubo(destino).items():
+        gravar_arrow(tabela, os.path.join(temporario, f"cubo={nivel}.arrow"))
+
+    final = os.path.join(diretorio, DIRETORIO_VERSOES, versao)
+    os.replace(temporario, final)
+    publicado = {
+        'publicacao': versao,
+        'publicado_em': time.time(),
+        'anos': manifesto['anos'],
+        'particoes': manifesto['particoes'],
+        'colunas': manifesto['colunas'],
+        'construido_em': manifesto['construido_em'],
+    }
+    # A troca do ponteiro é o único passo visível para os processos do Dashboard
+    ponteiro = os.path.join(diretorio, ARQUIVO_ATUAL)
+    with open(ponteiro + '.tmp', 'w', encoding='utf-8') as arquivo:
+        json.dump(publicado, arquivo, ensure_ascii=False, indent=1)
+    os.replace(ponteiro + '.tmp', ponteiro)
+    remover_versoes_antigas(diretorio, manter, carencia)
+    return publicado
+
+
+def remover_versoes_antigas(diretorio=DIRETORIO_PUBLICACAO, manter=VERSOES_MANTIDAS, carencia=CARENCIA_VERSOES):
+    """Apaga as versões além das `manter` mais recentes.
+
+    A atual e a anterior nunca são apagadas, nem uma versão substituída há menos de
+    `carencia` segundos (o nome da versão seguinte é o instante da substituição).
+    Arquivos ainda mapeados por algum processo continuam válidos para ele até serem
+    desmapeados; o espaço só é liberado depois disso.
+    """
+    atual = (ler_publicacao(diretorio) or {}).get('publicacao')
+    raiz = os.path.join(diretorio, DIRETORIO_VERSOES)
+    versoes = sorted(nome for nome in os.listdir(raiz) if nome.isdigit())
+    limite = time.time_ns() - int(carencia * 1e9)
+    for versao, seguinte in zip(versoes[:-max(manter, 2)], versoes[1:]):
+        if versao != atual and int(seguinte) <= limite:
+            shutil.rmtree(os.path.join(raiz, versao), ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publica os dados agregados em Arrow mapeável para os processos do Dashboard")
+    parser.add_argument('--residencia', default=ARQUIVO_RESIDENCIA)
+    parser.add_argument('--municipios', default=ARQUIVO_MUNICIPIOS)
+    parser.add_argument('--estados', default=ARQUIVO_ESTADOS)
+    parser.add_argument('--destino', default=DIRETORIO_ARMAZENAMENTO, help="armazenamento colunar de origem")
+    parser.add_argument('--diretorio', default=DIRETORIO_PUBLICACAO)
+    parser.add_argument('--manter', type=int, default=VERSOES_MANTIDAS,
+                        help="versões publicadas mantidas em disco (no mínimo a atual e a anterior)")
+    parser.add_argument('--carencia', type=float, default=CARENCIA_VERSOES,
+                        help="segundos que uma versão substituída ainda fica em disco")
+    parser.add_argument('--intervalo', type=float, default=None,
+                        help="segundos entre verificações; republica quando o armazenamento muda")
+    args = parser.parse_args(argv)
+
+    while True:
+        atual = ler_publicacao(args.diretorio)
+        # Reconstrói o armazenamento se o extrato mudou; deltas aplicados por dpni.ingestao também republicam
+        manifesto = garantir_armazenamento(args.destino, caminho_residencia=args.residencia,
+                                           caminho_municipios=args.municipios, caminho_estados=args.estados)
+        if atual is None or atual['construido_em'] != manifesto['construido_em']:
+            inicio = time.perf_counter()
+            publicado = publicar(args.destino, args.diretorio, args.manter, args.carencia)
+            print(f"Versão {publicado['publicacao']} publicada em {args.diretorio} "
+                  f"({len(publicado['anos'])} anos) em {time.perf_counter() - inicio:.1f}s", flush=True)
+        if args.intervalo is None:
+            break
+        time.sleep(args.intervalo)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Resumo de cobertura de todas as vacinas em uma única passada agrupada."""
+import numpy as np
+
+from dpni.cubo import COLUNAS_VALOR
+from dpni.vacinas import COR_SEM_DADOS, classificar_coberturas, meta_cobertura, metas_coberturas
+
+
+def somar_por_cobertura(data):
+    """Doses e população por DS_COBERTURA em um único groupby sobre as linhas filtradas"""
+    return data.groupby('DS_COBERTURA', observed=True)[COLUNAS_VALOR].sum()
+
+
+def classificar_totais(tabela, nomes_cobertura):
+    """Acrescenta COBERTURA (%), META, FAIXA e COR a uma tabela com QT_DOSES e QT_POPULACAO.
+
+    nomes_cobertura traz a vacina de cada linha. A cobertura é 0 quando a população
+    não é positiva.
+    """
+    populacao = tabela['QT_POPULACAO'].to_numpy(dtype=float)
+    doses = tabela['QT_DOSES'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tabela['COBERTURA'] = np.where(populacao > 0, doses / populacao * 100, 0.0)
+    tabela['META'] = metas_coberturas(nomes_cobertura)
+    tabela['FAIXA'], tabela['COR'] = classificar_coberturas(tabela['COBERTURA'], tabela['META'])
+    return tabela
+
+
+def resumo_coberturas(totais):
+    """Tabela indexada por DS_COBERTURA com doses, população, cobertura (%), meta, faixa e cor.
+
+    totais é o resultado de somar_por_cobertura ou de dpni.cubo.totais_por_cobertura.
+    """
+    return classificar_totais(totais[COLUNAS_VALOR].copy(), totais.index)
+
+
+def linha_resumo(resumo, nome_cobertura):
+    """(cobertura, meta, cor) de uma vacina; sem dados na seleção a cobertura é None e a cor é neutra"""
+    if nome_cobertura in resumo.index:
+        linha = resumo.loc[nome_cobertura]
+        return linha['COBERTURA'], linha['META'], linha['COR']
+    return None, meta_cobertura(nome_cobertura), COR_SEM_DADOS
@@ -0,0 +1,107 @@
+"""Gerador de extratos de residência sintéticos, com as mesmas colunas do DPNI.
+
+Produz um ZIP com o CSV separado por ';' (NU_ANO, NU_MES, SG_UF, CO_IBGE,
+TP_COBERTURA, DS_COBERTURA, NU_IDADE, QT_DOSES, QT_POPULACAO) para todos os
+municípios do CSV de referência (ou uma amostra), 12 meses, as vacinas do
+registro e as idades de cada faixa etária. O CSV é escrito mês a mês direto no
+ZIP, então a escala não é limitada pela memória.
+
+Uso: python -m dpni.sintetico --destino dados/residencia_sintetica.zip --anos 2023 2024 2025 [--municipios 500]
+"""
+import argparse
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from dpni.carga import ARQUIVO_MUNICIPIOS, ler_municipios
+from dpni.vacinas import REGISTRO_VACINAS
+
+COLUNAS_RESIDENCIA = ['NU_ANO', 'NU_MES', 'SG_UF', 'CO_IBGE', 'TP_COBERTURA', 'DS_COBERTURA',
+                      'NU_IDADE', 'QT_DOSES', 'QT_POPULACAO']
+
+# Idades (em anos) registradas para cada faixa etária; vacinas sem faixa usam a de menores de 1 ano
+IDADES_GRUPO = {
+    'Ao Nascer': [0],
+    'Menores de 1 Ano de Idade': [0],
+    '1 Ano de Idade': [1],
+    'Adulto': list(range(15, 50, 5)),
+}
+
+
+def _vacinas_e_idades(coberturas=None):
+    """Pares (DS_COBERTURA, idade) de cada linha gerada por município e mês"""
+    nomes = coberturas or list(REGISTRO_VACINAS)
+    pares = []
+    for nome in nomes:
+        vacina = REGISTRO_VACINAS.get(nome)
+        grupo = vacina.grupo if vacina else None
+        pares.extend((nome, idade) for idade in IDADES_GRUPO.get(grupo, [0]))
+    return pares
+
+
+def gerar_residencia(destino, anos=(2024, 2025), caminho_municipios=ARQUIVO_MUNICIPIOS,
+                     municipios=None, coberturas=None, semente=0):
+    """Grava o extrato sintético em destino (ZIP) e retorna o número de linhas.
+
+    municipios limita a quantidade de municípios (amostra aleatória); sem limite,
+    todos os municípios do CSV de referência entram no extrato.
+    """
+    rng = np.random.default_rng(semente)
+    referencia = ler_municipios(caminho_municipios).drop_duplicates('co_municipio_ibge')
+    if municipios is not None and municipios < len(referencia):
+        referencia = referencia.sample(municipios, random_state=semente)
+    codigos = referencia['co_municipio_ibge'].to_numpy()
+    siglas = referencia['sg_uf'].to_numpy()
+
+    pares = _vacinas_e_idades(coberturas)
+    nomes = np.array([nome for nome, _ in pares], dtype=object)
+    idades = np.array([idade for _, idade in pares])
+    n_municipios, n_pares = len(codigos), len(pares)
+
+    # População mensal de cada município (log-normal, como a distribuição real de porte)
+    # e cobertura típica de cada município × vacina, que oscila um pouco mês a mês
+    populacao_base = np.maximum(1, rng.lognormal(mean=3.0, sigma=1.2, size=n_municipios)).astype(np.int64)
+    cobertura_base = np.clip(rng.normal(0.8, 0.15, size=(n_municipios, n_pares)), 0.05, 1.3)
+
+    linhas = 0
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+        with arquivo_zip.open('residencia.csv', 'w', force_zip64=True) as saida:
+            saida.write((';'.join(COLUNAS_RESIDENCIA) + '\n').encode('utf-8'))
+            for ano in anos:
+                for mes in range(1, 13):
+                    populacao = rng.poisson(np.repeat(populacao_base, n_pares))
+                    taxa = np.clip(cobertura_base.ravel() + rng.normal(0, 0.05, size=n_municipios * n_pares), 0, None)
+                    bloco = pd.DataFrame({
+                        'NU_ANO': ano,
+                        'NU_MES': mes,
+                        'SG_UF': np.repeat(siglas, n_pares),
+                        'CO_IBGE': np.repeat(codigos, n_pares),
+                        'TP_COBERTURA': 'Residência',
+                        'DS_COBERTURA': np.tile(nomes, n_municipios),
+                        'NU_IDADE': np.tile(idades, n_municipios),
+                        'QT_DOSES': rng.poisson(populacao * taxa),
+                        'QT_POPULACAO': populacao,
+                    })
+                    saida.write(bloco.to_csv(sep=';', index=False, header=False).encode('utf-8'))
+                    linhas += len(bloco)
+    return linhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um extrato de residência sintético em escala configurável")
+    parser.add_argument('--destino', required=True)
+    parser.add_argument('--anos', type=int, nargs='+', default=[2024, 2025])
+    parser.add_argument('--municipios', type=int, default=None, help="amostra de municípios (padrão: todos)")
+    parser.add_argument('--arquivo-municipios', default=ARQUIVO_MUNICIPIOS)
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    linhas = gerar_residencia(args.destino, args.anos, args.arquivo_municipios, args.municipios, semente=args.semente)
+    print(f"{linhas:,} linhas gravadas em {args.destino} em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Paginação no servidor, com ordenação e busca, para a aba de Tabelas.
+
+A tabela guarda, para cada coluna já pedida, a permutação que a ordena (argsort
+estável, calculado uma vez) e, para cada texto buscado, as linhas que o contêm.
+Uma página é uma fatia dessa permutação tomada do DataFrame, então trocar de
+página ou voltar a uma ordenação já usada custa o tamanho da página.
+"""
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_BUSCA = ['no_municipio', 'DS_COBERTURA']
+
+
+def normalizar_texto(texto):
+    """Texto em minúsculas e sem acentos, para a busca"""
+    decomposto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere)).casefold().strip()
+
+
+class TabelaPaginada:
+    """DataFrame com permutações de ordenação e resultados de busca em cache"""
+
+    def __init__(self, data, colunas_busca=COLUNAS_BUSCA, maximo_buscas=32):
+        self.data = data
+        self.colunas_busca = [coluna for coluna in colunas_busca if coluna in self.data.columns]
+        self.maximo_buscas = maximo_buscas
+        self._ordens = {}
+        self._buscas = {}
+        self._permutacoes = {}
+        # A mesma tabela é compartilhada pelas sessões do Streamlit
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def ordem(self, coluna, decrescente=False):
+        """Posições que ordenam a coluna (ordenação estável, nulos no fim), calculadas uma vez"""
+        chave = (coluna, decrescente)
+        with self._trava:
+            ordem = self._ordens.get(chave)
+        if ordem is None:
+            serie = self.data[coluna].reset_index(drop=True)
+            ordem = serie.sort_values(ascending=not decrescente, kind='stable', na_position='last').index.to_numpy()
+            with self._trava:
+                self._ordens[chave] = ordem
+        return ordem
+
+    def _linhas_com_texto(self, texto):
+        """Máscara das linhas cujas colunas de busca contêm o texto.
+
+        Nas colunas categóricas o texto é comparado só com as categorias, e a máscara
+        das linhas sai dos códigos.
+        """
+        mascara = np.zeros(len(self.data), dtype=bool)
+        for coluna in self.colunas_busca:
+            serie = self.data[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                categorias = np.array([texto in normalizar_texto(valor) for valor in serie.cat.categories] + [False])
+                # Código -1 (nulo) aponta para o False acrescentado no fim
+                mascara |= categorias[serie.cat.codes.to_numpy()]
+            else:
+                mascara |= serie.map(lambda valor: pd.notna(valor) and texto in normalizar_texto(valor)).to_numpy(dtype=bool)
+        return mascara
+
+    def busca(self, texto):
+        """Máscara das linhas que contêm o texto (None sem texto)"""
+        texto = normalizar_texto(texto or '')
+        if not texto:
+            return None
+        with self._trava:
+            mascara = self._buscas.get(texto)
+        if mascara is None:
+            mascara = self._linhas_com_texto(texto)
+            with self._trava:
+                if len(self._buscas) >= self.maximo_buscas:
+                    self._buscas.pop(next(iter(self._buscas)))
+                self._buscas[texto] = mascara
+        return mascara
+
+    def permutacao(self, coluna=None, decrescente=False, texto=''):
+        """Posições das linhas na ordem pedida (sem coluna, a ordem original), só com as que contêm o texto"""
+        chave = (coluna, decrescente, normalizar_texto(texto or ''))
+        with self._trava:
+            permutacao = self._permutacoes.get(chave)
+        if permutacao is not None:
+            return permutacao
+        if coluna is None:
+            permutacao = np.arange(len(self.data))
+        else:
+            permutacao = self.ordem(coluna, decrescente)
+        mascara = self.busca(texto)
+        if mascara is not None:
+            permutacao = permutacao[mascara[permutacao]]
+        with self._trava:
+            if len(self._permutacoes) >= self.maximo_buscas:
+                self._permutacoes.pop(next(iter(self._permutacoes)))
+            self._permutacoes[chave] = permutacao
+        return permutacao
+
+    def total(self, texto=''):
+        """Quantidade de linhas que contêm o texto"""
+        mascara = self.busca(texto)
+        return len(self.data) if mascara is None else int(mascara.sum())
+
+    def pagina(self, numero, tamanho, coluna=None, decrescente=False, texto=''):
+        """Linhas da página (numerada a partir de 1) na ordem e busca pedidas"""
+        inicio = (numero - 1) * tamanho
+        posicoes = self.permutacao(coluna, decrescente, texto)[inicio:inicio + tamanho]
+        return self.data.take(posicoes)
@@ -0,0 +1,82 @@
+"""Registro das vacinas (meta e faixa etária) e classificação vetorizada das faixas de cor."""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+Vacina = namedtuple('Vacina', ['nome', 'meta', 'grupo'])
+
+GRUPOS_IDADE = ['Ao Nascer', 'Menores de 1 Ano de Idade', '1 Ano de Idade', 'Adulto']
+
+# Meta ótima de cobertura (%): 90% para BCG e Rotavírus, 95% para as demais
+META_PADRAO = 95.0
+
+# Registro por DS_COBERTURA, na ordem em que os cards aparecem no Dashboard
+REGISTRO_VACINAS = {vacina.nome: vacina for vacina in [
+    Vacina('BCG', 90.0, 'Ao Nascer'),
+    Vacina('Hepatite B (< 30 dias)', 95.0, 'Ao Nascer'),
+    Vacina('Febre Amarela', 95.0, 'Menores de 1 Ano de Idade'),
+    Vacina('Polio Injetável (VIP)', 95.0, 'Menores de 1 Ano de Idade'),
+    Vacina('Pneumo 10', 95.0, 'Menores de 1 Ano de Idade'),
+    Vacina('Meningo C', 95.0, 'Menores de 1 Ano de Idade'),
+    Vacina('Penta (DTP/HepB/Hib)', 95.0, 'Menores de 1 Ano de Idade'),
+    Vacina('Rotavírus', 90.0, 'Menores de 1 Ano de Idade'),
+    Vacina('Hepatite A Infantil', 95.0, '1 Ano de Idade'),
+    Vacina('DTP (1° Reforço)', 95.0, '1 Ano de Idade'),
+    Vacina('Tríplice Viral - 1° Dose', 95.0, '1 Ano de Idade'),
+    Vacina('Tríplice Viral - 2° Dose', 95.0, '1 Ano de Idade'),
+    Vacina('Pneumo 10 (1° Reforço)', 95.0, '1 Ano de Idade'),
+    Vacina('Polio Injetável (VIP)(Reforço)', 95.0, '1 Ano de Idade'),
+    Vacina('Varicela', 95.0, '1 Ano de Idade'),
+    Vacina('Meningocócica Conjugada (1° Reforço)', 95.0, '1 Ano de Idade'),
+    Vacina('dTpa Adulto - Gestantes', 95.0, 'Adulto'),
+    # Com meta definida, mas sem card próprio
+    Vacina('Hepatite B', 95.0, None),
+    Vacina('DTP', 95.0, None),
+    Vacina('COVID', 95.0, None),
+]}
+
+# Faixas de cor: (limite superior inclusivo do percentual, nome, cor). Acima de 80%
+# a faixa depende da meta: Meta Ótima quando atinge a meta, Excelente caso contrário.
+FAIXAS = [
+    (20, 'Muito Crítico', '#790E18'),  # Rubi
+    (40, 'Crítico', '#ff4444'),        # Vermelho
+    (60, 'Baixo', '#ff9900'),          # Laranja
+    (80, 'Moderado', '#ffdd00'),       # Amarelo
+]
+FAIXA_EXCELENTE = ('Excelente', '#44dd44')  # Verde
+FAIXA_META = ('Meta Ótima', '#000099')      # Azul
+COR_SEM_DADOS = '#9e9e9e'                   # Cinza: vacina sem linhas na seleção
+
+
+def meta_cobertura(nome_cobertura):
+    """Meta ótima de cobertura (%) da vacina"""
+    vacina = REGISTRO_VACINAS.get(nome_cobertura)
+    return vacina.meta if vacina else META_PADRAO
+
+
+def metas_coberturas(nomes):
+    """Metas de uma coluna inteira de nomes de cobertura (vacinas fora do registro usam a meta padrão)"""
+    metas = {nome: vacina.meta for nome, vacina in REGISTRO_VACINAS.items()}
+    return pd.Series(nomes).astype(object).map(metas).fillna(META_PADRAO).to_numpy(dtype=float)
+
+
+def vacinas_do_grupo(grupo):
+    """Nomes das vacinas de uma faixa etária, na ordem do registro"""
+    return [vacina.nome for vacina in REGISTRO_VACINAS.values() if vacina.grupo == grupo]
+
+
+def classificar_coberturas(percentuais, metas):
+    """Faixa e cor de cada percentual de uma vez (arrays com o mesmo tamanho ou metas escalar)"""
+    percentuais = np.asarray(percentuais, dtype=float)
+    metas = np.broadcast_to(np.asarray(metas, dtype=float), percentuais.shape)
+    condicoes = [percentuais <= limite for limite, _, _ in FAIXAS] + [percentuais >= metas]
+    nomes = [nome for _, nome, _ in FAIXAS] + [FAIXA_META[0]]
+    cores = [cor for _, _, cor in FAIXAS] + [FAIXA_META[1]]
+    faixas = np.select(condicoes, nomes, default=FAIXA_EXCELENTE[0])
+    return faixas, np.select(condicoes, cores, default=FAIXA_EXCELENTE[1])
+
+
+def cor_por_meta(percentual, meta):
+    """Cor do card conforme a faixa do percentual e a meta da vacina"""
+    return str(classificar_coberturas([percentual], meta)[1][0])
@@ -0,0 +1,75 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dpni.carga import agregar_dados, carregar_geografia, enriquecer_dados
+from dpni.cubo import construir_cubo, indexar_cubo
+from dpni.esquema import aplicar_esquema
+
+# SANTA HELENA é homônimo no MA (Nordeste), no PR e em SC (Sul); o AC tem um único
+# município, sem população de BCG; 999999 não está na tabela de referência (sem UF nem região)
+MUNICIPIOS_TESTE = {210980: 'MA', 210370: 'MA', 412350: 'PR', 410710: 'PR', 421555: 'SC', 120020: 'AC', 999999: 'XX'}
+COBERTURAS_TESTE = ['BCG', 'Penta (DTP/HepB/Hib)', 'Tríplice Viral - 1° Dose']
+ANOS_TESTE = (2024, 2025)
+
+
+def extrato_teste():
+    """Extrato pequeno com meses e anos faltando em alguns municípios e várias idades por vacina"""
+    rng = np.random.default_rng(7)
+    linhas = []
+    for (codigo, sigla), ano, mes, cobertura in itertools.product(
+            MUNICIPIOS_TESTE.items(), ANOS_TESTE, range(1, 13), COBERTURAS_TESTE):
+        if (codigo == 412350 and ano == 2025 and mes in (4, 9)) or (codigo == 210370 and ano == 2024):
+            continue
+        for idade in ((0, 1) if cobertura.startswith('Tríplice') else (0,)):
+            populacao = 0 if (sigla == 'AC' and cobertura == 'BCG') else int(rng.integers(20, 400))
+            linhas.append({
+                'NU_ANO': ano, 'NU_MES': mes, 'SG_UF': sigla, 'CO_IBGE': codigo, 'TP_COBERTURA': 'Residência',
+                'DS_COBERTURA': cobertura, 'NU_IDADE': idade,
+                'QT_DOSES': int(rng.integers(0, 450)), 'QT_POPULACAO': populacao,
+            })
+    return pd.DataFrame(linhas)
+
+
+@pytest.fixture(scope='session')
+def geografia():
+    return carregar_geografia()
+
+
+@pytest.fixture(scope='session')
+def dados_teste(geografia):
+    """(linhas agregadas e enriquecidas como na ingestão, níveis do cubo construídos a partir delas)"""
+    dados = aplicar_esquema(enriquecer_dados(agregar_dados(extrato_teste()), geografia))
+    return dados, indexar_cubo(construir_cubo(dados))
+
+
+def mascara_selecao(dados, ano=None, regiao='Todas', uf='Todos', municipio='Todos', descricao='Todos'):
+    """Máscara booleana da seleção sobre as linhas, a referência das consultas indexadas"""
+    mascara = np.ones(len(dados), dtype=bool)
+    if ano is not None:
+        mascara &= (dados['NU_ANO'] == ano).to_numpy()
+    for coluna, valor, todos in [('REGIAO', regiao, 'Todas'), ('sg_uf', uf, 'Todos'),
+                                 ('no_municipio', municipio, 'Todos'), ('DS_COBERTURA', descricao, 'Todos')]:
+        if valor != todos:
+            mascara &= (dados[coluna] == valor).to_numpy()
+    return mascara
+
+
+def selecoes_geograficas():
+    """Combinações de região, UF e município, inclusive as incoerentes (UF fora da região)"""
+    return list(itertools.product(
+        ['Todas', 'Nordeste', 'Sul', 'Norte'],
+        ['Todos', 'MA', 'PR', 'SC', 'AC'],
+        ['Todos', 'SANTA HELENA', 'CURURUPU', 'CRUZEIRO DO SUL'],
+    ))
+
+
+def normalizar(tabela, chaves):
+    """Linhas em ordem canônica, com categorias como objetos, para comparar com assert_frame_equal"""
+    tabela = tabela.reset_index(drop=not any(nome in chaves for nome in tabela.index.names if nome))
+    for coluna in chaves:
+        if isinstance(tabela[coluna].dtype, pd.CategoricalDtype):
+            tabela[coluna] = tabela[coluna].astype(object)
+    return tabela.sort_values(chaves, ignore_index=True)
@@ -0,0 +1,125 @@
+import os
+
+import pandas as pd
+import pytest
+
+from dpni.cache import CacheResultados
+from dpni.cubo import construir_cubo, indexar_cubo
+from dpni.motor import cobertura_por_uf, tabela_coberturas
+
+# (seção, função do motor com a assinatura usada pelo Dashboard) e seleções de teste
+SECOES = {
+    'mapa_municipios.dados': lambda cubo, ano, regiao, uf, municipio, vacina: tabela_coberturas(
+        cubo, 'municipio', ano, regiao, uf, municipio, vacina),
+    'mapa.dados': lambda cubo, ano, regiao, uf, municipio, vacina: cobertura_por_uf(
+        cubo, ano, vacina, regiao, uf, municipio),
+}
+SELECOES = [
+    (2025, 'Todas', 'Todos', 'Todos', 'BCG'),
+    (2025, 'Sul', 'Todos', 'SANTA HELENA', 'Penta (DTP/HepB/Hib)'),
+    (2024, 'Nordeste', 'MA', 'Todos', 'Tríplice Viral - 1° Dose'),
+    (2025, 'Norte', 'AC', 'Todos', 'BCG'),
+]
+
+
+def quadro(linhas):
+    return pd.DataFrame({'QT_DOSES': range(linhas)})
+
+
+def tamanho_diretorio(diretorio):
+    return sum(entrada.stat().st_size for entrada in os.scandir(diretorio) if entrada.name.endswith('.pkl'))
+
+
+def test_regravar_a_mesma_chave_nao_infla_o_total_do_disco(tmp_path):
+    cache = CacheResultados(str(tmp_path))
+    chave = CacheResultados.chave('cards', 'v1', 2025)
+
+    # Duas sessões que calcularam o mesmo resultado ao mesmo tempo gravam a mesma chave
+    for _ in range(3):
+        cache._gravar_disco(chave, quadro(1_000))
+    cache._gravar_disco(chave, quadro(10))
+
+    assert cache.estatisticas()['bytes_disco'] == tamanho_diretorio(tmp_path)
+
+
+def test_limpeza_tolera_arquivo_apagado_por_outro_processo(tmp_path, monkeypatch):
+    cache = CacheResultados(str(tmp_path), maximo_bytes_disco=1 << 30)
+    for ano in range(2020, 2026):
+        cache._gravar_disco(CacheResultados.chave('cards', 'v1', ano), quadro(1_000))
+    os.remove(cache._caminho(CacheResultados.chave('cards', 'v1', 2020)))
+
+    cache.maximo_bytes_disco = tamanho_diretorio(tmp_path) // 2
+    cache._limpar_disco()
+    assert cache.estatisticas()['bytes_disco'] == tamanho_diretorio(tmp_path)
+    assert tamanho_diretorio(tmp_path) <= cache.maximo_bytes_disco
+
+    # Outro processo esvaziou parte do diretório entre a listagem e a remoção
+    outro = CacheResultados(str(tmp_path))
+    arquivos = outro._arquivos_disco()
+    os.remove(arquivos[0].path)
+    monkeypatch.setattr(outro, '_arquivos_disco', lambda: arquivos)
+    outro.limpar()
+    assert not os.listdir(tmp_path)
+    assert outro.estatisticas()['bytes_disco'] == 0
+
+
+def obter_contando(cache, chamadas, secao, versao, cubo, selecao):
+    ano, regiao, uf, municipio, vacina = selecao
+
+    def calcular():
+        chamadas.append((secao, versao, selecao))
+        return SECOES[secao](cubo, *selecao)
+    return cache.obter(CacheResultados.chave(secao, versao, ano, regiao, uf, municipio, vacina=vacina), calcular)
+
+
+@pytest.mark.parametrize('com_disco', [False, True])
+def test_resultado_em_cache_igual_ao_recalculado(dados_teste, tmp_path, com_disco):
+    dados, cubo = dados_teste
+    diretorio = str(tmp_path) if com_disco else None
+    cache = CacheResultados(diretorio)
+    chamadas = []
+    for secao in SECOES:
+        for selecao in SELECOES:
+            for _ in range(2):
+                resultado = obter_contando(cache, chamadas, secao, 'v1', cubo, selecao)
+                pd.testing.assert_frame_equal(resultado, SECOES[secao](cubo, *selecao))
+    assert len(chamadas) == len(SECOES) * len(SELECOES)
+    assert cache.estatisticas()['acertos_memoria'] == len(chamadas)
+
+    if com_disco:
+        # Outro processo (ou um reinício) lê do disco o mesmo resultado
+        outro = CacheResultados(diretorio)
+        for secao in SECOES:
+            for selecao in SELECOES:
+                resultado = obter_contando(outro, chamadas, secao, 'v1', cubo, selecao)
+                pd.testing.assert_frame_equal(resultado, SECOES[secao](cubo, *selecao))
+        assert outro.estatisticas()['acertos_disco'] == len(SECOES) * len(SELECOES)
+        assert len(chamadas) == len(SECOES) * len(SELECOES)
+
+
+@pytest.mark.parametrize('com_disco', [False, True])
+def test_nova_versao_dos_dados_nao_aproveita_o_cache(dados_teste, tmp_path, com_disco):
+    dados, cubo = dados_teste
+    reingerido = dados.copy()
+    reingerido['QT_DOSES'] = reingerido['QT_DOSES'] + 1
+    cubo_novo = indexar_cubo(construir_cubo(reingerido))
+    cache = CacheResultados(str(tmp_path) if com_disco else None)
+    chamadas = []
+    for secao in SECOES:
+        for selecao in SELECOES:
+            obter_contando(cache, chamadas, secao, 'v1', cubo, selecao)
+            resultado = obter_contando(cache, chamadas, secao, 'v2', cubo_novo, selecao)
+            assert chamadas[-1] == (secao, 'v2', selecao)
+            pd.testing.assert_frame_equal(resultado, SECOES[secao](cubo_novo, *selecao))
+    assert len(chamadas) == 2 * len(SECOES) * len(SELECOES)
+    assert cache.estatisticas()['acertos_memoria'] == cache.estatisticas()['acertos_disco'] == 0
+
+
+def test_alterar_o_resultado_entregue_nao_altera_o_cache(dados_teste):
+    dados, cubo = dados_teste
+    cache = CacheResultados()
+    chamadas = []
+    selecao = SELECOES[0]
+    obter_contando(cache, chamadas, 'mapa.dados', 'v1', cubo, selecao)['COBERTURA'] = -1
+    pd.testing.assert_frame_equal(obter_contando(cache, chamadas, 'mapa.dados', 'v1', cubo, selecao),
+                                  cobertura_por_uf(cubo, selecao[0], selecao[4], *selecao[1:4]))
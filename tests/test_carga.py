@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from dpni.carga import agregar_dados, agregar_dados_em_blocos, ler_residencia
+from dpni.sintetico import gerar_residencia
+
+
+@pytest.fixture(scope='module')
+def extrato(tmp_path_factory):
+    """Extrato sintético com cada linha repetida (doses diferentes), embaralhado:
+    as linhas de um mesmo grupo caem em blocos diferentes"""
+    diretorio = tmp_path_factory.mktemp('extrato')
+    gerar_residencia(diretorio / 'sintetico.zip', anos=(2024, 2025), municipios=40)
+    sintetico = ler_residencia(diretorio / 'sintetico.zip')
+    partes = [sintetico, sintetico.assign(QT_DOSES=sintetico['QT_DOSES'] + 1)]
+    data = pd.concat(partes, ignore_index=True).sample(frac=1, random_state=0)
+    caminho = diretorio / 'residencia.zip'
+    data.to_csv(caminho, sep=';', index=False,
+                compression={'method': 'zip', 'archive_name': 'residencia.csv'})
+    return str(caminho)
+
+
+@pytest.mark.parametrize('memoria_maxima, linhas_por_bloco', [
+    ('1GB', None),
+    # Blocos pequenos e teto baixo: muitos parciais, compactados várias vezes
+    ('2MB', 3_000),
+])
+def test_agregacao_em_blocos_igual_a_em_memoria(extrato, memoria_maxima, linhas_por_bloco):
+    esperado = agregar_dados(ler_residencia(extrato))
+
+    obtido = agregar_dados_em_blocos(extrato, memoria_maxima, linhas_por_bloco)
+
+    pd.testing.assert_frame_equal(obtido, esperado)
+
+
+def test_teto_pequeno_demais_levanta_memory_error(extrato):
+    with pytest.raises(MemoryError, match='acima do limite'):
+        agregar_dados_em_blocos(extrato, '64KB', linhas_por_bloco=2_000)
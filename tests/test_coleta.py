@@ -0,0 +1,189 @@
+import email.utils
+import hashlib
+import http.server
+import os
+import threading
+
+import pytest
+
+from dpni.coleta import baixar, coletar, criar_sessao
+
+CONTEUDO = bytes(range(256)) * 2048  # 512 KB: vários blocos de TAMANHO_BLOCO
+ARQUIVO = '/residencia_2025_SP.zip'
+
+
+class Servidor(http.server.ThreadingHTTPServer):
+    """Servidor local que imita o portal: ETag/Last-Modified, Range com If-Range e .sha256"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ManipuladorServidor)
+        self.arquivos = {}
+        self.com_etag = True
+        self.cortar = set()
+        self.pedidos = []
+
+    def publicar(self, caminho, conteudo, checksum=None):
+        self.arquivos[caminho] = (conteudo, email.utils.formatdate(1_700_000_000, usegmt=True))
+        self.arquivos[caminho + '.sha256'] = (
+            f"{checksum or hashlib.sha256(conteudo).hexdigest()}  {caminho.lstrip('/')}\n".encode(), None
+        )
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class ManipuladorServidor(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, cabecalhos=()):
+        """Resposta sem corpo (304, 404)"""
+        self.send_response(status)
+        for nome, valor in cabecalhos:
+            self.send_header(nome, valor)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        servidor = self.server
+        servidor.pedidos.append((self.path, dict(self.headers)))
+        if self.path not in servidor.arquivos:
+            self._responder(404)
+            return
+        conteudo, ultima_modificacao = servidor.arquivos[self.path]
+        etag = f'"{hashlib.md5(conteudo).hexdigest()}"'
+        validadores = []
+        if servidor.com_etag:
+            validadores.append(('ETag', etag))
+        if ultima_modificacao:
+            validadores.append(('Last-Modified', ultima_modificacao))
+
+        if servidor.com_etag and self.headers.get('If-None-Match') == etag:
+            self._responder(304, validadores)
+            return
+        if (not servidor.com_etag and ultima_modificacao
+                and self.headers.get('If-Modified-Since') == ultima_modificacao):
+            self._responder(304, validadores)
+            return
+
+        inicio, status = 0, 200
+        faixa = self.headers.get('Range')
+        if faixa and self.headers.get('If-Range') in (etag, ultima_modificacao):
+            inicio, status = int(faixa.split('=')[1].rstrip('-')), 206
+        corpo = conteudo[inicio:]
+        cabecalhos = list(validadores)
+        if status == 206:
+            cabecalhos.append(('Content-Range', f"bytes {inicio}-{len(conteudo) - 1}/{len(conteudo)}"))
+        self.send_response(status)
+        for nome, valor in cabecalhos:
+            self.send_header(nome, valor)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        if self.path in servidor.cortar:
+            # Corpo truncado: metade dos bytes e a conexão cai
+            servidor.cortar.discard(self.path)
+            self.wfile.write(corpo[:len(corpo) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(corpo)
+
+
+@pytest.fixture
+def servidor():
+    servidor = Servidor()
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def sessao():
+    with criar_sessao(conexoes=2) as sessao:
+        yield sessao
+
+
+def pedidos_de(servidor, caminho):
+    return [cabecalhos for pedido, cabecalhos in servidor.pedidos if pedido == caminho]
+
+
+def test_download_completo(servidor, sessao, tmp_path):
+    servidor.publicar(ARQUIVO, CONTEUDO)
+    caminho = str(tmp_path / 'residencia_2025_SP.zip')
+
+    situacao, registro = baixar(sessao, servidor.url + ARQUIVO, caminho, url_checksum=servidor.url + ARQUIVO + '.sha256')
+
+    assert situacao == 'baixado'
+    with open(caminho, 'rb') as arquivo:
+        assert arquivo.read() == CONTEUDO
+    assert registro['sha256'] == hashlib.sha256(CONTEUDO).hexdigest()
+    assert registro['etag'] and registro['last_modified']
+    assert not os.path.exists(caminho + '.parcial')
+
+
+def test_retoma_com_range_e_if_range_apos_corpo_truncado(servidor, sessao, tmp_path):
+    servidor.publicar(ARQUIVO, CONTEUDO)
+    servidor.cortar.add(ARQUIVO)
+    caminho = str(tmp_path / 'residencia_2025_SP.zip')
+
+    situacao, registro = baixar(sessao, servidor.url + ARQUIVO, caminho, url_checksum=servidor.url + ARQUIVO + '.sha256')
+
+    assert situacao == 'retomado'
+    with open(caminho, 'rb') as arquivo:
+        assert arquivo.read() == CONTEUDO
+    primeiro, retomada = pedidos_de(servidor, ARQUIVO)
+    assert 'Range' not in primeiro
+    assert retomada['Range'] == f"bytes={len(CONTEUDO) // 2}-"
+    assert retomada['If-Range'] == registro['etag']
+
+
+@pytest.mark.parametrize('com_etag', [True, False], ids=['etag', 'last-modified'])
+def test_arquivo_inalterado_responde_304(servidor, sessao, tmp_path, com_etag):
+    servidor.com_etag = com_etag
+    servidor.publicar(ARQUIVO, CONTEUDO)
+    caminho = str(tmp_path / 'residencia_2025_SP.zip')
+    _, registro = baixar(sessao, servidor.url + ARQUIVO, caminho)
+
+    situacao, registro_novo = baixar(sessao, servidor.url + ARQUIVO, caminho, registro)
+
+    assert situacao == 'inalterado'
+    assert registro_novo == registro
+    condicional = pedidos_de(servidor, ARQUIVO)[-1]
+    if com_etag:
+        assert condicional['If-None-Match'] == registro['etag']
+    else:
+        assert 'If-None-Match' not in condicional
+        assert condicional['If-Modified-Since'] == registro['last_modified']
+
+
+def test_sha256_divergente_descarta_o_download(servidor, sessao, tmp_path):
+    servidor.publicar(ARQUIVO, CONTEUDO, checksum='0' * 64)
+    caminho = str(tmp_path / 'residencia_2025_SP.zip')
+
+    with pytest.raises(ValueError, match='SHA-256'):
+        baixar(sessao, servidor.url + ARQUIVO, caminho, url_checksum=servidor.url + ARQUIVO + '.sha256')
+
+    assert not os.path.exists(caminho)
+    assert not os.path.exists(caminho + '.parcial')
+
+
+def test_coletar_registra_so_os_arquivos_conferidos(servidor, tmp_path):
+    ufs = {'35': 'SP', '33': 'RJ'}
+    servidor.publicar('/residencia_2025_SP.zip', CONTEUDO)
+    servidor.publicar('/residencia_2025_RJ.zip', CONTEUDO[::-1], checksum='0' * 64)
+    modelo = servidor.url + '/residencia_{ano}_{uf}.zip'
+
+    with pytest.raises(RuntimeError, match='1 de 2 arquivos falharam'):
+        coletar(modelo, [2025], ufs, str(tmp_path), modelo + '.sha256', paralelismo=2)
+
+    # O arquivo conferido ficou no estado: a próxima coleta só pergunta se mudou
+    servidor.publicar('/residencia_2025_RJ.zip', CONTEUDO[::-1])
+    resultado = coletar(modelo, [2025], ufs, str(tmp_path), modelo + '.sha256', paralelismo=2)
+    assert resultado[servidor.url + '/residencia_2025_SP.zip'][0] == 'inalterado'
+    assert resultado[servidor.url + '/residencia_2025_RJ.zip'][0] == 'baixado'
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+from conftest import ANOS_TESTE, COBERTURAS_TESTE, mascara_selecao, normalizar, selecoes_geograficas
+
+from dpni.cubo import (
+    COLUNAS_ACUMULADAS,
+    COLUNAS_NIVEL,
+    COLUNAS_VALOR,
+    NIVEIS,
+    serie_acumulada,
+    totais_por_cobertura,
+    totais_por_nivel,
+    totais_por_uf,
+)
+
+
+def comparar(obtido, esperado, chaves, colunas=COLUNAS_VALOR, contexto=''):
+    pd.testing.assert_frame_equal(
+        normalizar(obtido, chaves)[chaves + colunas], normalizar(esperado, chaves)[chaves + colunas],
+        check_dtype=False, check_categorical=False, obj=contexto,
+    )
+
+
+@pytest.mark.parametrize('ano', ANOS_TESTE)
+def test_totais_por_cobertura_igual_ao_groupby(dados_teste, ano):
+    dados, cubo = dados_teste
+    for selecao in selecoes_geograficas():
+        for descricao in ['Todos'] + COBERTURAS_TESTE:
+            esperado = dados[mascara_selecao(dados, ano, *selecao, descricao)]
+            esperado = esperado.groupby('DS_COBERTURA', observed=True)[COLUNAS_VALOR].sum()
+            comparar(totais_por_cobertura(cubo, ano, *selecao, descricao), esperado, ['DS_COBERTURA'],
+                     contexto=f"{ano} {selecao} {descricao}")
+
+
+@pytest.mark.parametrize('ano', ANOS_TESTE)
+def test_totais_por_uf_igual_ao_groupby(dados_teste, ano):
+    dados, cubo = dados_teste
+    for selecao in selecoes_geograficas():
+        for cobertura in COBERTURAS_TESTE:
+            esperado = dados[mascara_selecao(dados, ano, *selecao, cobertura)]
+            esperado = esperado.groupby('sg_uf', observed=True)[COLUNAS_VALOR].sum().reset_index()
+            comparar(totais_por_uf(cubo, ano, cobertura, *selecao), esperado, ['sg_uf'],
+                     contexto=f"{ano} {selecao} {cobertura}")
+
+
+@pytest.mark.parametrize('cobertura', COBERTURAS_TESTE)
+def test_serie_acumulada_igual_ao_groupby_com_cumsum(dados_teste, cobertura):
+    dados, cubo = dados_teste
+    for selecao in selecoes_geograficas():
+        esperado = dados[mascara_selecao(dados, None, *selecao, cobertura)]
+        esperado = esperado.groupby(['NU_ANO', 'NU_MES'], observed=True)[COLUNAS_VALOR].sum().reset_index()
+        esperado[COLUNAS_ACUMULADAS] = esperado.groupby('NU_ANO')[COLUNAS_VALOR].cumsum().to_numpy()
+        comparar(serie_acumulada(cubo, cobertura, *selecao), esperado, ['NU_ANO', 'NU_MES'],
+                 COLUNAS_VALOR + COLUNAS_ACUMULADAS, contexto=f"{selecao} {cobertura}")
+
+
+@pytest.mark.parametrize('nivel', NIVEIS)
+def test_totais_por_nivel_igual_ao_groupby(dados_teste, nivel):
+    dados, cubo = dados_teste
+    chaves = ['NU_ANO'] + COLUNAS_NIVEL[nivel] + ['DS_COBERTURA']
+    for ano, descricao in [(None, 'Todos'), (2025, 'BCG')]:
+        for selecao in selecoes_geograficas():
+            esperado = dados[mascara_selecao(dados, ano, *selecao, descricao)]
+            # Região sem nome não forma grupo no nível de região (não pode ser selecionada)
+            esperado = esperado.groupby(chaves, dropna=nivel == 'regiao', observed=True)[COLUNAS_VALOR].sum()
+            comparar(totais_por_nivel(cubo, nivel, ano, *selecao, descricao), esperado.reset_index(), chaves,
+                     contexto=f"{nivel} {ano} {selecao} {descricao}")
+
+
+def test_extrato_de_teste_cobre_os_casos_dificeis(dados_teste):
+    dados, cubo = dados_teste
+    # Homônimos em duas regiões, município fora da referência e meses faltando
+    assert dados.loc[dados['no_municipio'] == 'SANTA HELENA', 'sg_uf'].nunique() == 3
+    assert dados['REGIAO'].isna().any()
+    assert len(cubo['municipio'].loc['SANTA HELENA']) > 0
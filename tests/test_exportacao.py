@@ -0,0 +1,42 @@
+import io
+
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from dpni.exportacao import FORMATOS_EXPORTACAO, exportar
+
+
+def dados_exemplo():
+    return pd.DataFrame({
+        'sg_uf': pd.Categorical(['SP', 'RJ', 'MG', 'BA', 'PE']),
+        'no_municipio': ['SÃO PAULO', 'RIO DE JANEIRO', 'BELO HORIZONTE', 'SALVADOR', 'RECIFE'],
+        'QT_DOSES': [10, 20, 30, 40, 50],
+        'COBERTURA': [90.5, 80.25, None, 70.0, 101.5],
+    })
+
+
+def ler(conteudo, extensao):
+    if extensao == 'csv':
+        return pd.read_csv(io.BytesIO(conteudo), sep=';')
+    if extensao == 'parquet':
+        return pd.read_parquet(io.BytesIO(conteudo))
+    return pd.read_excel(io.BytesIO(conteudo))
+
+
+@pytest.mark.parametrize('formato', list(FORMATOS_EXPORTACAO))
+def test_download_button_aceita_o_retorno_da_exportacao(formato):
+    data = dados_exemplo()
+    extensao, _ = FORMATOS_EXPORTACAO[formato]
+
+    # Como no Dashboard: o st.download_button chama o callable e converte o retorno
+    def gerar_exportacao():
+        return exportar(data, extensao, linhas_por_bloco=2)
+
+    conteudo, _ = convert_data_to_bytes_and_infer_mime(gerar_exportacao(), RuntimeError("tipo não suportado"))
+
+    lido = ler(conteudo, extensao)
+    assert len(lido) == len(data)
+    assert list(lido.columns) == list(data.columns)
+    assert lido['no_municipio'].tolist() == data['no_municipio'].tolist()
+    assert lido['QT_DOSES'].tolist() == data['QT_DOSES'].tolist()
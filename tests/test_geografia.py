@@ -0,0 +1,26 @@
+import pandas as pd
+
+from dpni.geografia import Geografia
+
+
+def geografia():
+    municipios = pd.DataFrame({
+        'co_municipio_ibge': [130006, 130008, 290070, 310010, 310020],
+        'no_municipio': ['AMATURA', 'ANAMA', 'ANGICAL', 'ANGICAL', 'ARAXA'],
+    })
+    estados = pd.DataFrame({'co_uf': [13, 29, 31], 'no_uf': ['Amazonas', 'Bahia', 'Minas Gerais'], 'sg_uf': ['AM', 'BA', 'MG']})
+    return Geografia(municipios, estados)
+
+
+def test_municipios_sem_codigos_mantem_todas_as_opcoes():
+    assert geografia().municipios('Norte') == ['AMATURA', 'ANAMA']
+
+
+def test_municipios_so_oferece_codigos_com_dados():
+    codigos = {130008, 290070}
+
+    assert geografia().municipios(codigos=codigos) == ['ANAMA', 'ANGICAL']
+    assert geografia().municipios('Norte', codigos=codigos) == ['ANAMA']
+    # Homônimo com dados em outra UF não entra na lista da UF sem dados
+    assert geografia().municipios('Sudeste', 'MG', codigos=codigos) == []
+    assert geografia().municipios('Nordeste', 'BA', codigos=codigos) == ['ANGICAL']
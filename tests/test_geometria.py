@@ -0,0 +1,29 @@
+from dpni.geometria import CHAVE_MUNICIPIOS, municipios_sem_geometria, simplificar_geojson
+
+
+def quadrado(x, y, lado):
+    return [[x, y], [x + lado, y], [x + lado, y + lado], [x, y + lado], [x, y]]
+
+
+def feicao(codigo, anel):
+    return {'type': 'Feature', 'properties': {CHAVE_MUNICIPIOS: codigo, 'name': codigo},
+            'geometry': {'type': 'Polygon', 'coordinates': [anel]}}
+
+
+def test_municipio_menor_que_a_tolerancia_nao_some():
+    geojson = {'type': 'FeatureCollection', 'features': [
+        feicao('330001', quadrado(-43.0, -22.0, 1.0)),
+        # ~100 m de lado: some com 0,05 grau de tolerância e 2 casas decimais
+        feicao('330002', quadrado(-43.20001, -22.90001, 0.001)),
+    ]}
+
+    simplificado = simplificar_geojson(geojson, CHAVE_MUNICIPIOS, tolerancia=0.05, casas=2)
+
+    assert [f['properties'][CHAVE_MUNICIPIOS] for f in simplificado['features']] == ['330001', '330002']
+    assert len(simplificado['features'][1]['geometry']['coordinates'][0]) >= 4
+
+
+def test_municipios_sem_geometria():
+    geojson = {'type': 'FeatureCollection', 'features': [feicao('330001', quadrado(0, 0, 1))]}
+
+    assert municipios_sem_geometria([330001, '421265', 999999], geojson) == ['421265', '999999']
@@ -0,0 +1,64 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from dpni.indice import DIMENSOES_FILTRO, IndiceFiltros
+
+# Valores por dimensão, inclusive alguns que não existem nos dados
+VALORES_TESTE = {
+    'NU_ANO': [2025, 2030],
+    'REGIAO': ['Sul', 'Nordeste', 'Centro-Oeste'],
+    'sg_uf': ['PR', 'MA', 'SP'],
+    'no_municipio': ['SANTA HELENA', 'CURURUPU', 'INEXISTENTE'],
+    'DS_COBERTURA': ['BCG', 'Penta (DTP/HepB/Hib)'],
+}
+
+
+def combinacoes_filtros():
+    for tamanho in range(1, len(DIMENSOES_FILTRO) + 1):
+        for colunas in itertools.combinations(DIMENSOES_FILTRO, tamanho):
+            for valores in itertools.product(*(VALORES_TESTE[coluna] for coluna in colunas)):
+                yield dict(zip(colunas, valores))
+
+
+@pytest.fixture(scope='module')
+def dados_embaralhados(dados_teste):
+    # Fora de ordem, para que as posições não coincidam com a ordem das dimensões
+    return dados_teste[0].sample(frac=1, random_state=3)
+
+
+def mascara(data, filtros):
+    resultado = np.ones(len(data), dtype=bool)
+    for coluna, valor in filtros.items():
+        resultado &= (data[coluna] == valor).to_numpy()
+    return resultado
+
+
+def test_selecionar_igual_a_mascara_booleana(dados_embaralhados):
+    indice = IndiceFiltros(dados_embaralhados)
+    for filtros in combinacoes_filtros():
+        np.testing.assert_array_equal(indice.selecionar(filtros), np.flatnonzero(mascara(dados_embaralhados, filtros)),
+                                      err_msg=str(filtros))
+
+
+def test_aplicar_igual_a_filtro_por_mascara(dados_embaralhados):
+    indice = IndiceFiltros(dados_embaralhados)
+    assert indice.selecionar({}) is None
+    assert indice.aplicar(dados_embaralhados, {}) is dados_embaralhados
+    for filtros in combinacoes_filtros():
+        assert indice.aplicar(dados_embaralhados, filtros).equals(dados_embaralhados[mascara(dados_embaralhados, filtros)])
+
+
+def test_ordens_reaproveitadas_dao_o_mesmo_indice(dados_embaralhados):
+    indice = IndiceFiltros(dados_embaralhados)
+    reconstruido = IndiceFiltros(dados_embaralhados, ordens=indice.ordens())
+    for filtros in combinacoes_filtros():
+        np.testing.assert_array_equal(reconstruido.selecionar(filtros), indice.selecionar(filtros))
+
+
+def test_linhas_sem_regiao_nao_entram_em_nenhum_valor(dados_embaralhados):
+    indice = IndiceFiltros(dados_embaralhados)
+    # 999999 não tem região: suas linhas ficam fora de todas as listas de REGIAO
+    com_regiao = sum(len(indice.posicoes('REGIAO', regiao)) for regiao in dados_embaralhados['REGIAO'].dropna().unique())
+    assert com_regiao == dados_embaralhados['REGIAO'].notna().sum() < len(dados_embaralhados)
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from dpni.armazenamento import carregar_cubo, construir_armazenamento, ler_armazenamento, ler_manifesto
+from dpni.carga import ARQUIVO_ESTADOS, ARQUIVO_MUNICIPIOS, ler_residencia
+from dpni.cubo import NIVEIS
+from dpni.ingestao import ingerir_delta
+from dpni.sintetico import gerar_residencia
+
+MESES_DELTA = [3, 11, 12]
+
+
+def gravar_extrato(data, caminho):
+    data.to_csv(caminho, sep=';', index=False, compression={'method': 'zip', 'archive_name': 'residencia.csv'})
+    return str(caminho)
+
+
+def construir(destino, caminho_residencia):
+    return construir_armazenamento(str(destino), 'parquet', caminho_residencia, ARQUIVO_MUNICIPIOS, ARQUIVO_ESTADOS)
+
+
+def niveis_ordenados(destino):
+    """Níveis do cubo com as linhas em ordem canônica (municípios homônimos repetem a chave do índice)"""
+    niveis = carregar_cubo(str(destino))
+    return {
+        nivel: niveis[nivel].reset_index().sort_values(list(niveis[nivel].reset_index().columns), ignore_index=True)
+        for nivel in NIVEIS
+    }
+
+
+@pytest.fixture(scope='module')
+def extratos(tmp_path_factory):
+    """Extrato completo, o extrato antigo (sem nov/dez de 2025 e com março de 2025 errado) e o delta"""
+    diretorio = tmp_path_factory.mktemp('ingestao')
+    gerar_residencia(diretorio / 'sintetico.zip', anos=(2024, 2025), municipios=30)
+    completo = ler_residencia(diretorio / 'sintetico.zip')
+    meses_delta = (completo['NU_ANO'] == 2025) & completo['NU_MES'].isin(MESES_DELTA)
+    antigo = completo[~meses_delta | (completo['NU_MES'] == 3)].copy()
+    antigo.loc[antigo['NU_ANO'].eq(2025) & antigo['NU_MES'].eq(3), 'QT_DOSES'] += 7
+    return (
+        gravar_extrato(completo, diretorio / 'completo.zip'),
+        gravar_extrato(antigo, diretorio / 'antigo.zip'),
+        gravar_extrato(completo[meses_delta], diretorio / 'delta.zip'),
+    )
+
+
+def test_delta_aplicado_duas_vezes_igual_a_ingestao_completa(extratos, tmp_path):
+    completo, antigo, delta = extratos
+    construir(tmp_path / 'referencia', completo)
+    construir(tmp_path / 'incremental', antigo)
+    assert not ler_armazenamento(str(tmp_path / 'incremental')).equals(ler_armazenamento(str(tmp_path / 'referencia')))
+
+    ingerir_delta(delta, str(tmp_path / 'incremental'), ARQUIVO_MUNICIPIOS, ARQUIVO_ESTADOS)
+    manifesto = ingerir_delta(delta, str(tmp_path / 'incremental'), ARQUIVO_MUNICIPIOS, ARQUIVO_ESTADOS)
+
+    referencia = ler_manifesto(str(tmp_path / 'referencia'))
+    assert manifesto['particoes'] == referencia['particoes']
+    assert [aplicado['meses'] for aplicado in manifesto['deltas']] == [{'2025': MESES_DELTA}] * 2
+    pd.testing.assert_frame_equal(ler_armazenamento(str(tmp_path / 'incremental')),
+                                  ler_armazenamento(str(tmp_path / 'referencia')))
+    niveis_incrementais = niveis_ordenados(tmp_path / 'incremental')
+    niveis_referencia = niveis_ordenados(tmp_path / 'referencia')
+    for nivel in NIVEIS:
+        pd.testing.assert_frame_equal(niveis_incrementais[nivel], niveis_referencia[nivel], obj=f"nível {nivel}")
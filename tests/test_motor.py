@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from conftest import ANOS_TESTE, COBERTURAS_TESTE, mascara_selecao, selecoes_geograficas
+
+from dpni.cubo import totais_por_cobertura
+from dpni.motor import cobertura_por_uf, evolucao_mensal
+from dpni.resumo import resumo_coberturas
+
+
+def test_cobertura_por_uf_concorda_com_o_resumo(dados_teste):
+    dados, cubo = dados_teste
+    for ano in ANOS_TESTE:
+        for cobertura in COBERTURAS_TESTE:
+            por_uf = cobertura_por_uf(cubo, ano, cobertura)
+            assert np.isfinite(por_uf['COBERTURA']).all()
+            for sigla, valor in zip(por_uf['sg_uf'], por_uf['COBERTURA']):
+                resumo = resumo_coberturas(totais_por_cobertura(cubo, ano, uf=sigla))
+                assert valor == resumo.loc[cobertura, 'COBERTURA'], (ano, cobertura, sigla)
+
+
+def test_populacao_zero_tem_cobertura_zero_no_mapa_e_na_evolucao(dados_teste):
+    dados, cubo = dados_teste
+    # No AC a BCG tem doses, mas não tem população
+    por_uf = cobertura_por_uf(cubo, 2025, 'BCG').set_index('sg_uf')
+    assert por_uf.loc['AC', 'QT_POPULACAO'] == 0 and por_uf.loc['AC', 'QT_DOSES'] > 0
+    assert por_uf.loc['AC', 'COBERTURA'] == 0
+    evolucao = evolucao_mensal(cubo, 'BCG', uf='AC')
+    assert len(evolucao) > 0 and (evolucao['COBERTURA'] == 0).all()
+
+
+def test_evolucao_mensal_igual_a_cobertura_acumulada_das_linhas(dados_teste):
+    dados, cubo = dados_teste
+    for cobertura in COBERTURAS_TESTE:
+        for selecao in selecoes_geograficas():
+            linhas = dados[mascara_selecao(dados, None, *selecao, cobertura)]
+            esperado = linhas.groupby(['NU_ANO', 'NU_MES'])[['QT_DOSES', 'QT_POPULACAO']].sum().reset_index()
+            acumulado = esperado.groupby('NU_ANO')[['QT_DOSES', 'QT_POPULACAO']].cumsum()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                esperado['COBERTURA'] = np.where(acumulado['QT_POPULACAO'] > 0,
+                                                 acumulado['QT_DOSES'] / acumulado['QT_POPULACAO'] * 100, 0.0)
+            evolucao = evolucao_mensal(cubo, cobertura, *selecao)
+            evolucao = evolucao.sort_values(['NU_ANO', 'NU_MES'], ignore_index=True)
+            pd.testing.assert_frame_equal(evolucao[['NU_ANO', 'NU_MES', 'QT_DOSES', 'QT_POPULACAO', 'COBERTURA']], esperado,
+                                          check_dtype=False, obj=f"{selecao} {cobertura}")
@@ -0,0 +1,45 @@
+import json
+import os
+import time
+
+from dpni.publicacao import ARQUIVO_ATUAL, DIRETORIO_VERSOES, remover_versoes_antigas
+
+SEGUNDO = 1_000_000_000
+
+
+def publicar_versoes(diretorio, instantes):
+    """Cria as versões (nomes = instante da publicação, como em publicar) e aponta para a última"""
+    versoes = [f"{instante:020d}" for instante in instantes]
+    for versao in versoes:
+        os.makedirs(os.path.join(diretorio, DIRETORIO_VERSOES, versao))
+    os.makedirs(os.path.join(diretorio, DIRETORIO_VERSOES, f"{time.time_ns():020d}.construindo"))
+    with open(os.path.join(diretorio, ARQUIVO_ATUAL), 'w', encoding='utf-8') as arquivo:
+        json.dump({'publicacao': versoes[-1]}, arquivo)
+    return versoes
+
+
+def versoes_em_disco(diretorio):
+    return sorted(os.listdir(os.path.join(diretorio, DIRETORIO_VERSOES)))
+
+
+def test_mantem_a_anterior_mesmo_com_manter_1(tmp_path):
+    agora = time.time_ns()
+    versoes = publicar_versoes(str(tmp_path), [agora - 3_600 * SEGUNDO, agora - 1_800 * SEGUNDO, agora - 900 * SEGUNDO])
+
+    remover_versoes_antigas(str(tmp_path), manter=1, carencia=0)
+
+    assert [nome for nome in versoes_em_disco(str(tmp_path)) if nome.isdigit()] == versoes[1:]
+
+
+def test_versao_substituida_ha_pouco_espera_a_carencia(tmp_path):
+    agora = time.time_ns()
+    # Três publicações seguidas: a primeira foi substituída há 5 s, a segunda há 1 s
+    versoes = publicar_versoes(str(tmp_path), [agora - 3_600 * SEGUNDO, agora - 5 * SEGUNDO, agora - SEGUNDO])
+
+    remover_versoes_antigas(str(tmp_path), manter=2, carencia=60)
+    assert [nome for nome in versoes_em_disco(str(tmp_path)) if nome.isdigit()] == versoes
+
+    remover_versoes_antigas(str(tmp_path), manter=2, carencia=2)
+    assert [nome for nome in versoes_em_disco(str(tmp_path)) if nome.isdigit()] == versoes[1:]
+    # Publicações em construção nunca são tocadas
+    assert any(nome.endswith('.construindo') for nome in versoes_em_disco(str(tmp_path)))
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from conftest import ANOS_TESTE, mascara_selecao, selecoes_geograficas
+
+from dpni.cubo import totais_por_cobertura
+from dpni.resumo import classificar_totais, linha_resumo, resumo_coberturas, somar_por_cobertura
+from dpni.vacinas import COR_SEM_DADOS, meta_cobertura
+
+
+def test_resumo_igual_ao_groupby_das_linhas_e_ao_cubo(dados_teste):
+    dados, cubo = dados_teste
+    for ano in ANOS_TESTE:
+        for selecao in selecoes_geograficas():
+            filtrado = dados[mascara_selecao(dados, ano, *selecao)]
+            esperado = filtrado.groupby('DS_COBERTURA', observed=True)[['QT_DOSES', 'QT_POPULACAO']].sum()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cobertura = (esperado['QT_DOSES'] / esperado['QT_POPULACAO'] * 100).where(esperado['QT_POPULACAO'] > 0, 0.0)
+            resumo = resumo_coberturas(somar_por_cobertura(filtrado))
+            pd.testing.assert_series_equal(resumo['COBERTURA'], cobertura, check_names=False)
+            pd.testing.assert_frame_equal(resumo_coberturas(totais_por_cobertura(cubo, ano, *selecao)), resumo,
+                                          check_dtype=False, check_categorical=False, check_index_type=False)
+
+
+def test_populacao_zero_tem_cobertura_zero(dados_teste):
+    dados, cubo = dados_teste
+    # No AC (um único município) a BCG não tem população
+    resumo = resumo_coberturas(totais_por_cobertura(cubo, 2025, uf='AC'))
+    assert resumo.loc['BCG', 'QT_POPULACAO'] == 0 and resumo.loc['BCG', 'QT_DOSES'] > 0
+    assert resumo.loc['BCG', 'COBERTURA'] == 0
+    assert resumo.loc['BCG', 'FAIXA'] == 'Muito Crítico'
+    assert np.isfinite(resumo['COBERTURA']).all()
+
+
+def test_classificar_totais_com_populacao_nao_positiva():
+    tabela = pd.DataFrame({'QT_DOSES': [50, 0, 10, 96], 'QT_POPULACAO': [100, 0, -5, 100]})
+    classificada = classificar_totais(tabela, ['BCG', 'BCG', 'Varicela', 'Varicela'])
+    assert classificada['COBERTURA'].tolist() == [50.0, 0.0, 0.0, 96.0]
+    assert classificada['META'].tolist() == [90.0, 90.0, 95.0, 95.0]
+    assert classificada['FAIXA'].tolist() == ['Baixo', 'Muito Crítico', 'Muito Crítico', 'Meta Ótima']
+
+
+def test_linha_resumo_de_vacina_presente_e_ausente(dados_teste):
+    dados, cubo = dados_teste
+    resumo = resumo_coberturas(totais_por_cobertura(cubo, 2025))
+    cobertura, meta, cor = linha_resumo(resumo, 'Penta (DTP/HepB/Hib)')
+    assert (cobertura, meta, cor) == tuple(resumo.loc['Penta (DTP/HepB/Hib)', ['COBERTURA', 'META', 'COR']])
+    # Sem linhas na seleção não há cobertura a mostrar (nem um 0% na faixa mais baixa)
+    assert linha_resumo(resumo, 'Rotavírus') == (None, meta_cobertura('Rotavírus'), COR_SEM_DADOS)
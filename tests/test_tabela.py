@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from dpni.tabela import TabelaPaginada, normalizar_texto
+
+COLUNAS_ORDENACAO = [None, 'no_municipio', 'DS_COBERTURA', 'NU_MES', 'QT_DOSES']
+BUSCAS = ['', 'santa', 'SÃNTA helena', 'triplice', 'penta', 'inexistente']
+
+
+@pytest.fixture(scope='module')
+def dados_tabela(dados_teste):
+    return dados_teste[0].sample(frac=1, random_state=5).reset_index(drop=True)
+
+
+def ordem_referencia(data, coluna, decrescente):
+    """Ordenação estável das posições com sorted, nulos no fim nos dois sentidos"""
+    if coluna is None:
+        return list(range(len(data)))
+    valores = data[coluna].astype(object).tolist()
+    presentes = sorted((i for i, valor in enumerate(valores) if pd.notna(valor)),
+                       key=lambda i: valores[i], reverse=decrescente)
+    return presentes + [i for i, valor in enumerate(valores) if pd.isna(valor)]
+
+
+def contem_referencia(data, texto):
+    texto = normalizar_texto(texto)
+    if not texto:
+        return [True] * len(data)
+    return [any(pd.notna(valor) and texto in normalizar_texto(valor) for valor in linha)
+            for linha in data[['no_municipio', 'DS_COBERTURA']].astype(object).itertuples(index=False)]
+
+
+def test_normalizar_texto_ignora_acentos_e_caixa():
+    assert normalizar_texto('  Tríplice Viral - 1° Dose ') == 'triplice viral - 1° dose'
+    assert normalizar_texto('SÃO JOSÉ') == normalizar_texto('sao jose')
+
+
+@pytest.mark.parametrize('texto', BUSCAS)
+def test_permutacao_igual_a_ordenacao_e_busca_de_referencia(dados_tabela, texto):
+    tabela = TabelaPaginada(dados_tabela)
+    contem = contem_referencia(dados_tabela, texto)
+    assert tabela.total(texto) == sum(contem)
+    for coluna in COLUNAS_ORDENACAO:
+        for decrescente in (False, True):
+            esperado = [i for i in ordem_referencia(dados_tabela, coluna, decrescente) if contem[i]]
+            assert tabela.permutacao(coluna, decrescente, texto).tolist() == esperado, (coluna, decrescente)
+
+
+@pytest.mark.parametrize('tamanho', [1, 7, 50, 10_000])
+def test_paginas_cobrem_a_permutacao_sem_sobreposicao(dados_tabela, tamanho):
+    tabela = TabelaPaginada(dados_tabela)
+    for coluna, decrescente, texto in [('QT_DOSES', True, ''), ('no_municipio', False, 'santa'), (None, False, 'penta')]:
+        permutacao = tabela.permutacao(coluna, decrescente, texto)
+        total = tabela.total(texto)
+        paginas = -(-total // tamanho)
+        partes = [tabela.pagina(numero, tamanho, coluna, decrescente, texto) for numero in range(1, paginas + 1)]
+        assert all(len(parte) == tamanho for parte in partes[:-1])
+        # A última página pode ser parcial; além dela as páginas vêm vazias
+        assert len(partes[-1]) == total - (paginas - 1) * tamanho
+        assert tabela.pagina(paginas + 1, tamanho, coluna, decrescente, texto).empty
+        pd.testing.assert_frame_equal(pd.concat(partes), dados_tabela.take(permutacao))
+
+
+def test_colunas_de_busca_ausentes_e_texto_de_objetos():
+    data = pd.DataFrame({'no_municipio': ['Itapetininga', None, 'ITAÚ', 'itau'], 'QT_DOSES': [3, 1, 3, 2]})
+    tabela = TabelaPaginada(data)
+    assert tabela.colunas_busca == ['no_municipio']
+    assert tabela.permutacao(texto='itau').tolist() == [2, 3]
+    assert tabela.permutacao('QT_DOSES', True).tolist() == [0, 2, 3, 1]
+    assert tabela.permutacao('no_municipio').tolist() == [2, 0, 3, 1]
+    assert tabela.busca(' ') is None
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from dpni.vacinas import META_PADRAO, classificar_coberturas, cor_por_meta, meta_cobertura, metas_coberturas
+
+# Limites das faixas e vizinhanças imediatas, acima de 100% e sem valor
+PERCENTUAIS_BORDA = [-1, 0, 20, 20.0001, 39.999, 40, 40.5, 60, 60.0001, 80, 80.001,
+                     89.99, 90, 90.01, 94.99, 95, 95.0001, 120, np.nan]
+
+
+def faixa_referencia(percentual, meta):
+    """Cadeia de comparações escalar original do card (get_cor_por_meta)"""
+    if percentual <= 20:
+        return 'Muito Crítico', '#790E18'
+    elif percentual <= 40:
+        return 'Crítico', '#ff4444'
+    elif percentual <= 60:
+        return 'Baixo', '#ff9900'
+    elif percentual <= 80:
+        return 'Moderado', '#ffdd00'
+    elif percentual >= meta:
+        return 'Meta Ótima', '#000099'
+    else:
+        return 'Excelente', '#44dd44'
+
+
+@pytest.mark.parametrize('meta', [90.0, 95.0])
+def test_classificar_coberturas_igual_a_cadeia_escalar(meta):
+    faixas, cores = classificar_coberturas(PERCENTUAIS_BORDA, meta)
+    esperado = [faixa_referencia(percentual, meta) for percentual in PERCENTUAIS_BORDA]
+    assert list(zip(faixas, cores)) == esperado
+    assert [cor_por_meta(percentual, meta) for percentual in PERCENTUAIS_BORDA] == [cor for _, cor in esperado]
+
+
+def test_classificar_coberturas_com_meta_por_linha():
+    percentuais = np.repeat(PERCENTUAIS_BORDA, 2)
+    metas = np.tile([90.0, 95.0], len(PERCENTUAIS_BORDA))
+    faixas, cores = classificar_coberturas(percentuais, metas)
+    assert list(zip(faixas, cores)) == [faixa_referencia(p, m) for p, m in zip(percentuais, metas)]
+
+
+def test_metas_do_registro_e_padrao():
+    assert meta_cobertura('BCG') == meta_cobertura('Rotavírus') == 90.0
+    assert meta_cobertura('Penta (DTP/HepB/Hib)') == 95.0
+    assert meta_cobertura('Vacina fora do registro') == META_PADRAO
+    nomes = ['BCG', 'Vacina fora do registro', 'Rotavírus', 'Varicela']
+    np.testing.assert_array_equal(metas_coberturas(nomes), [meta_cobertura(nome) for nome in nomes])